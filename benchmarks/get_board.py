@@ -0,0 +1,46 @@
+"""
+get_board latency, rebuilding every board (how get_board used to work)
+against the per-thread registry
+
+    python -m benchmarks.get_board --number 2000
+"""
+from __future__ import annotations
+
+import timeit
+
+import typer
+
+from pypedal.pedal.modes import (
+    BOARDS,
+    EQProcessMode,
+    SlowedReverbProcessMode,
+    board_registry,
+    get_board,
+)
+
+app = typer.Typer()
+
+
+def build_all_boards(mode: EQProcessMode, type: SlowedReverbProcessMode):
+    boards = {
+        mode: {type: factory() for type, factory in factories.items()}
+        for mode, factories in BOARDS.items()
+    }
+    return boards[mode][type]
+
+
+@app.command()
+def main(number: int = 2000):
+    board_name = EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Mid
+    cases = {
+        "rebuild all (before)": lambda: build_all_boards(*board_name),
+        "registry.create": lambda: board_registry.create(*board_name),
+        "get_board (after)": lambda: get_board(*board_name),
+    }
+    for name, func in cases.items():
+        best = min(timeit.repeat(func, number=number, repeat=5)) / number
+        typer.echo(f"{name:<22} {best * 1e6:>10.2f} us/call")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,93 @@
+"""
+Compares the native SlowedReverb engine against the sox (pysndfx) path
+
+    python -m benchmarks.slowed_reverb --seconds 60 --repeat 3
+"""
+from __future__ import annotations
+
+import shutil
+import statistics
+import time
+from typing import Callable
+
+import numpy
+import typer
+
+from pypedal.pedal.modes import (
+    EQProcessMode,
+    SlowedReverbProcessMode,
+    get_board,
+    get_sox_board,
+)
+
+SAMPLERATE = 44100
+
+app = typer.Typer()
+
+
+def synthetic_audio(seconds: float, samplerate: int = SAMPLERATE):
+    """a few detuned tones with a beat and some noise, stereo float32"""
+    rng = numpy.random.default_rng(0)
+    t = numpy.arange(int(seconds * samplerate)) / samplerate
+    tones = sum(numpy.sin(2 * numpy.pi * f * t) for f in (110, 220.5, 331, 440.7))
+    beat = (numpy.sin(2 * numpy.pi * 2 * t) > 0.9) * rng.standard_normal(t.shape)
+    mono = 0.1 * tones + 0.2 * beat
+    audio = numpy.stack([mono, numpy.roll(mono, 441)])
+    return audio.astype(numpy.float32)
+
+
+def spectrum(audio, n_fft: int = 4096):
+    mono = audio.mean(axis=0)
+    frames = len(mono) // n_fft
+    windows = mono[: frames * n_fft].reshape(frames, n_fft) * numpy.hanning(n_fft)
+    return numpy.log1p(numpy.abs(numpy.fft.rfft(windows, axis=1)).mean(axis=0))
+
+
+def similarity(a, b):
+    """cosine similarity of the average log-magnitude spectra"""
+    sa, sb = spectrum(a), spectrum(b)
+    return float(sa @ sb / (numpy.linalg.norm(sa) * numpy.linalg.norm(sb)))
+
+
+def timeit(func: Callable, repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+@app.command()
+def main(seconds: float = 30, repeat: int = 3):
+    audio = synthetic_audio(seconds)
+    has_sox = shutil.which("sox") is not None
+    if not has_sox:
+        typer.echo("sox is not installed, only measuring the native engine")
+
+    typer.echo(
+        f"{'mode':<6} {'engine':<7} {'median s':>9} {'x realtime':>11} {'frames':>9}"
+    )
+    for mode in SlowedReverbProcessMode:
+        board = get_board(EQProcessMode.SlowedReverb, mode)
+        native_time, native = timeit(lambda: board(audio, SAMPLERATE), repeat)
+        rows = [("native", native_time, native)]
+        if has_sox:
+            sox_board = get_sox_board(mode)
+            sox_time, sox = timeit(lambda: sox_board(audio), repeat)
+            rows.append(("sox", sox_time, sox))
+
+        for engine, elapsed, out in rows:
+            typer.echo(
+                f"{mode.name:<6} {engine:<7} {elapsed:>9.3f} "
+                f"{seconds / elapsed:>11.1f} {out.shape[1]:>9}"
+            )
+        if has_sox:
+            typer.echo(
+                f"{mode.name:<6} speedup {rows[1][1] / rows[0][1]:.2f}x, "
+                f"spectral similarity {similarity(native, rows[1][2]):.4f}"
+            )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,317 @@
+"""
+Offline benchmarks of the hot paths on synthetic audio of a few lengths:
+decoding sources (`Equalizer.read_file`), every board (`Equalizer.run`),
+writing each format (`Equalizer.write_file`), `get_board` and the websocket
+STATUS broadcast. every case runs in a fresh process, its peak RSS is its own
+
+    python -m benchmarks.suite --seconds 10 --seconds 60 --repeat 5
+    python -m benchmarks.suite --only run/slowed_reverb --check
+    python -m benchmarks.suite --save
+
+results are compared against benchmarks/baselines.json (`--save` rewrites it),
+`--check` exits with 1 when a case regressed more than `--tolerance`
+"""
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import typer
+
+from benchmarks.slowed_reverb import SAMPLERATE, synthetic_audio
+
+BASELINES = pathlib.Path(__file__).with_name("baselines.json")
+READ_FORMATS = ("wav", "flac", "mp3")
+WRITE_FORMATS = ("wav", "flac", "ogg", "aiff", "mp3")
+CLIENTS = (1, 100)
+# websockets watching a render, the STATUS of every progress tick goes to all
+
+app = typer.Typer()
+
+
+@dataclasses.dataclass
+class Case:
+    kind: str
+    params: Dict[str, Any]
+    # arguments of the `kind` function, name is made of them
+
+    @property
+    def name(self):
+        return "/".join([self.kind, *map(str, self.params.values())])
+
+
+def cases(lengths: List[float]) -> List[Case]:
+    from pypedal.pedal.modes import BOARDS
+
+    found: List[Case] = []
+    for seconds in lengths:
+        length = f"{seconds:g}s"
+        for fmt in READ_FORMATS:
+            found.append(Case("read", {"format": fmt, "length": length}))
+        for mode, levels in BOARDS.items():
+            for level in levels:
+                params = {"mode": mode.value, "level": level.value, "length": length}
+                found.append(Case("run", params))
+        for fmt in WRITE_FORMATS:
+            found.append(Case("write", {"format": fmt, "length": length}))
+    found.append(Case("get_board", {}))
+    for clients in CLIENTS:
+        found.append(Case("status", {"clients": clients}))
+    return found
+
+
+def seconds_of(case: Case) -> float:
+    return float(case.params["length"].rstrip("s"))
+
+
+def read(case: Case, repeat: int, folder: pathlib.Path) -> List[float]:
+    from pedalboard.io import WriteableAudioFile
+
+    from pypedal.pedal.equalizer import Equalizer
+
+    fmt = case.params["format"]
+    with WriteableAudioFile(str(folder / f"source.{fmt}"), SAMPLERATE, 2) as f:
+        f.write(synthetic_audio(seconds_of(case)))
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        eq = Equalizer.read_file(file_name="source", extension=fmt, path=folder)
+        timings.append(time.perf_counter() - start)
+        eq.close()
+    return timings
+
+
+def run(case: Case, repeat: int, folder: pathlib.Path) -> List[float]:
+    from pypedal.pedal.equalizer import Equalizer
+    from pypedal.pedal.modes import EQProcessMode, get_mode
+
+    mode = EQProcessMode(case.params["mode"])
+    board_name = mode, get_mode(mode)(case.params["level"])
+    audio = synthetic_audio(seconds_of(case))
+    eq = Equalizer(audio=audio, samplerate=float(SAMPLERATE), frames=audio.shape[1])
+
+    async def main():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await eq.run(board_name=board_name, run_once=False)
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    return asyncio.run(main())
+
+
+def write(case: Case, repeat: int, folder: pathlib.Path) -> List[float]:
+    from pypedal.pedal.equalizer import Equalizer
+    from pypedal.pedal.modes import EQProcessMode, SlowedReverbProcessMode
+
+    board_name = EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Mid
+    audio = synthetic_audio(seconds_of(case))
+    eq = Equalizer(samplerate=float(SAMPLERATE), done={board_name: audio})
+    fmt = case.params["format"]
+
+    async def main():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await eq.write_file(
+                board_name=board_name, title="bench", extension=fmt, path=folder
+            )
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    return asyncio.run(main())
+
+
+def get_board(case: Case, repeat: int, folder: pathlib.Path) -> List[float]:
+    from pypedal.pedal.modes import BOARDS, get_board
+
+    board_names = [(mode, level) for mode, levels in BOARDS.items() for level in levels]
+    timings = []
+    for _ in range(repeat * 1000):
+        for board_name in board_names:
+            start = time.perf_counter()
+            get_board(*board_name)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+class FakeWebSocket:
+    """serializes like starlette's send_json, without a socket"""
+
+    async def send_json(self, data):
+        json.dumps(data, separators=(",", ":"))
+
+
+def status(case: Case, repeat: int, folder: pathlib.Path) -> List[float]:
+    from pypedal.pedal.modes import EQProcessMode, SlowedReverbProcessMode
+    from pypedal.server.managers import ConnectionManager, ProcessManager
+    from pypedal.server.models import EQStatus, STATUSSendPayload, SubProcessModel
+
+    board_name = EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Mid
+    clients = [FakeWebSocket() for _ in range(case.params["clients"])]
+    ConnectionManager.active_connections.extend(clients)  # type: ignore
+
+    async def main():
+        sub = SubProcessModel(ws=clients)  # type: ignore
+        payload = STATUSSendPayload(
+            url="noise000000",
+            board_name=board_name,
+            state="IN_PROGRESS",
+            status=EQStatus(stage="processing"),
+        )
+        timings = []
+        for i in range(repeat * 100):
+            assert payload.status
+            payload.status.percentage = i % 101
+            start = time.perf_counter()
+            await ProcessManager.send_status(sub, payload)
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    return asyncio.run(main())
+
+
+KINDS: Dict[str, Callable[[Case, int, pathlib.Path], List[float]]] = {
+    "read": read,
+    "run": run,
+    "write": write,
+    "get_board": get_board,
+    "status": status,
+}
+
+
+def peak_rss_mb():
+    """of this process or its largest child (a process pool), so far"""
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # kilobytes on linux, bytes on macos
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(timings: List[float], q: int):
+    if len(timings) == 1:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method="inclusive")[q - 1]
+
+
+def measure(case: Case, repeat: int) -> Dict[str, Any]:
+    """runs in its own process, see `main`"""
+    from pypedal.pedal.equalizer import options
+    from pypedal.pedal.executors import shutdown_executors
+
+    with tempfile.TemporaryDirectory() as folder:
+        options.__init__(folder)
+        # a fresh decode every time, not the cached audio
+        options.AUDIO_CACHE_BUDGET = 0
+        try:
+            timings = KINDS[case.kind](case, repeat, pathlib.Path(folder))
+        finally:
+            shutdown_executors()
+
+    median = statistics.median(timings)
+    result = {
+        "p50_ms": median * 1e3,
+        "p95_ms": percentile(timings, 95) * 1e3,
+        "p99_ms": percentile(timings, 99) * 1e3,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if "length" in case.params:
+        result["realtime"] = seconds_of(case) / median
+    return {key: float(f"{value:.4g}") for key, value in result.items()}
+
+
+def regressions(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float):
+    """metrics worse than baseline by more than tolerance (0.25 is 25%)"""
+    worse = []
+    for metric in ("p50_ms", "p95_ms", "peak_rss_mb"):
+        if result[metric] > baseline[metric] * (1 + tolerance):
+            worse.append(metric)
+    if "realtime" in baseline and result["realtime"] < baseline["realtime"] / (
+        1 + tolerance
+    ):
+        worse.append("realtime")
+    return worse
+
+
+def machine():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+@app.command()
+def main(
+    seconds: List[float] = typer.Option([10, 60], help="lengths of the audio"),
+    repeat: int = 3,
+    only: str = typer.Option("", help="cases whose names contain this"),
+    save: bool = typer.Option(False, help="write the results as the baselines"),
+    check: bool = typer.Option(False, help="exit with 1 on a regression"),
+    tolerance: float = 0.25,
+    output: pathlib.Path = typer.Option(None, help="json of the results"),
+):
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    known = baselines.get("results", {})
+    if known and baselines.get("machine") != machine():
+        typer.echo("baselines are from another machine, compare with care")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    regressed: Dict[str, List[str]] = {}
+    typer.echo(
+        f"{'case':<34} {'x realtime':>10} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'p99 ms':>9} {'rss MB':>8}"
+    )
+    context = multiprocessing.get_context("spawn")
+    for case in cases(seconds):
+        if only not in case.name:
+            continue
+        # a process per case, for the peak RSS and nothing cached from the others
+        with context.Pool(1) as pool:
+            result = results[case.name] = pool.apply(measure, (case, repeat))
+
+        realtime = f"{result['realtime']:.1f}" if "realtime" in result else "-"
+        line = (
+            f"{case.name:<34} {realtime:>10} {result['p50_ms']:>9.4g} "
+            f"{result['p95_ms']:>9.4g} {result['p99_ms']:>9.4g} "
+            f"{result['peak_rss_mb']:>8.1f}"
+        )
+        if case.name in known:
+            worse = regressions(result, known[case.name], tolerance)
+            if worse:
+                regressed[case.name] = worse
+                line += f"  slower than baseline: {', '.join(worse)}"
+        typer.echo(line)
+
+    data = {"machine": machine(), "repeat": repeat, "results": results}
+    if output:
+        output.write_text(json.dumps(data, indent=2) + "\n")
+    if save:
+        # cases that didn't run this time keep their baselines
+        data["results"] = {**known, **results}
+        BASELINES.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+        typer.echo(f"saved {len(results)} baselines to {BASELINES}")
+    if regressed:
+        typer.echo(f"{len(regressed)} cases regressed more than {tolerance:.0%}")
+        if check:
+            raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    app()
@@ -1,2 +1,23 @@
-from .pedal import *
-from .server import *
\ No newline at end of file
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .pedal import *
+    from .server import *
+
+
+def __getattr__(name: str):
+    """
+    everything of pypedal.pedal and the server's app, imported on first use.
+    `import pypedal.pedal.executors` doesn't pull in youtube_dl or fastapi
+    """
+    if name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name in ("pedal", "server", "jobs"):
+        return importlib.import_module(f".{name}", __name__)
+    if name == "app":
+        return importlib.import_module(".server", __name__).app
+    try:
+        return getattr(importlib.import_module(".pedal", __name__), name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
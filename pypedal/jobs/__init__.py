@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import pathlib
+
+from .base import Event, Job, JobStore, job_key, status_dict
+from .redis import RedisJobStore
+from .sqlite import SQLiteJobStore
+
+
+def open_store(url: str, folder: pathlib.Path) -> JobStore:
+    """
+    "sqlite" (jobs.sqlite3 in folder), "sqlite:///path/to/jobs.sqlite3"
+    or a "redis://" url, see `options.JOBS`
+    """
+    if url == "sqlite":
+        return SQLiteJobStore(folder / "jobs.sqlite3")
+    if url.startswith("sqlite://"):
+        return SQLiteJobStore(pathlib.Path(url[len("sqlite://") :]))
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisJobStore(url)
+    raise ValueError(f"Unknown job store {url}")
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import time
+from typing import Any, AsyncIterator, Dict, List, Sequence, Tuple
+
+from pypedal.pedal.executors import get_executor
+from pypedal.pedal.modes import EQProcessMode, get_mode
+
+Event = Tuple[str, Dict[str, Any]]
+# (job key, status), the status is a `STATUSSendPayload` as dict
+
+
+def job_key(url: str, board_name: Sequence[Any]) -> str:
+    """url is the youtube id, board_name the (mode, mode value) enums or strings"""
+    mode, value = (getattr(name, "value", name) for name in board_name)
+    return f"{url}/{mode}/{value}"
+
+
+@dataclasses.dataclass
+class Job:
+    url: str
+    board_name: Tuple[str, str]
+    # (EQProcessMode value, mode value), plain strings so it's json
+    tenant: str | None = None
+    state: str = "QUEUED"
+    # QUEUED, IN_PROGRESS (claimed by `worker`) or DONE
+    status: Dict[str, Any] | None = None
+    # last status published for it
+    worker: str | None = None
+    heartbeat: float = 0.0
+    cancelled: bool = False
+    created: float = dataclasses.field(default_factory=time.time)
+
+    def __post_init__(self):
+        self.board_name = tuple(  # type: ignore
+            getattr(name, "value", name) for name in self.board_name
+        )
+
+    @property
+    def key(self):
+        return job_key(self.url, self.board_name)
+
+    @property
+    def board(self):
+        """board_name as the enums again"""
+        mode = EQProcessMode(self.board_name[0])
+        return mode, get_mode(mode)(self.board_name[1])
+
+    @property
+    def failed(self):
+        return self.state == "DONE" and bool(
+            self.cancelled or (self.status or {}).get("failed")
+        )
+
+    def dict(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+def status_dict(job: Job, state: str, **fields: Any) -> Dict[str, Any]:
+    """a `STATUSSendPayload` of job as json, what the front-ends relay"""
+    status = {
+        "url": job.url,
+        "board_name": list(job.board_name),
+        "state": state,
+        "position": None,
+        "cancelled": False,
+        "failed": False,
+        "result": None,
+        "status": None,
+    }
+    status.update(fields)
+    return status
+
+
+class JobStore:
+    """
+    Jobs and their statuses shared by every node, the websocket servers
+    `submit` jobs and relay the `events`, render workers `claim` them. \n
+    A job is run once for all the clients that asked for it (same youtube id
+    and board), a claimed job that misses its heartbeats for `stale` seconds
+    (the worker died) is claimed again by someone else.
+    """
+
+    POLL_INTERVAL = 0.25
+    # seconds between looking for new events, if the store can't block for them
+
+    def submit(self, job: Job) -> Tuple[Job, bool]:
+        """
+        queues job unless it's queued, running or done already (failed jobs are
+        queued again), returns the job in the store and whether it was queued
+        """
+        raise NotImplementedError
+
+    def get(self, key: str) -> Job | None:
+        raise NotImplementedError
+
+    def queued(self) -> int:
+        raise NotImplementedError
+
+    def claim(self, worker: str, *, stale: float = 60) -> Job | None:
+        """the oldest queued (or abandoned) job, now IN_PROGRESS for worker"""
+        raise NotImplementedError
+
+    def heartbeat(self, key: str, worker: str) -> bool:
+        """
+        False if the worker should stop working on the job,
+        it's cancelled or someone else claimed it
+        """
+        raise NotImplementedError
+
+    def release(self, key: str, worker: str):
+        """puts a job of worker back in the queue, for someone else to run"""
+        raise NotImplementedError
+
+    def publish(self, key: str, status: Dict[str, Any]):
+        """saves the status of the job and sends it to every `events` reader"""
+        raise NotImplementedError
+
+    def cancel(self, key: str):
+        """
+        the worker of a running job stops at its next heartbeat and publishes
+        it cancelled, a queued job is published cancelled right away
+        """
+        raise NotImplementedError
+
+    def events(self, cursor: Any, timeout: float) -> Tuple[Any, List[Event]]:
+        """
+        events published after cursor (None for "from now on"), waits up to
+        timeout seconds for one. returns the cursor to continue from
+        """
+        raise NotImplementedError
+
+    def purge(self, older_than: float):
+        """forgets jobs that are done since `older_than` seconds and old events"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    async def subscribe(self, cursor: Any = None) -> AsyncIterator[Event]:
+        """every event published after cursor (from now on), read on the io executor"""
+        loop = asyncio.get_event_loop()
+        while True:
+            cursor, events = await loop.run_in_executor(
+                get_executor("io"), self.events, cursor, self.POLL_INTERVAL
+            )
+            for event in events:
+                yield event
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import time
+from typing import Any, Dict, List, Tuple
+
+from pypedal.jobs.base import Event, Job, JobStore, status_dict
+
+try:
+    import redis
+except ImportError:  # optional, pip install pyd-pedal[redis]
+    redis = None
+
+
+class RedisJobStore(JobStore):
+    """
+    `JobStore` on redis for nodes that don't share a disk. jobs are json in
+    a hash, the queue a sorted set by creation time, events a redis stream
+    (readers block on XREAD instead of polling)
+    """
+
+    EVENTS_MAXLEN = 100_000
+    # events kept in the stream, older ones are trimmed
+
+    # the oldest queued or stale job, claimed atomically
+    CLAIM = """
+    local key = redis.call("ZRANGE", KEYS[1], 0, 0)[1]
+    if not key then
+        key = redis.call("ZRANGEBYSCORE", KEYS[2], "-inf", ARGV[2], "LIMIT", 0, 1)[1]
+    end
+    if not key then return nil end
+    local job = cjson.decode(redis.call("HGET", KEYS[3], key))
+    job["state"], job["worker"], job["heartbeat"] = "IN_PROGRESS", ARGV[1], tonumber(ARGV[3])
+    local data = cjson.encode(job)
+    redis.call("HSET", KEYS[3], key, data)
+    redis.call("ZREM", KEYS[1], key)
+    redis.call("ZADD", KEYS[2], ARGV[3], key)
+    return data
+    """
+
+    def __init__(self, url: str, *, prefix: str = "pypedal"):
+        if redis is None:
+            raise Exception("redis job store needs the redis package")
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._jobs, self._queue = f"{prefix}:jobs", f"{prefix}:queue"
+        self._running, self._events = f"{prefix}:running", f"{prefix}:events"
+        self._claim = self._redis.register_script(self.CLAIM)
+
+    def close(self):
+        self._redis.close()
+
+    def _update(self, key: str, change) -> Job | None:
+        """change(job) -> bool under WATCH, saved if it returns True"""
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self._jobs)
+                    data = pipe.hget(self._jobs, key)
+                    job = data and Job(**json.loads(data))
+                    pipe.multi()
+                    if job is None or not change(job, pipe):
+                        pipe.reset()
+                        return job
+                    pipe.hset(self._jobs, key, json.dumps(job.dict()))
+                    pipe.execute()
+                    return job
+                except redis.WatchError:
+                    continue
+
+    def submit(self, job: Job) -> Tuple[Job, bool]:
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self._jobs)
+                    data = pipe.hget(self._jobs, job.key)
+                    known = data and Job(**json.loads(data))
+                    if known and not known.failed:
+                        pipe.reset()
+                        return known, False
+                    pipe.multi()
+                    pipe.hset(self._jobs, job.key, json.dumps(job.dict()))
+                    pipe.zadd(self._queue, {job.key: job.created})
+                    pipe.execute()
+                    return job, True
+                except redis.WatchError:
+                    continue
+
+    def get(self, key: str) -> Job | None:
+        data = self._redis.hget(self._jobs, key)
+        return data and Job(**json.loads(data))
+
+    def queued(self) -> int:
+        return self._redis.zcard(self._queue)
+
+    def claim(self, worker: str, *, stale: float = 60) -> Job | None:
+        now = time.time()
+        data = self._claim(
+            keys=[self._queue, self._running, self._jobs],
+            args=[worker, now - stale, now],
+        )
+        return data and Job(**json.loads(data))
+
+    def heartbeat(self, key: str, worker: str) -> bool:
+        owned = []
+
+        def beat(job: Job, pipe):
+            if job.worker != worker or job.cancelled:
+                return False
+            job.heartbeat = time.time()
+            pipe.zadd(self._running, {key: job.heartbeat})
+            owned.append(job)
+            return True
+
+        self._update(key, beat)
+        return bool(owned)
+
+    def release(self, key: str, worker: str):
+        def release(job: Job, pipe):
+            if job.state != "IN_PROGRESS" or job.worker != worker:
+                return False
+            job.state, job.worker, job.heartbeat = "QUEUED", None, 0.0
+            pipe.zrem(self._running, key)
+            pipe.zadd(self._queue, {key: job.created})
+            return True
+
+        self._update(key, release)
+
+    def publish(self, key: str, status: Dict[str, Any]):
+        def save(job: Job, pipe):
+            job.status = status
+            if status.get("state") == "DONE":
+                job.state = "DONE"
+                pipe.zrem(self._running, key)
+            return True
+
+        self._update(key, save)
+        self._redis.xadd(
+            self._events,
+            {"key": key, "status": json.dumps(status)},
+            maxlen=self.EVENTS_MAXLEN,
+            approximate=True,
+        )
+
+    def cancel(self, key: str):
+        def cancel(job: Job, pipe):
+            if job.state == "DONE":
+                return False
+            job.cancelled = True
+            if job.state == "QUEUED":
+                pipe.zrem(self._queue, key)
+            return True
+
+        job = self._update(key, cancel)
+        if job and job.cancelled and job.state == "QUEUED":
+            # nobody is working on it to tell
+            self.publish(key, status_dict(job, "DONE", cancelled=True))
+
+    def events(self, cursor: Any, timeout: float) -> Tuple[Any, List[Event]]:
+        if cursor is None:
+            # "$" would miss the events between two calls, start at the last one
+            last = self._redis.xrevrange(self._events, count=1)
+            cursor = last[0][0] if last else "0-0"
+        streams = self._redis.xread(
+            {self._events: cursor}, block=max(int(timeout * 1000), 1)
+        )
+        events: List[Event] = []
+        for _, messages in streams:
+            for cursor, fields in messages:
+                events.append((fields[b"key"].decode(), json.loads(fields[b"status"])))
+        return cursor, events
+
+    def purge(self, older_than: float):
+        expired = time.time() - older_than
+        for key, data in self._redis.hscan_iter(self._jobs):
+            job = Job(**json.loads(data))
+            # done jobs aren't touched again, the last heartbeat is old enough
+            if job.state == "DONE" and max(job.heartbeat, job.created) < expired:
+                self._redis.hdel(self._jobs, key)
+        self._redis.xtrim(
+            self._events, minid=f"{int(expired * 1000)}-0", approximate=True
+        )
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from pypedal.jobs.base import Event, Job, JobStore, status_dict
+
+
+class SQLiteJobStore(JobStore):
+    """
+    `JobStore` in a sqlite file, for the workers and nodes sharing a disk
+    (or a single box with `uvicorn --workers`). events are rows, readers poll
+    """
+
+    def __init__(self, file: pathlib.Path):
+        self.file = file
+        self._lock = threading.Lock()
+        file.parent.mkdir(parents=True, exist_ok=True)
+        # transactions are started by hand, claims must not race
+        self._db = sqlite3.connect(
+            file, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (key TEXT PRIMARY KEY, state TEXT,"
+            " created REAL, heartbeat REAL, updated REAL, data TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT, status TEXT, at REAL)"
+        )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _load(self, key: str) -> Job | None:
+        row = self._db.execute("SELECT data FROM jobs WHERE key = ?", (key,)).fetchone()
+        return row and Job(**json.loads(row[0]))
+
+    def _save(self, job: Job):
+        self._db.execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                job.key,
+                job.state,
+                job.created,
+                job.heartbeat,
+                time.time(),
+                json.dumps(job.dict()),
+            ),
+        )
+
+    def submit(self, job: Job) -> Tuple[Job, bool]:
+        with self._transaction():
+            known = self._load(job.key)
+            if known and not known.failed:
+                return known, False
+            self._save(job)
+            return job, True
+
+    def get(self, key: str) -> Job | None:
+        with self._lock:
+            return self._load(key)
+
+    def queued(self) -> int:
+        with self._lock:
+            (count,) = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'QUEUED'"
+            ).fetchone()
+            return count
+
+    def claim(self, worker: str, *, stale: float = 60) -> Job | None:
+        now = time.time()
+        with self._transaction():
+            row = self._db.execute(
+                "SELECT key FROM jobs WHERE state = 'QUEUED'"
+                " OR (state = 'IN_PROGRESS' AND heartbeat < ?)"
+                " ORDER BY created LIMIT 1",
+                (now - stale,),
+            ).fetchone()
+            if row is None:
+                return None
+            job = self._load(row[0])
+            assert job is not None
+            job.state, job.worker, job.heartbeat = "IN_PROGRESS", worker, now
+            self._save(job)
+            return job
+
+    def heartbeat(self, key: str, worker: str) -> bool:
+        with self._transaction():
+            job = self._load(key)
+            if job is None or job.worker != worker or job.cancelled:
+                return False
+            job.heartbeat = time.time()
+            self._save(job)
+            return True
+
+    def release(self, key: str, worker: str):
+        with self._transaction():
+            job = self._load(key)
+            if job and job.state == "IN_PROGRESS" and job.worker == worker:
+                job.state, job.worker, job.heartbeat = "QUEUED", None, 0.0
+                self._save(job)
+
+    def publish(self, key: str, status: Dict[str, Any]):
+        with self._transaction():
+            if job := self._load(key):
+                job.status = status
+                if status.get("state") == "DONE":
+                    job.state = "DONE"
+                self._save(job)
+            self._db.execute(
+                "INSERT INTO events (key, status, at) VALUES (?, ?, ?)",
+                (key, json.dumps(status), time.time()),
+            )
+
+    def cancel(self, key: str):
+        with self._transaction():
+            job = self._load(key)
+            if not job or job.state == "DONE":
+                return
+            job.cancelled = True
+            self._save(job)
+        if job.state == "QUEUED":
+            # nobody is working on it to tell
+            self.publish(key, status_dict(job, "DONE", cancelled=True))
+
+    def events(self, cursor: Any, timeout: float) -> Tuple[Any, List[Event]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if cursor is None:
+                    (cursor,) = self._db.execute(
+                        "SELECT COALESCE(MAX(seq), 0) FROM events"
+                    ).fetchone()
+                rows = self._db.execute(
+                    "SELECT seq, key, status FROM events WHERE seq > ? ORDER BY seq",
+                    (cursor,),
+                ).fetchall()
+            if rows:
+                return rows[-1][0], [(key, json.loads(s)) for _, key, s in rows]
+            if time.monotonic() >= deadline:
+                return cursor, []
+            time.sleep(min(0.05, timeout))
+
+    def purge(self, older_than: float):
+        expired = time.time() - older_than
+        with self._transaction():
+            self._db.execute(
+                "DELETE FROM jobs WHERE state = 'DONE' AND updated < ?", (expired,)
+            )
+            self._db.execute("DELETE FROM events WHERE at < ?", (expired,))
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, Set
+
+from pypedal import pedal
+from pypedal.jobs.base import Job, JobStore, status_dict
+from pypedal.pedal.equalizer import upload_local, youtube_download
+from pypedal.pedal.executors import get_executor
+
+log = logging.getLogger(__name__)
+
+
+class Worker:
+    """
+    Claims jobs from a `JobStore` and runs them (download, render, upload),
+    publishing their statuses. runs embedded in the server or on its own
+    with `pypedal worker`. \n
+    `prefetch` jobs more than it renders are claimed, their sources are
+    downloaded while the others render
+    """
+
+    HEARTBEAT_INTERVAL = 5.0
+    STALE = 30.0
+    # seconds without a heartbeat before another worker takes the job over
+    STATUS_INTERVAL = 0.25
+    # seconds between progress statuses of a job
+
+    def __init__(
+        self,
+        store: JobStore,
+        *,
+        name: str | None = None,
+        concurrency: int = 1,
+        prefetch: int = 1,
+    ):
+        self.store = store
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}-{id(self):x}"
+        self.concurrency = concurrency
+        self.prefetch = prefetch
+        self.running: Dict[asyncio.Task, Job] = {}
+        self.started: Set[asyncio.Task] = set()
+        # rendering or past it, drained instead of released
+        self.released: Set[asyncio.Task] = set()
+        # cancelled to go back to the queue
+        self.lost: Set[asyncio.Task] = set()
+        # someone else claimed them, nothing to publish
+        self.stopping = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self.done = 0
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(get_executor("io"), func, *args)
+
+    async def run(self):
+        """claims jobs while there's room for them, until `stop`"""
+        while not self.stopping.is_set():
+            job = None
+            if len(self.running) < self.concurrency + self.prefetch:
+                job = await self._call(self.claim)
+            if job is None:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        self.stopping.wait(), self.store.POLL_INTERVAL
+                    )
+                continue
+            task = asyncio.create_task(self.work(job))
+            self.running[task] = job
+            task.add_done_callback(self.forget)
+
+    def claim(self):
+        return self.store.claim(self.name, stale=self.STALE)
+
+    def forget(self, task: asyncio.Task):
+        self.running.pop(task, None)
+        for tasks in (self.started, self.released, self.lost):
+            tasks.discard(task)
+
+    def stop(self):
+        """no more jobs are claimed, see `drain`"""
+        self.stopping.set()
+
+    def release(self, task: asyncio.Task):
+        self.released.add(task)
+        task.cancel()
+
+    def abort(self):
+        """releases every job, even the ones rendering"""
+        self.stop()
+        for task in self.running:
+            self.release(task)
+
+    async def drain(self, timeout: float | None = None):
+        """
+        releases the jobs that didn't start rendering back to the queue and
+        waits for the others, for timeout seconds at most (then they're released)
+        """
+        self.stop()
+        for task in list(self.running):
+            if task not in self.started:
+                self.release(task)
+        if not self.running:
+            return
+        log.info(f"draining {len(self.running)} jobs")
+        _, pending = await asyncio.wait(list(self.running), timeout=timeout)
+        for task in pending:
+            self.release(task)
+        if pending:
+            await asyncio.wait(pending)
+
+    async def serve(self, *, drain_timeout: float | None = None):
+        """
+        `run` until SIGINT or SIGTERM, then `drain`.
+        a second signal releases the jobs that are still running
+        """
+        loop = asyncio.get_event_loop()
+        signals = (signal.SIGINT, signal.SIGTERM)
+
+        def on_signal():
+            if self.stopping.is_set():
+                log.info("releasing running jobs")
+                self.abort()
+            else:
+                log.info("stopping after the running jobs, again to release them")
+                self.stop()
+
+        for sig in signals:
+            loop.add_signal_handler(sig, on_signal)
+        try:
+            log.info(f"worker {self.name} is waiting for jobs")
+            await self.run()
+            await self.drain(drain_timeout)
+        finally:
+            for sig in signals:
+                loop.remove_signal_handler(sig)
+        log.info(f"worker {self.name} stopped, {self.done} jobs done")
+
+    def publisher(self, job: Job):
+        """publish(state, **fields) in order, on the io executor"""
+        lock = asyncio.Lock()
+
+        async def publish(state: str, **fields: Any):
+            async with lock:
+                await self._call(
+                    self.store.publish, job.key, status_dict(job, state, **fields)
+                )
+
+        return publish
+
+    async def heartbeat(self, job: Job, task: asyncio.Task):
+        """cancels task once the job is cancelled or taken over"""
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+            if not await self._call(self.store.heartbeat, job.key, self.name):
+                current = await self._call(self.store.get, job.key)
+                if current and current.worker != self.name:
+                    log.info(f"{job.key} is claimed by {current.worker}")
+                    self.lost.add(task)
+                else:
+                    log.info(f"{job.key} is cancelled")
+                task.cancel()
+                return
+
+    async def work(self, job: Job):
+        publish = self.publisher(job)
+        task = asyncio.current_task()
+        assert task is not None
+        beating = asyncio.create_task(self.heartbeat(job, task))
+        try:
+            if job.cancelled:
+                # abandoned by a worker after it was cancelled
+                return await publish("DONE", cancelled=True)
+            await publish("STARTED")
+            result = await self.process(job, publish)
+            await publish("DONE", result=result)
+            self.done += 1
+            log.info(f"{job.key} is done, {result}")
+        except asyncio.CancelledError:
+            if task in self.released:
+                # shown as waiting until someone else claims it
+                await asyncio.shield(publish("QUEUED"))
+                await asyncio.shield(self._call(self.store.release, job.key, self.name))
+            elif task not in self.lost:
+                await asyncio.shield(publish("DONE", cancelled=True))
+        except Exception as e:
+            log.exception(f"job {job.key} failed {e=}")
+            await publish("DONE", failed=True)
+        finally:
+            beating.cancel()
+
+    async def process(self, job: Job, publish) -> str:
+        board_name = job.board
+        await publish("IN_PROGRESS", status={"stage": "downloading"})
+        video = await youtube_download(job.url)
+        await publish("IN_PROGRESS", status={"stage": "downloading", "percentage": 100})
+
+        task = asyncio.current_task()
+        assert task is not None
+        if await pedal.Equalizer.find_render(video, board_name):
+            self.started.add(task)
+        else:
+            if self._slots.locked():
+                # prefetched, rendered once the others are
+                await publish("QUEUED", position=0)
+            async with self._slots:
+                self.started.add(task)
+                await publish("IN_PROGRESS", status={"stage": "processing"})
+                await self.render(video, board_name, publish)
+        await publish("IN_PROGRESS", status={"stage": "processing", "percentage": 100})
+
+        await publish("IN_PROGRESS", status={"stage": "uploading"})
+        return await upload_local(video, board_name=board_name)
+
+    async def render(self, video, board_name, publish):
+        last_sent = 0.0
+
+        def progress(done: int, total: int):
+            nonlocal last_sent
+            now = time.monotonic()
+            if now - last_sent < self.STATUS_INTERVAL:
+                return
+            last_sent = now
+            percentage = min(done * 100 // total, 100)
+            status = {"stage": "processing", "percentage": percentage}
+            asyncio.ensure_future(publish("IN_PROGRESS", status=status))
+
+        eq = await pedal.Equalizer.aload(video)
+        try:
+            await eq.run_many([board_name], video, progress=progress)
+        finally:
+            eq.close()
@@ -1,14 +1,12 @@
 import logging
 import logging.config
 import sys
-import colorama
-import colouredlogs
 import dotenv
 import os
-import yaml
-import uvicorn
+import asyncio
 
 from pypedal.pedal import options
+from pypedal.pedal.executors import shutdown_executors
 from pypedal.server import app
 from pypedal.server.models import ProductionConfig
 
@@ -19,12 +17,17 @@ except IndexError:
     pass
 
 dotenv.load_dotenv()
-colorama.init()
-colouredlogs.install()
 
 
 @app.on_event("startup")
 async def setup():
+    # only the server needs them, not every import of the app (workers, tests)
+    import colorama
+    import colouredlogs
+    import yaml
+
+    colorama.init()
+    colouredlogs.install()
     config = app.extra["config"] = ProductionConfig()
     uvicorn_log.info(f"started app with {config.PRODUCTION_ENV=}")
     options.__init__(os.getenv("TEMP_DIR", ""))
@@ -34,6 +37,25 @@ async def setup():
     os.makedirs("logs", exist_ok=True)
     logging.config.dictConfig(config)
 
+    if options.jobs and options.RENDER_WORKER:
+        from pypedal.jobs.worker import Worker
+
+        # a front-end with PYPEDAL_RENDER_WORKER=0 only queues and relays jobs
+        worker = app.extra["worker"] = Worker(
+            options.jobs, concurrency=options.PROCESS_WORKERS
+        )
+        asyncio.create_task(worker.run())
+
+
+@app.on_event("shutdown")
+async def teardown():
+    if worker := app.extra.get("worker"):
+        # back to the queue for the other workers, nothing to wait for
+        await worker.drain(timeout=0)
+    shutdown_executors(wait=False)
+
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("pypedal.main:app", host="0.0.0.0", port=int(os.getenv("PORT") or 8000))
@@ -1,20 +1,57 @@
-from .modes import *
-from .models import *
-from .equalizer import (
-    BoardType,
-    Options,
-    Equalizer,
-    YoutubeDLError,
-    upload_local,
-    upload_to_transferfilesh,
-    parse_youtube_id,
-    youtube_download,
-    options,
-    YoutubeIdRegex,
-    YoutubeUrlRegex,
-)
-
+import importlib
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from .equalizer import AudioType
+    from .modes import *
+    from .models import *
+    from .equalizer import (
+        AudioType,
+        BoardType,
+        Options,
+        Equalizer,
+        YoutubeDLError,
+        upload_local,
+        upload_to_transferfilesh,
+        parse_youtube_id,
+        youtube_download,
+        options,
+        YoutubeIdRegex,
+        YoutubeUrlRegex,
+    )
+
+EQUALIZER = {
+    "BoardType",
+    "Options",
+    "Equalizer",
+    "YoutubeDLError",
+    "upload_local",
+    "upload_to_transferfilesh",
+    "parse_youtube_id",
+    "youtube_download",
+    "options",
+    "YoutubeIdRegex",
+    "YoutubeUrlRegex",
+}
+
+
+def __getattr__(name: str):
+    """
+    the names of .modes, .models and the ones above of .equalizer, imported on
+    first use (PEP 562). equalizer needs numpy and pedalboard, a
+    process worker that only renders shouldn't wait for all of them
+    """
+    if name.startswith("__"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name in EQUALIZER:
+        value = getattr(importlib.import_module(".equalizer", __name__), name)
+    else:
+        # models was star-imported after modes, its names won
+        for module in (".models", ".modes"):
+            module = importlib.import_module(module, __name__)
+            if hasattr(module, name) and not name.startswith("_"):
+                value = getattr(module, name)
+                break
+        else:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import enum
+import json
+import logging
+import pathlib
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Set, TextIO, Tuple, Type
+
+from pypedal.pedal.equalizer import (
+    BoardType,
+    Equalizer,
+    options,
+    parse_youtube_id,
+    upload_local,
+    youtube_download,
+)
+from pypedal.pedal.modes import EQProcessMode, get_mode
+
+log = logging.getLogger(__name__)
+
+Key = Tuple[str, str, str]
+# (youtube id, mode value, level value) of a manifest entry
+
+
+def lookup(modes: Type[enum.Enum], value: str) -> Any:
+    """
+    member of modes by value ("07", "slowed_reverb") or name ("high"),
+    case insensitive and dashes are underscores
+    """
+    value = value.strip().lower().replace("-", "_")
+    for member in modes:
+        if value in (member.value.lower(), member.name.lower()):
+            return member
+    names = ", ".join(member.name.lower() for member in modes)
+    raise ValueError(f"unknown {modes.__name__} {value!r}, one of {names}")
+
+
+def parse_board(spec: str) -> BoardType:
+    """ "slowed_reverb:high", "slowed-reverb:07" or "resample:down" """
+    mode, _, level = spec.partition(":")
+    if not level:
+        raise ValueError(f"{spec!r} has no level, like slowed_reverb:high")
+    eq_mode = lookup(EQProcessMode, mode)
+    return eq_mode, lookup(get_mode(eq_mode), level)
+
+
+def parse_entries(
+    lines: Iterable[str], default: List[BoardType]
+) -> Iterator[Tuple[str, List[BoardType]]]:
+    """
+    a youtube link per line followed by its boards, the default ones if it has
+    none. blank lines and lines starting with # are skipped
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        link, *specs = line.split()
+        if not parse_youtube_id(link):
+            raise ValueError(f"line {number}: {link!r} isn't a youtube link")
+        try:
+            yield link, [parse_board(spec) for spec in specs] or default
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}") from None
+
+
+def key(video_id: str, board_name: BoardType) -> Key:
+    mode, level = board_name
+    return video_id, mode.value, level.value
+
+
+def completed(manifest: pathlib.Path) -> Set[Key]:
+    """entries done in earlier runs with the manifest, they're skipped"""
+    done: Set[Key] = set()
+    if not manifest.exists():
+        return done
+    with open(manifest) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # cut off by a crash
+            if record.get("state") == "done":
+                done.add((record["id"], record["mode"], record["level"]))
+    return done
+
+
+def open_manifest(manifest: pathlib.Path) -> TextIO:
+    """for appending, after the line a crash cut off"""
+    f = open(manifest, "a+")
+    if f.tell():
+        f.seek(f.tell() - 1)
+        if f.read(1) != "\n":
+            f.write("\n")
+    return f
+
+
+@dataclasses.dataclass
+class Batch:
+    """
+    Downloads `downloads` videos and renders `workers` at once (every board of
+    a video from one decode), a json line per board goes to manifest. \n
+    at most `downloads + workers` videos are on the way, sources don't pile up
+    while the renders catch up
+    """
+
+    manifest: TextIO
+    downloads: int = 4
+    workers: int = 1
+    upload: bool = False
+    done: Set[Key] = dataclasses.field(default_factory=set)
+    counts: Dict[str, int] = dataclasses.field(
+        default_factory=lambda: {"done": 0, "failed": 0, "skipped": 0}
+    )
+
+    def __post_init__(self):
+        self._downloading = asyncio.Semaphore(self.downloads)
+        self._rendering = asyncio.Semaphore(self.workers)
+        self._videos = asyncio.Semaphore(self.downloads + self.workers)
+
+    def write(self, record: Dict[str, Any]):
+        self.manifest.write(json.dumps(record) + "\n")
+        self.manifest.flush()
+        self.counts[record["state"]] += 1
+
+    def pending(
+        self, entries: Iterable[Tuple[str, List[BoardType]]]
+    ) -> Dict[str, Tuple[str, List[BoardType]]]:
+        """{id: (link, boards)}, a video once and without the boards done"""
+        videos: Dict[str, Tuple[str, List[BoardType]]] = {}
+        for link, board_names in entries:
+            video_id = parse_youtube_id(link)
+            assert video_id
+            _, boards = videos.setdefault(video_id, (link, []))
+            for board_name in board_names:
+                if key(video_id, board_name) in self.done:
+                    self.counts["skipped"] += 1
+                elif board_name not in boards:
+                    boards.append(board_name)
+        return {id: video for id, video in videos.items() if video[1]}
+
+    async def run(self, entries: Iterable[Tuple[str, List[BoardType]]]):
+        videos = self.pending(entries)
+        log.info(f"{len(videos)} videos to render, {self.counts['skipped']} skipped")
+        finished = 0
+
+        async def render(video_id: str, link: str, board_names: List[BoardType]):
+            nonlocal finished
+            async with self._videos:
+                await self.render(video_id, link, board_names)
+            finished += 1
+            log.info(f"[{finished}/{len(videos)}] {video_id} is finished")
+
+        await asyncio.gather(
+            *[render(id, link, boards) for id, (link, boards) in videos.items()]
+        )
+        return self.counts
+
+    async def render(self, video_id: str, link: str, board_names: List[BoardType]):
+        started = time.monotonic()
+
+        def record(board_name: BoardType, **fields):
+            _, mode, level = key(video_id, board_name)
+            seconds = round(time.monotonic() - started, 3)
+            self.write(
+                {
+                    "id": video_id,
+                    "link": link,
+                    "mode": mode,
+                    "level": level,
+                    "seconds": seconds,
+                    **fields,
+                }
+            )
+
+        try:
+            async with self._downloading:
+                video = await youtube_download(link)
+            pending = [
+                board_name
+                for board_name in board_names
+                if not await Equalizer.find_render(video, board_name)
+            ]
+            if pending:
+                async with self._rendering:
+                    eq = await Equalizer.aload(video)
+                    try:
+                        await eq.run_many(pending, video)
+                    finally:
+                        eq.close()
+        except Exception as e:
+            log.exception(f"{video_id} failed {e=}")
+            for board_name in board_names:
+                record(board_name, state="failed", error=repr(e))
+            return
+
+        for board_name in board_names:
+            file = (
+                options.PROCESSED_FOLDER
+                / f"{video.safe_title}-{board_name[1]}.{video.ext}"
+            )
+            try:
+                result = str(file)
+                if self.upload:
+                    result = await upload_local(video, board_name=board_name)
+            except Exception as e:
+                log.exception(f"uploading {file} failed {e=}")
+                record(board_name, state="failed", error=repr(e))
+            else:
+                record(board_name, state="done", title=video.title, result=result)
@@ -0,0 +1,504 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Tuple
+
+from pypedal.pedal.models import YoutubeVideo
+from pypedal.pedal.modes import EQProcessMode, board_digest
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+    import msvcrt
+
+log = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """
+    Processed files in `folder`, keyed by (video id, source file hash, board
+    definition hash) so a changed board or a re-downloaded source is a miss. \n
+    The index is a sqlite file in the folder with the size and last use of
+    every file, shared by every process rendering there (servers, workers, cli
+    runs) and updated in transactions, so none of them overwrites the others'
+    entries. least recently used files are deleted once the folder grows over
+    `budget` bytes. \n
+    lookups only read the index, the last uses of hits are written in batches
+    (see `flush`) and files aren't checked, a render deleted by hand is
+    forgotten by whoever fails to open it (`forget`)
+    """
+
+    INDEX = "index.sqlite3"
+    FLUSH_SIZE = 64
+    FLUSH_INTERVAL = 5.0
+    # hits kept in memory before their last uses are written, and seconds
+
+    def __init__(self, folder: pathlib.Path, budget: int):
+        self.folder = folder
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.RLock()
+        self._db: sqlite3.Connection | None = None
+        self._used = 0.0
+        # last use given out, hits in the same clock tick keep their order
+        self._touched: Dict[str, float] = {}
+        # key -> last use of the hits since the last flush
+        self._flushed = time.monotonic()
+
+    def _connect(self):
+        if self._db is None:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            # transactions are started by hand, evictions must not race
+            db = sqlite3.connect(
+                self.folder / self.INDEX,
+                check_same_thread=False,
+                timeout=30,
+                isolation_level=None,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY,"
+                " file TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL)"
+            )
+            self._db = db
+        return self._db
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _now(self):
+        self._used = max(time.time(), self._used + 1e-6)
+        return self._used
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return (
+                self._connect()
+                .execute("SELECT COALESCE(SUM(size), 0) FROM entries")
+                .fetchone()[0]
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def source_digest(self, source: pathlib.Path) -> str:
+        """hash of the source file contents, only re-hashed when it changes"""
+        stat = source.stat()
+        with self._lock:
+            known = (
+                self._connect()
+                .execute(
+                    "SELECT digest FROM sources WHERE path = ? AND size = ?"
+                    " AND mtime_ns = ?",
+                    (str(source), stat.st_size, stat.st_mtime_ns),
+                )
+                .fetchone()
+            )
+        if known:
+            return known[0]
+
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                (str(source), stat.st_size, stat.st_mtime_ns, digest.hexdigest()),
+            )
+        return digest.hexdigest()
+
+    def key(
+        self,
+        video_id: str,
+        source: pathlib.Path,
+        board_name: Tuple[EQProcessMode, Any],
+    ) -> str:
+        parts = (video_id, self.source_digest(source), board_digest(*board_name))
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> pathlib.Path | None:
+        """the rendered file or None, a read that doesn't block the others"""
+        with self._lock:
+            row = (
+                self._connect()
+                .execute("SELECT file FROM entries WHERE key = ?", (key,))
+                .fetchone()
+            )
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[key] = self._now()
+            if (
+                len(self._touched) >= self.FLUSH_SIZE
+                or time.monotonic() - self._flushed > self.FLUSH_INTERVAL
+            ):
+                self.flush()
+        return self.folder / row[0]
+
+    def flush(self):
+        """writes the last uses of the hits since the last flush"""
+        with self._lock:
+            self._flushed = time.monotonic()
+            if not self._touched:
+                return
+            touched, self._touched = self._touched, {}
+            with self._transaction() as db:
+                self._write_uses(db, touched)
+
+    @staticmethod
+    def _write_uses(db: sqlite3.Connection, touched: Dict[str, float]):
+        db.executemany(
+            "UPDATE entries SET used = MAX(used, ?) WHERE key = ?",
+            [(used, key) for key, used in touched.items()],
+        )
+
+    def forget(self, file: pathlib.Path):
+        """drops the entries of a rendered file that turned out to be gone"""
+        log.info(f"{file.name} is gone, dropping it from render cache")
+        with self._transaction() as db:
+            db.execute("DELETE FROM entries WHERE file = ?", (file.name,))
+
+    def put(self, key: str, file: pathlib.Path):
+        """
+        adds a rendered file (inside `folder`) and evicts old ones if needed
+        """
+        size = file.stat().st_size
+        with self._transaction() as db:
+            # recent hits first, they decide what is evicted
+            touched, self._touched = self._touched, {}
+            self._write_uses(db, touched)
+            # same file rendered for another source or board, overwritten
+            db.execute(
+                "DELETE FROM entries WHERE file = ? AND key != ?", (file.name, key)
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, file.name, size, self._now()),
+            )
+            self._evict(db)
+
+    def discard(self, key: str):
+        with self._transaction() as db:
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def evict(self):
+        self.flush()
+        with self._transaction() as db:
+            self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        oldest = db.execute(
+            "SELECT key, file, size FROM entries ORDER BY used"
+        ).fetchall()
+        # the newest one stays even if it's over budget alone
+        for key, file, size in oldest[:-1]:
+            if total <= self.budget:
+                break
+            total -= size
+            log.info(f"evicting {file} from render cache")
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.folder / file)
+
+
+@dataclasses.dataclass
+class _DecodedAudio:
+    audio: Any = None
+    samplerate: float = 0
+    refs: int = 0
+    loaded: threading.Event = dataclasses.field(default_factory=threading.Event)
+    error: BaseException | None = None
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self.audio is None else self.audio.nbytes
+
+
+class AudioCache:
+    """
+    Decoded source audio shared by every `Equalizer` of the same track,
+    so rendering 3 boards of a video decodes it once and keeps one copy. \n
+    `acquire` hands out read-only views and counts references, unused tracks
+    are dropped (least recently released first) once over `budget` bytes.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries: collections.OrderedDict[Hashable, _DecodedAudio]
+        self._entries = collections.OrderedDict()
+
+    @property
+    def size(self):
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def refs(self, key: Hashable) -> int:
+        entry = self._entries.get(key)
+        return entry.refs if entry else 0
+
+    def acquire(
+        self, key: Hashable, load: Callable[[], Tuple[Any, float]]
+    ) -> Tuple[Any, float]:
+        """
+        returns a read-only view of the audio and the samplerate,
+        `load` decodes it if it's not cached (once, even with concurrent calls).
+        `release` the key when done with it
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            loading = entry is None
+            if loading:
+                self.misses += 1
+                entry = self._entries[key] = _DecodedAudio()
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            entry.refs += 1
+
+        if loading:
+            try:
+                entry.audio, entry.samplerate = load()
+                entry.audio.setflags(write=False)
+            except BaseException as e:
+                entry.error = e
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                raise
+            finally:
+                entry.loaded.set()
+            self.evict()
+        else:
+            entry.loaded.wait()
+            if entry.error is not None:
+                with self._lock:
+                    entry.refs -= 1
+                raise entry.error
+
+        view = entry.audio.view()
+        view.setflags(write=False)
+        return view, entry.samplerate
+
+    def release(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refs <= 0:
+                return
+            entry.refs -= 1
+            if not entry.refs:
+                self._entries.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        """drops unused audio until the cache fits in budget"""
+        with self._lock:
+            total = sum(entry.nbytes for entry in self._entries.values())
+            for key, entry in list(self._entries.items()):
+                if total <= self.budget:
+                    break
+                if entry.refs or not entry.loaded.is_set():
+                    continue
+                log.info(f"dropping decoded {key} from audio cache")
+                total -= entry.nbytes
+                del self._entries[key]
+
+
+class SourceCache:
+    """
+    Downloaded sources in `folder` by video id, shared by every process
+    (uvicorn workers, cli runs) using the same folder. \n
+    Whoever downloads a video holds its `lock`, the others wait for it
+    instead of downloading it again. The metadata is written last (atomically)
+    and marks the source as complete, a hit needs no `extract_info` at all.
+    """
+
+    FOLDER = ".sources"
+
+    def __init__(self, folder: pathlib.Path):
+        self.folder = folder
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str, suffix: str):
+        return self.folder / self.FOLDER / f"{key}{suffix}"
+
+    def get(self, key: str) -> YoutubeVideo | None:
+        try:
+            with open(self._path(key, ".json"), "rt") as f:
+                meta = json.load(f)
+            video = YoutubeVideo.parse_obj(meta["video"])
+        except FileNotFoundError:
+            video = None
+        except (ValueError, KeyError):
+            log.warning(f"ignoring broken source metadata of {key}")
+            video = None
+
+        if video is None or not (self.folder / meta["file"]).exists():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return video
+
+    def put(self, key: str, video: YoutubeVideo, file: pathlib.Path):
+        """`file` (inside `folder`) is completely downloaded"""
+        meta = {"file": file.name, "video": json.loads(video.json())}
+        path = self._path(key, ".json")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+        with open(tmp, "wt") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def discard(self, key: str):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(key, ".json"))
+
+    @contextlib.contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """
+        blocks until no other thread or process holds the lock of key
+        """
+        path = self._path(key, ".lock")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue  # gives up after 10 seconds, keep waiting
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class MetadataStore:
+    """
+    `YoutubeVideo` metadata by video id in a sqlite file, survives restarts
+    and is shared by every process using it. entries older than `ttl` seconds
+    are misses (view counts and such go stale) and purged on open. \n
+    The stored metadata was validated when it was put, `get` builds the
+    models without validating them again.
+    """
+
+    BATCH = 500
+    # ids per query of `get_many`, sqlite limits the number of parameters
+
+    def __init__(self, file: pathlib.Path, ttl: float):
+        self.file = file
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    def _connect(self):
+        if self._db is None:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.file, check_same_thread=False, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS videos"
+                " (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            db.execute("DELETE FROM videos WHERE updated < ?", (self._expired(),))
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _expired(self):
+        return time.time() - self.ttl
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get(self, video_id: str) -> YoutubeVideo | None:
+        return self.get_many([video_id]).get(video_id)
+
+    def get_many(self, video_ids: Iterable[str]) -> Dict[str, YoutubeVideo]:
+        """the known ones of video_ids, by id"""
+        video_ids = list(dict.fromkeys(video_ids))
+        rows = []
+        with self._lock:
+            db = self._connect()
+            for i in range(0, len(video_ids), self.BATCH):
+                batch = video_ids[i : i + self.BATCH]
+                rows += db.execute(
+                    "SELECT id, data FROM videos WHERE updated >= ?"
+                    f" AND id IN ({', '.join('?' * len(batch))})",
+                    (self._expired(), *batch),
+                ).fetchall()
+
+        videos = {id: YoutubeVideo.construct(**json.loads(data)) for id, data in rows}
+        self.hits += len(videos)
+        self.misses += len(video_ids) - len(videos)
+        return videos
+
+    def put(self, video: YoutubeVideo):
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?)",
+                (video.id, video.json(), time.time()),
+            )
+            db.commit()
@@ -0,0 +1,253 @@
+"""
+the `pypedal` command. only typer and the modes are imported here, the
+equalizer (numpy, pedalboard...) is imported by the command that runs,
+`pypedal --help` doesn't wait for it
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import pathlib
+from typing import List, Optional
+
+import typer
+
+from pypedal.pedal.modes import (
+    EQProcessMode,
+    ResampleProcessMode,
+    SlowedReverbProcessMode,
+)
+
+log = logging.getLogger(__name__)
+
+app = typer.Typer()
+
+
+@app.command()
+def resample(
+    youtube_link: Optional[str] = typer.Argument(
+        None, help="youtube link, optional if you have already downloaded"
+    ),
+    video_id: Optional[str] = typer.Option(
+        None, help="local video id if youtube_link is None (video downloaded before)"
+    ),
+    title: Optional[str] = None,
+    mode_level: ResampleProcessMode = ResampleProcessMode.Down,
+    run_once: bool = True,
+    upload: bool = False,
+):
+    import colouredlogs
+
+    from pypedal.pedal.equalizer import Equalizer, upload_local, youtube_download
+    from pypedal.pedal.models import PartialYoutubeVideo
+
+    colouredlogs.install(logging.DEBUG, reconfigure=False)
+
+    loop = asyncio.get_event_loop()
+    UPLOAD_FILE = upload
+    YOUTUBE_LINK = youtube_link or ""
+    ID, TITLE = (
+        video_id or "bCxtVoZJV2I",
+        title or "Jakuzi - 'Sana Göre Bir Şey Yok' (Official Audio)",
+    )
+
+    if not YOUTUBE_LINK:
+        if not ID:
+            raise RuntimeError("no youtube link or video id")
+
+    if YOUTUBE_LINK:
+        video = loop.run_until_complete(youtube_download(YOUTUBE_LINK))
+    else:
+        video = PartialYoutubeVideo(id=ID, title=TITLE)
+
+    board_name = EQProcessMode.Resample, mode_level
+
+    if run_once and loop.run_until_complete(Equalizer.find_render(video, board_name)):
+        log.info(f"{video.id=} {board_name=} is rendered before, skipping")
+    else:
+        eq = Equalizer.load(video)
+        loop.run_until_complete(eq.render(video, board_name, run_once=run_once))
+    if UPLOAD_FILE:
+        loop.run_until_complete(
+            upload_local(video, board_name=board_name, copy_to_clipboard=True)
+        )
+
+
+@app.command()
+def slowed_reverb(
+    youtube_link: Optional[str] = typer.Argument(
+        None, help="youtube link, optional if you have already downloaded"
+    ),
+    video_id: Optional[str] = typer.Option(
+        None, help="local video id if youtube_link is None (video downloaded before)"
+    ),
+    title: Optional[str] = None,
+    mode_level: SlowedReverbProcessMode = SlowedReverbProcessMode.Mid,
+    use_all_levels: bool = False,
+    run_once: bool = True,
+    upload: bool = False,
+):
+    import colouredlogs
+
+    from pypedal.pedal.equalizer import Equalizer, upload_local, youtube_download
+    from pypedal.pedal.models import PartialYoutubeVideo
+
+    colouredlogs.install(logging.DEBUG, reconfigure=False)
+
+    loop = asyncio.get_event_loop()
+    UPLOAD_FILE = upload
+    YOUTUBE_LINK = youtube_link or ""
+    ID, TITLE = (
+        video_id or "bCxtVoZJV2I",
+        title or "Jakuzi - 'Sana Göre Bir Şey Yok' (Official Audio)",
+    )
+
+    if not YOUTUBE_LINK:
+        if not ID:
+            raise RuntimeError("no youtube link or video id")
+
+    if YOUTUBE_LINK:
+        video = loop.run_until_complete(youtube_download(YOUTUBE_LINK))
+    else:
+        video = PartialYoutubeVideo(id=ID, title=TITLE)
+
+    if use_all_levels:
+        eq_range = {
+            0: (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Low),
+            1: (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Mid),
+            2: (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.High),
+        }
+    else:
+        eq_range = {
+            0: (EQProcessMode.SlowedReverb, mode_level),
+        }
+
+    pending = []
+    for board_name in eq_range.values():
+        if run_once and loop.run_until_complete(
+            Equalizer.find_render(video, board_name)
+        ):
+            log.info(f"{video.id=} {board_name=} is rendered before, skipping")
+        else:
+            pending.append(board_name)
+
+    if pending:
+        # decoded once, all levels are rendered together
+        eq = Equalizer.load(video)
+        loop.run_until_complete(eq.run_many(pending, video, run_once=run_once))
+
+    for idx, board_name in eq_range.items():
+        if UPLOAD_FILE:
+            loop.run_until_complete(
+                upload_local(video, board_name=board_name, copy_to_clipboard=True)
+            )
+
+
+@app.command()
+def batch(
+    links: str = typer.Argument(
+        "-", help="file of youtube links, each with its modes, - for stdin"
+    ),
+    manifest: pathlib.Path = typer.Option(
+        pathlib.Path("pypedal-batch.jsonl"),
+        help="results as json lines, the entries done in it are skipped",
+    ),
+    mode: List[str] = typer.Option(
+        ["slowed_reverb:mid"], help="modes of the links without any, repeatable"
+    ),
+    downloads: int = typer.Option(4, help="videos downloaded at once"),
+    workers: Optional[int] = typer.Option(
+        None, help="videos rendered at once, PYPEDAL_PROCESS_WORKERS by default"
+    ),
+    upload: bool = typer.Option(False, help="upload to PYPEDAL_STORAGE"),
+):
+    """
+    renders many links in one go, a line is a link and its modes:
+    "https://youtu.be/dQw4w9WgXcQ slowed_reverb:high resample:down"
+    """
+    import sys
+
+    import colouredlogs
+
+    from pypedal.pedal.batch import (
+        Batch,
+        completed,
+        open_manifest,
+        parse_board,
+        parse_entries,
+    )
+    from pypedal.pedal.equalizer import options
+    from pypedal.pedal.executors import shutdown_executors
+
+    colouredlogs.install(logging.INFO, reconfigure=False)
+
+    try:
+        default = [parse_board(spec) for spec in mode]
+        if links == "-":
+            entries = list(parse_entries(sys.stdin, default))
+        else:
+            with open(links) as f:
+                entries = list(parse_entries(f, default))
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+
+    async def run():
+        with open_manifest(manifest) as f:
+            batch = Batch(
+                f,
+                downloads=downloads,
+                workers=workers or options.PROCESS_WORKERS,
+                upload=upload,
+                done=completed(manifest),
+            )
+            return await batch.run(entries)
+
+    try:
+        counts = asyncio.run(run())
+    finally:
+        shutdown_executors()
+    log.info(f"{counts=}, results in {manifest}")
+    if counts["failed"]:
+        raise typer.Exit(1)
+
+
+@app.command()
+def worker(
+    jobs: Optional[str] = typer.Option(
+        None, help="job store to take jobs from, PYPEDAL_JOBS by default"
+    ),
+    concurrency: int = typer.Option(1, help="jobs rendered at once"),
+    prefetch: int = typer.Option(1, help="jobs downloaded while the others render"),
+    drain_timeout: Optional[float] = typer.Option(
+        None, help="seconds to wait for running jobs on shutdown, forever by default"
+    ),
+    name: Optional[str] = typer.Option(None, help="host-pid by default"),
+):
+    """renders jobs of the servers (see `pypedal.jobs`) until SIGINT or SIGTERM"""
+    import colouredlogs
+
+    from pypedal.jobs.worker import Worker
+    from pypedal.pedal.equalizer import options
+    from pypedal.pedal.executors import shutdown_executors
+
+    colouredlogs.install(logging.INFO, reconfigure=False)
+
+    options.JOBS = jobs or options.JOBS
+    if not options.jobs:
+        raise typer.BadParameter("no job store, set PYPEDAL_JOBS or --jobs")
+
+    async def serve():
+        worker = Worker(
+            options.jobs, name=name, concurrency=concurrency, prefetch=prefetch
+        )
+        await worker.serve(drain_timeout=drain_timeout)
+
+    try:
+        asyncio.run(serve())
+    finally:
+        options.jobs.close()
+        shutdown_executors()
+
+
+if __name__ == "__main__":
+    app()
@@ -1,40 +1,74 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import functools
+import itertools
 import logging
 import os
 import pathlib
 import re
+import shutil
+import threading
 import time
 import traceback
-import typer
+import weakref
 from typing import (
     TYPE_CHECKING,
+    Callable,
     Dict,
     Any,
-    Optional,
+    Iterable,
+    Iterator,
+    List,
     Tuple,
 )
 
-import youtube_dl
-import requests
+import numpy
 
-from pysndfx import AudioEffectsChain
 
-from pedalboard.io import ReadableAudioFile, WriteableAudioFile
+from pedalboard import Pedalboard, PitchShift  # type: ignore
+from pedalboard.io import (
+    ReadableAudioFile,
+    WriteableAudioFile,
+    get_supported_read_formats,
+)
 
 from pypedal import __file__ as pypedal_path
+from pypedal.pedal.cache import (
+    AudioCache,
+    MetadataStore,
+    RenderCache,
+    SourceCache,
+)
+from pypedal.pedal.executors import (
+    ProgressCallback,
+    SharedArray,
+    counted,
+    get_executor,
+    run_dsp,
+    shared,
+    shares_arrays,
+)
 from pypedal.pedal.modes import (
     EQProcessMode,
-    ResampleProcessMode,
     SlowedReverbProcessMode,
     EQTYPES,
     get_board,
+    is_sox_board,
 )
 from pypedal.pedal.models import PartialYoutubeVideo, YoutubeVideo
+from pypedal.pedal.plugins import SlowedReverb
+from pypedal.pedal.storage import LocalStorage, S3Storage, Storage, TransferStorage
+from pypedal.pedal.upload import Uploader
 
 if TYPE_CHECKING:
+    import youtube_dl
     from numpy import ndarray, dtype, float32
+    from pysndfx import AudioEffectsChain
+
+    from pypedal.jobs import JobStore
+    from pypedal.server.scheduler import Scheduler
 
     AudioType = ndarray[Any, dtype[float32]]
 
@@ -44,6 +78,10 @@ else:
     log = logging.getLogger(__name__)
 
 
+_options_lock = threading.Lock()
+# the caches are created on first use, which can be from any io thread
+
+
 class Options:
     def __init__(self, f: str | pathlib.Path = "") -> None:
         if not f:
@@ -56,6 +94,167 @@ class Options:
         self.PROCESSED_FOLDER = pathlib.Path(f) / "processed"
         log.info(f"Using {self.FOLDER!r} as temp path")
 
+        self.BLOCK_SIZE = int(os.getenv("PYPEDAL_BLOCK_SIZE") or 2**16)
+        # frames read and processed at once in streaming mode
+        self.STREAM_THRESHOLD = float(os.getenv("PYPEDAL_STREAM_THRESHOLD") or 300)
+        # tracks longer than this (in seconds) are streamed instead of read into memory
+
+        self.EXECUTOR = os.getenv("PYPEDAL_EXECUTOR") or "thread"
+        # "thread" or "process", where the boards run. see `executors.get_executor`
+        self.WORKERS = int(os.getenv("PYPEDAL_WORKERS") or os.cpu_count() or 1)
+        self.IO_WORKERS = int(os.getenv("PYPEDAL_IO_WORKERS") or 16)
+
+        self.DOWNLOAD_WORKERS = int(os.getenv("PYPEDAL_DOWNLOAD_WORKERS") or 4)
+        self.PROCESS_WORKERS = int(os.getenv("PYPEDAL_PROCESS_WORKERS") or self.WORKERS)
+        self.UPLOAD_WORKERS = int(os.getenv("PYPEDAL_UPLOAD_WORKERS") or 4)
+        # jobs of every stage the server runs at once, see `server.scheduler`
+        self.MAX_QUEUED = int(os.getenv("PYPEDAL_MAX_QUEUED") or 64)
+        # waiting jobs before new ones are rejected
+        self._scheduler: Scheduler | None = None
+        self.UPLOAD_URL = os.getenv("PYPEDAL_UPLOAD_URL") or "https://transfer.sh/"
+        self.UPLOAD_RETRIES = int(os.getenv("PYPEDAL_UPLOAD_RETRIES") or 3)
+        self.UPLOAD_TIMEOUT = float(os.getenv("PYPEDAL_UPLOAD_TIMEOUT") or 60)
+        # seconds without a response before an upload is retried
+        self._uploader: Uploader | None = None
+
+        self.STORAGE = os.getenv("PYPEDAL_STORAGE") or "transfer"
+        # where processed files go, "local" (served by the app), "transfer" or "s3"
+        self.PUBLIC_URL = os.getenv("PYPEDAL_PUBLIC_URL") or "http://localhost:8000"
+        # url of the app, for the links of local storage
+        self.S3_ENDPOINT = os.getenv("PYPEDAL_S3_ENDPOINT") or ""
+        self.S3_BUCKET = os.getenv("PYPEDAL_S3_BUCKET") or ""
+        self.S3_REGION = os.getenv("PYPEDAL_S3_REGION") or "us-east-1"
+        # credentials are read from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY
+        self._storage: Storage | None = None
+        self.PIPELINE = (os.getenv("PYPEDAL_PIPELINE") or "").lower() in ("1", "true")
+        # the server renders while downloading, see `pipeline.render_downloading`
+        self.FFMPEG = os.getenv("PYPEDAL_FFMPEG") or "ffmpeg"
+        self.TRANSCODE = os.getenv("PYPEDAL_TRANSCODE", "1") not in ("0", "false")
+        # downloads are converted to mp3, otherwise the native webm/m4a stream is kept
+        # and decoded with ffmpeg (outputs are mp3 either way)
+        self.RESULT_TTL = float(os.getenv("PYPEDAL_RESULT_TTL") or 3600)
+        self.MAX_RESULTS = int(os.getenv("PYPEDAL_MAX_RESULTS") or 4096)
+        # seconds / count of finished job statuses the server keeps
+
+        self.CACHE_BUDGET = int(os.getenv("PYPEDAL_CACHE_BUDGET") or 2 * 1024**3)
+        # bytes of processed files to keep, least recently used ones are deleted
+        self._render_cache: RenderCache | None = None
+
+        self.AUDIO_CACHE_BUDGET = int(
+            os.getenv("PYPEDAL_AUDIO_CACHE_BUDGET") or 1024**3
+        )
+        # bytes of decoded audio kept around after no equalizer is using it
+        self._audio_cache: AudioCache | None = None
+        self._source_cache: SourceCache | None = None
+        # downloaded sources by video id, see `youtube_download`
+
+        self.METADATA_TTL = float(os.getenv("PYPEDAL_METADATA_TTL") or 7 * 24 * 3600)
+        # seconds youtube metadata is kept in `options.metadata`
+        self._metadata: MetadataStore | None = None
+
+        self.JOBS = os.getenv("PYPEDAL_JOBS") or ""
+        # job store shared by every server and worker, "sqlite" (in FOLDER),
+        # "sqlite:///path/jobs.sqlite3" or "redis://...". empty runs jobs in-process
+        self.RENDER_WORKER = os.getenv("PYPEDAL_RENDER_WORKER") not in ("0", "false")
+        # with JOBS, whether the server renders jobs too or only relays their statuses
+        self._jobs: JobStore | None = None
+
+    @property
+    def render_cache(self):
+        with _options_lock:
+            if self._render_cache is None:
+                self._render_cache = RenderCache(
+                    self.PROCESSED_FOLDER, self.CACHE_BUDGET
+                )
+            return self._render_cache
+
+    @property
+    def audio_cache(self):
+        with _options_lock:
+            if self._audio_cache is None:
+                self._audio_cache = AudioCache(self.AUDIO_CACHE_BUDGET)
+            return self._audio_cache
+
+    @property
+    def source_cache(self):
+        with _options_lock:
+            if self._source_cache is None:
+                self._source_cache = SourceCache(self.FOLDER)
+            return self._source_cache
+
+    @property
+    def metadata(self):
+        with _options_lock:
+            if self._metadata is None:
+                self._metadata = MetadataStore(
+                    self.FOLDER / "metadata.sqlite3", self.METADATA_TTL
+                )
+            return self._metadata
+
+    @property
+    def jobs(self) -> JobStore | None:
+        with _options_lock:
+            if self._jobs is None and self.JOBS:
+                # pypedal.jobs imports this module
+                from pypedal.jobs import open_store
+
+                self._jobs = open_store(self.JOBS, self.FOLDER)
+            return self._jobs
+
+    @property
+    def scheduler(self) -> Scheduler:
+        """the server's, with the limits of the options it's first used with"""
+        with _options_lock:
+            if self._scheduler is None:
+                # the server imports this module
+                from pypedal.server.scheduler import Scheduler
+
+                self._scheduler = Scheduler()
+            return self._scheduler
+
+    @property
+    def uploader(self):
+        with _options_lock:
+            if self._uploader is None:
+                self._uploader = Uploader(
+                    self.UPLOAD_URL,
+                    concurrency=self.UPLOAD_WORKERS,
+                    retries=self.UPLOAD_RETRIES,
+                    timeout=self.UPLOAD_TIMEOUT,
+                )
+            return self._uploader
+
+    @property
+    def storage(self):
+        # only used from the event loop, `uploader` takes the lock
+        if self._storage is None:
+            self._storage = self._create_storage()
+        return self._storage
+
+    def _create_storage(self) -> Storage:
+        if self.STORAGE == "local":
+            return LocalStorage(self.PUBLIC_URL)
+        if self.STORAGE == "transfer":
+            return TransferStorage(self.uploader)
+        if self.STORAGE == "s3":
+            return S3Storage(
+                self.S3_ENDPOINT,
+                self.S3_BUCKET,
+                access_key=os.getenv("AWS_ACCESS_KEY_ID") or "",
+                secret_key=os.getenv("AWS_SECRET_ACCESS_KEY") or "",
+                region=self.S3_REGION,
+                timeout=self.UPLOAD_TIMEOUT,
+            )
+        raise ValueError(f"Unknown storage {self.STORAGE}")
+
+    @property
+    def cache_hits(self):
+        return self.render_cache.hits
+
+    @property
+    def cache_misses(self):
+        return self.render_cache.misses
+
 
 options = Options()
 YoutubeUrlRegex = re.compile(
@@ -63,33 +262,275 @@ YoutubeUrlRegex = re.compile(
 )
 YoutubeIdRegex = re.compile(r"""([^"&?\/ ]{11})""")
 BoardType = Tuple[EQProcessMode, EQTYPES]
+PREROLL_SECONDS = 1.0
 
 
 class YoutubeDLError(Exception):
     ...
 
 
+def readable(file: pathlib.Path):
+    """
+    whether pedalboard can decode the file, youtube's webm and m4a streams
+    (see `options.TRANSCODE`) are decoded with ffmpeg
+    """
+    return file.suffix.lower() in get_supported_read_formats()
+
+
+def read_blocks(f: ReadableAudioFile, block_size: int) -> Iterator["AudioType"]:
+    """
+    Reads the file in blocks of `block_size` frames until it's exhausted
+    """
+    while True:
+        block = f.read(block_size)
+        if not block.shape[1]:
+            break
+        yield block
+
+
+def warms_up(board: Pedalboard | SlowedReverb) -> bool:
+    """
+    streamed with every block warmed up by the one before (PitchShift),
+    close to a single board call but not the same samples
+    """
+    return any(isinstance(plugin, PitchShift) for plugin in board)
+
+
+def process_blocks(
+    board: Pedalboard | SlowedReverb | AudioEffectsChain,
+    blocks: Iterable["AudioType"],
+    samplerate: float,
+) -> Iterator["AudioType"]:
+    """
+    Runs the blocks through the board one by one, effect state carries over
+    between blocks (reset=False) so the output matches a single board call.
+    """
+    if is_sox_board(board):
+        # sox runs once per call and can't keep state between blocks
+        log.warning(f"{board=} can't be streamed, processing the whole file at once")
+        yield board(numpy.concatenate(list(blocks), axis=1))  # type: ignore
+        return
+
+    if warms_up(board):
+        # PitchShift goes silent with reset=False, warm every block up
+        # with the audio before it instead and drop that part of the output
+        preroll = int(samplerate * PREROLL_SECONDS)
+        tail = None
+        for block in blocks:
+            if tail is not None:
+                block = numpy.concatenate([tail, block], axis=1)
+            out = board(block, samplerate, reset=True)
+            yield out[:, 0 if tail is None else tail.shape[1] :]
+            tail = block[:, -preroll:]
+        return
+
+    board.reset()
+    expected = produced = 0
+    channels, block_size = 2, 0
+    for block in blocks:
+        channels, block_size = block.shape[0], max(block_size, block.shape[1])
+        expected += block.shape[1]
+        out = board(block, samplerate, reset=False)
+        produced += out.shape[1]
+        if out.shape[1]:
+            yield out
+
+    if isinstance(board, SlowedReverb):
+        # output is longer than the input, just empty the resampler
+        out = board.flush(samplerate)
+        if out.shape[1]:
+            yield out
+        return
+
+    # plugins with latency (Resample) hold some frames back,
+    # push silence through until every input frame came out
+    silence = numpy.zeros((channels, block_size or 1), dtype=numpy.float32)
+    for _ in range(16):
+        if produced >= expected:
+            break
+        out = board(silence, samplerate, reset=False)[:, : expected - produced]
+        produced += out.shape[1]
+        if out.shape[1]:
+            yield out
+
+
+@shares_arrays
+def process_audio(
+    board_name: BoardType[EQTYPES],
+    audio: "AudioType",
+    samplerate: float,
+    counter: "ndarray | None" = None,
+) -> "AudioType":
+    """
+    Runs the whole buffer through the board, runs in the dsp executor.
+    with a progress counter (see `run_dsp`) it's processed in blocks when
+    that gives the same samples, otherwise it's counted once it's done
+    """
+    board = get_board(board_name[0], board_name[1])
+    log.info(f"proccessing with {board_name=}")
+    if counter is None:
+        return board(audio, samplerate)
+
+    counter[1] = frames = audio.shape[1]
+    if is_sox_board(board) or warms_up(board):
+        out = board(audio, samplerate)
+        counter[0] = frames
+        return out
+
+    block_size = options.BLOCK_SIZE
+    blocks = (audio[:, i : i + block_size] for i in range(0, frames, block_size))
+    processed = process_blocks(board, counted(blocks, counter), samplerate)
+    return numpy.concatenate(list(processed), axis=1)
+
+
+@shares_arrays
+def render_file(
+    source: str,
+    target: str,
+    board_name: BoardType[EQTYPES],
+    block_size: int,
+    counter: "ndarray | None" = None,
+):
+    """
+    Streams source through the board into target, runs in the dsp executor.
+    only paths are passed so it doesn't matter if it's a worker process
+    """
+    render_files(source, [(target, board_name)], block_size, counter)
+
+
+@shares_arrays
+def render_files(
+    source: str,
+    targets: List[Tuple[str, BoardType[EQTYPES]]],
+    block_size: int,
+    counter: "ndarray | None" = None,
+):
+    """
+    `render_file` for several (target, board_name) pairs, source is decoded
+    once and every block goes through all the boards.
+    sources pedalboard can't read are decoded by ffmpeg as they are streamed
+    """
+    if not readable(pathlib.Path(source)):
+        # imports this module
+        from pypedal.pedal.pipeline import CHANNELS, SAMPLERATE, decode, probe_duration
+
+        if counter is not None:
+            counter[1] = int((probe_duration(source) or 0) * SAMPLERATE)
+        blocks = counted(decode(source, block_size), counter)
+        write_blocks(blocks, SAMPLERATE, CHANNELS, targets)
+        return
+
+    with ReadableAudioFile(source) as src:
+        if counter is not None:
+            counter[1] = src.frames
+        blocks = counted(read_blocks(src, block_size), counter)
+        write_blocks(blocks, src.samplerate, src.num_channels, targets)
+
+
+@shares_arrays
+def render_audio(
+    audio: "AudioType",
+    samplerate: float,
+    targets: List[Tuple[str, BoardType[EQTYPES]]],
+    block_size: int,
+    counter: "ndarray | None" = None,
+):
+    """
+    `render_files` for audio decoded before, it's fed to the boards in blocks
+    so the targets' .part files grow while rendering
+    """
+    frames = audio.shape[1]
+    if counter is not None:
+        counter[1] = frames
+    blocks = (audio[:, i : i + block_size] for i in range(0, frames, block_size))
+    write_blocks(counted(blocks, counter), samplerate, audio.shape[0], targets)
+
+
+def part_file(file: pathlib.Path):
+    """
+    where file is written until it's complete, next to it
+    (a half written file must not look done)
+    """
+    return file.with_name(f"{file.stem}.part{file.suffix}")
+
+
+def write_blocks(
+    blocks: Iterable["AudioType"],
+    samplerate: float,
+    channels: int,
+    targets: List[Tuple[str, BoardType[EQTYPES]]],
+):
+    """
+    Runs the blocks through the board of every (target, board_name)
+    and writes the results, targets are replaced once they are complete
+    """
+    files = []
+    with contextlib.ExitStack() as stack:
+        # boards are advanced in turns, so tee only buffers a block or two
+        streams = itertools.tee(blocks, len(targets))
+        outputs = []
+        for (target, board_name), blocks in zip(targets, streams):
+            board = get_board(board_name[0], board_name[1])
+            log.info(f"streaming with {board_name=}")
+            file = pathlib.Path(target)
+            file.parent.mkdir(parents=True, exist_ok=True)
+            part = part_file(file)
+            files.append((part, file))
+            dst = stack.enter_context(
+                WriteableAudioFile(str(part), samplerate, channels)
+            )
+            outputs.append((process_blocks(board, blocks, samplerate), dst))
+
+        while outputs:
+            for output in list(outputs):
+                processed, dst = output
+                block = next(processed, None)
+                if block is None:
+                    outputs.remove(output)
+                else:
+                    dst.write(block)
+
+    for part, file in files:
+        os.replace(part, file)
+
+
 class Equalizer:
     def __init__(
         self,
         *,
-        # file: AudioFile | None = None,
+        file: pathlib.Path | None = None,
         video: PartialYoutubeVideo | None = None,
         audio: "AudioType | None" = None,
         samplerate: float | None = None,
+        frames: int | None = None,
         done: Dict[BoardType, "AudioType"] | None = None,  # classvar ? (global cache)
     ):
-        # self.file = file
+        self.file = file
         self.video = video
 
         self.audio = audio
         self.samplerate = samplerate
+        self.frames = frames
 
         self.done = done or {}
-
-    @classmethod
-    def read_file(
-        cls,
+        self.rendered: Dict[BoardType, pathlib.Path] = {}
+        # cache hits, written before and never decoded
+        self._release: weakref.finalize | None = None
+
+    def close(self):
+        """releases the decoded audio, see `options.audio_cache`"""
+        self.audio = None
+        if self._release is not None:
+            self._release()
+
+    @property
+    def duration(self):
+        if self.frames is None or not self.samplerate:
+            return None
+        return self.frames / self.samplerate
+
+    @staticmethod
+    def source_file(
         video: PartialYoutubeVideo | None = None,
         *,
         file_name: str | None = None,
@@ -103,23 +544,147 @@ class Equalizer:
                 raise Exception("file_name is required")
         else:
             file_name = video.file_name
-            extension = video.ext
+            extension = video.source_ext or video.ext
 
-        # TODO: async-method
-        # The duration in seconds 10 == frames(441_000) / samplerate(44,100hz)
-        log.info(f"reading {file_name=} {extension=}")
-        file = ReadableAudioFile(f"{path}/{file_name}.{extension}")
-        with file as f:
-            audio = f.read_raw(f.frames * 2)
-            samplerate = f.samplerate
+        return pathlib.Path(f"{path}/{file_name}.{extension}")
 
-        return cls(
-            # file=file,
+    @classmethod
+    def read_file(
+        cls,
+        video: PartialYoutubeVideo | None = None,
+        *,
+        file_name: str | None = None,
+        extension: str = "mp3",
+        path: pathlib.Path | None = None,
+    ):
+        file = cls.source_file(
+            video, file_name=file_name, extension=extension, path=path
+        )
+
+        def decode():
+            # The duration in seconds 10 == frames(441_000) / samplerate(44,100hz)
+            log.info(f"reading {file=}")
+            if not readable(file):
+                # imports this module
+                from pypedal.pedal.pipeline import decode_file
+
+                return decode_file(file)
+            with ReadableAudioFile(str(file)) as f:
+                return f.read(f.frames), float(f.samplerate)
+
+        # a re-downloaded source has another mtime and is decoded again
+        stat = file.stat()
+        key = (video.id if video else str(file), stat.st_mtime_ns, stat.st_size)
+        audio, samplerate = options.audio_cache.acquire(key, decode)
+
+        eq = cls(
+            file=file,
             video=video,
             audio=audio,
             samplerate=samplerate,
+            frames=audio.shape[1],
+        )
+        # audio is shared with other equalizers of the same source (read-only),
+        # the reference is released on `close` or when eq is garbage collected
+        eq._release = weakref.finalize(eq, options.audio_cache.release, key)
+        return eq
+
+    @classmethod
+    def aread_file(
+        cls,
+        video: PartialYoutubeVideo | None = None,
+        *,
+        file_name: str | None = None,
+        extension: str = "mp3",
+        path: pathlib.Path | None = None,
+    ) -> "asyncio.Future[Equalizer]":
+        """
+        `Equalizer.read_file` on the io executor,
+        decoding doesn't block the event loop
+        """
+        read_file = functools.partial(
+            cls.read_file, video, file_name=file_name, extension=extension, path=path
+        )
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(get_executor("io"), read_file)
+
+    @classmethod
+    def open_file(
+        cls,
+        video: PartialYoutubeVideo | None = None,
+        *,
+        file_name: str | None = None,
+        extension: str = "mp3",
+        path: pathlib.Path | None = None,
+    ):
+        """
+        Only reads the header of the file, audio is decoded block by block
+        while streaming. see `Equalizer.stream`
+        """
+        file = cls.source_file(
+            video, file_name=file_name, extension=extension, path=path
+        )
+
+        log.info(f"opening {file=}")
+        if not readable(file):
+            # imports this module
+            from pypedal.pedal.pipeline import SAMPLERATE, probe_duration
+
+            # decoded by ffmpeg at SAMPLERATE, frames is None if it can't tell
+            samplerate = float(SAMPLERATE)
+            duration = probe_duration(file)
+            frames = None if duration is None else int(duration * samplerate)
+        else:
+            with ReadableAudioFile(str(file)) as f:
+                samplerate = float(f.samplerate)
+                frames = f.frames
+
+        return cls(
+            file=file,
+            video=video,
+            samplerate=samplerate,
+            frames=frames,
         )
 
+    @classmethod
+    def load(
+        cls,
+        video: PartialYoutubeVideo | None = None,
+        *,
+        file_name: str | None = None,
+        extension: str = "mp3",
+        path: pathlib.Path | None = None,
+    ):
+        """
+        Opens the file for streaming if it's longer than `options.STREAM_THRESHOLD`
+        otherwise reads the whole file into memory.
+        webm and m4a are streamed through ffmpeg, see `render_files`
+        """
+        eq = cls.open_file(video, file_name=file_name, extension=extension, path=path)
+        if eq.duration is not None and eq.duration > options.STREAM_THRESHOLD:
+            log.info(f"streaming {eq.file=} ({eq.duration=:.0f}s)")
+            return eq
+
+        return cls.read_file(video, file_name=file_name, extension=extension, path=path)
+
+    @classmethod
+    def aload(
+        cls,
+        video: PartialYoutubeVideo | None = None,
+        *,
+        file_name: str | None = None,
+        extension: str = "mp3",
+        path: pathlib.Path | None = None,
+    ) -> "asyncio.Future[Equalizer]":
+        """
+        `Equalizer.load` on the io executor, see `Equalizer.aread_file`
+        """
+        load = functools.partial(
+            cls.load, video, file_name=file_name, extension=extension, path=path
+        )
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(get_executor("io"), load)
+
     def write_file(
         self,
         video: PartialYoutubeVideo | None = None,
@@ -150,23 +715,33 @@ class Equalizer:
                 extension = video.ext
 
             file_name = f"{title}-{board_name[1]}"
+            file = path / f"{file_name}.{extension}"
             if (audio := self.done.get(board_name)) is None:
-                raise Exception("please run first")
+                if (rendered := self.rendered.get(board_name)) is None:
+                    raise Exception("please run first")
+                if rendered != file:
+                    file.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copyfile(rendered, file)
+                return file_name
 
             assert isinstance(self.samplerate, float)
-            file = path / f"{file_name}.{extension}"
             file.parent.mkdir(parents=True, exist_ok=True)
+            part = part_file(file)
             with WriteableAudioFile(
-                str(file),
+                str(part),
                 self.samplerate,
                 audio.shape[0],
             ) as f:
                 f.write(audio)
+            os.replace(part, file)
 
+            if path == options.PROCESSED_FOLDER:
+                if key := self.cache_key(video, board_name):
+                    options.render_cache.put(key, file)
             return file_name
 
         return asyncio.get_event_loop().run_in_executor(
-            None, wrapper, video, board_name, title, extension, path
+            get_executor("io"), wrapper, video, board_name, title, extension, path
         )
 
     async def save_local(
@@ -198,48 +773,288 @@ class Equalizer:
         ),
         run_once: bool = True,
         args: tuple | None = None,
+        progress: ProgressCallback | None = None,
     ):
-        def wrapper(
-            video: PartialYoutubeVideo | None,
-            board_name: BoardType[EQTYPES],
-            run_once: bool,
-            args: tuple | None,
-        ):
-            done_before = self.done.get(board_name)
-            if not done_before and video is not None:
-                file = (
-                    options.PROCESSED_FOLDER
-                    / f"{video.safe_title}-{board_name[1]}.{video.ext}"
-                )
-                if file.exists():
-                    log.info(f"{file} exists, setting done_before")
-                    with ReadableAudioFile(str(file)) as f:
-                        self.done[board_name] = done_before = f.read(f.frames)
+        """
+        `progress(frames_done, total_frames)` is called on the event loop
+        while the board is running
+        """
+        loop = asyncio.get_event_loop()
+        return loop.create_task(
+            self._run(self.video, board_name, run_once, progress=progress)
+        )
 
-            if done_before is not None and run_once:
-                return done_before
-                # TODO: skip writing afterwards
+    def cache_key(
+        self, video: PartialYoutubeVideo | None, board_name: BoardType[EQTYPES]
+    ):
+        """
+        key of the processed file in `options.render_cache`,
+        None if there is no video or source file to identify it
+        """
+        if video is None or self.file is None:
+            return None
+        return options.render_cache.key(video.id, self.file, board_name)
+
+    def _find_render(
+        self, video: PartialYoutubeVideo, board_name: BoardType[EQTYPES]
+    ) -> pathlib.Path | None:
+        key = self.cache_key(video, board_name)
+        return key and options.render_cache.get(key) or None
+
+    async def _run(
+        self,
+        video: PartialYoutubeVideo | None,
+        board_name: BoardType[EQTYPES],
+        run_once: bool,
+        audio: "AudioType | SharedArray | None" = None,
+        progress: ProgressCallback | None = None,
+    ):
+        done_before = self.done.get(board_name)
+        if done_before is not None and run_once:
+            return done_before
 
-            if self.audio is None or self.samplerate is None:
-                raise Exception("please run first")
+        if run_once and video is not None:
+            rendered = await asyncio.get_event_loop().run_in_executor(
+                get_executor("io"), self._find_render, video, board_name
+            )
+            if rendered:
+                # returned as is, `write_file` won't write it again
+                log.info(f"{rendered} is cached, skipping run")
+                self.rendered[board_name] = rendered
+                return rendered
+
+        if self.audio is None or self.samplerate is None:
+            raise Exception("please run first")
+
+        self.done[board_name] = await run_dsp(
+            process_audio,
+            board_name,
+            self.audio if audio is None else audio,
+            self.samplerate,
+            progress=progress,
+        )
+        return self.done[board_name]
 
-            board = get_board(board_name[0], board_name[1])
-            if board is None:
-                raise Exception("Board not found")
+    def stream(
+        self,
+        video: PartialYoutubeVideo | None = None,
+        board_name: BoardType[EQTYPES] = (
+            EQProcessMode.SlowedReverb,
+            SlowedReverbProcessMode.Mid,
+        ),
+        *,
+        title: str | None = None,
+        extension: str = "mp3",
+        path: pathlib.Path | None = None,
+        run_once: bool = True,
+        block_size: int | None = None,
+        progress: ProgressCallback | None = None,
+    ):
+        """
+        Reads, processes and writes the file block by block,
+        peak memory doesn't depend on the length of the track. \n
+        returns file_name like `Equalizer.write_file`, see `Equalizer.run`
+        for progress
+        """
+        loop = asyncio.get_event_loop()
+        return loop.create_task(
+            self._stream(
+                video or self.video,
+                board_name,
+                title,
+                extension,
+                path,
+                run_once,
+                block_size or options.BLOCK_SIZE,
+                progress,
+            )
+        )
 
-            log.info(f"proccessing with {board_name=}")
-            if isinstance(board, AudioEffectsChain):
-                self.done[board_name] = board(self.audio)  # type: ignore
+    async def _stream(
+        self,
+        video: PartialYoutubeVideo | None,
+        board_name: BoardType[EQTYPES],
+        title: str | None,
+        extension: str,
+        path: pathlib.Path | None,
+        run_once: bool,
+        block_size: int,
+        progress: ProgressCallback | None = None,
+    ):
+        file_names = await self._stream_many(
+            video,
+            [board_name],
+            title,
+            extension,
+            path,
+            run_once,
+            block_size,
+            progress,
+        )
+        return file_names[board_name]
 
-            else:
-                self.done[board_name] = board(self.audio, self.samplerate)
+    async def _stream_many(
+        self,
+        video: PartialYoutubeVideo | None,
+        board_names: List[BoardType[EQTYPES]],
+        title: str | None,
+        extension: str,
+        path: pathlib.Path | None,
+        run_once: bool,
+        block_size: int,
+        progress: ProgressCallback | None = None,
+    ):
+        if self.file is None:
+            raise Exception("please open first")
+        if not path:
+            path = options.PROCESSED_FOLDER
 
-            return self.done[board_name]
+        if not video:
+            if not title:
+                raise Exception("title is required")
+        else:
+            title = video.safe_title
+            extension = video.ext
 
         loop = asyncio.get_event_loop()
-        return loop.run_in_executor(
-            None, wrapper, self.video, board_name, run_once, args
+        file_names: Dict[BoardType, str] = {}
+        targets: List[Tuple[str, BoardType[EQTYPES]]] = []
+        keys: Dict[pathlib.Path, str | None] = {}
+        for board_name in board_names:
+            file_name = file_names[board_name] = f"{title}-{board_name[1]}"
+            file = path / f"{file_name}.{extension}"
+            key = None
+            if path == options.PROCESSED_FOLDER:
+                key = await loop.run_in_executor(
+                    get_executor("io"), self.cache_key, video, board_name
+                )
+
+            if run_once:
+                if key and options.render_cache.get(key):
+                    log.info(f"{file} is cached, skipping stream")
+                    self.rendered[board_name] = file
+                    continue
+                if not key and file.exists():
+                    log.info(f"{file} exists, skipping stream")
+                    continue
+
+            targets.append((str(file), board_name))
+            keys[file] = key
+
+        if targets and self.audio is not None:
+            await run_dsp(
+                render_audio,
+                self.audio,
+                self.samplerate,
+                targets,
+                block_size,
+                progress=progress,
+            )
+        elif targets:
+            await run_dsp(
+                render_files,
+                str(self.file),
+                targets,
+                block_size,
+                progress=progress,
+            )
+        for file, key in keys.items():
+            if key:
+                await loop.run_in_executor(
+                    get_executor("io"), options.render_cache.put, key, file
+                )
+        return file_names
+
+    @staticmethod
+    def find_render(video: PartialYoutubeVideo, board_name: BoardType[EQTYPES]):
+        """
+        Looks the processed file up in `options.render_cache` without reading
+        the source, returns the path or None
+        """
+
+        def wrapper(video: PartialYoutubeVideo, board_name: BoardType[EQTYPES]):
+            file = Equalizer.source_file(video)
+            if not file.exists():
+                return None
+            return Equalizer(file=file, video=video)._find_render(video, board_name)
+
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(get_executor("io"), wrapper, video, board_name)
+
+    async def render(
+        self,
+        video: PartialYoutubeVideo,
+        board_name: BoardType[EQTYPES],
+        *,
+        run_once: bool = True,
+        progress: ProgressCallback | None = None,
+    ):
+        """
+        Streams or runs + writes depending on how the file was loaded,
+        returns file_name
+        """
+        if self.audio is None:
+            return await self.stream(
+                video, board_name, run_once=run_once, progress=progress
+            )
+
+        await self.run(board_name=board_name, run_once=run_once, progress=progress)
+        return await self.write_file(video, board_name)
+
+    async def run_many(
+        self,
+        board_names: Iterable[BoardType[EQTYPES]],
+        video: PartialYoutubeVideo | None = None,
+        *,
+        run_once: bool = True,
+        stream: bool = False,
+        progress: ProgressCallback | None = None,
+    ) -> Dict[BoardType, str]:
+        """
+        Renders and writes every board from the audio decoded once,
+        in parallel on the dsp executor. streamed files are decoded in one pass
+        that feeds all the boards (see `render_files`), with `stream` decoded
+        audio is written block by block like them (see `render_audio`). \n
+        returns {board_name: file_name}, progress is the sum of all boards
+        """
+        video = video or self.video
+        board_names = list(dict.fromkeys(board_names))
+        if self.audio is None or stream:
+            return await self._stream_many(
+                video,
+                board_names,
+                None,
+                "mp3",
+                None,
+                run_once,
+                options.BLOCK_SIZE,
+                progress,
+            )
+
+        reports: Dict[BoardType, Tuple[int, int]] = {}
+
+        def board_progress(board_name: BoardType):
+            if progress is None:
+                return None
+
+            def report(done: int, total: int):
+                reports[board_name] = done, total
+                progress(*map(sum, zip(*reports.values())))
+
+            return report
+
+        # a process pool gets one shared copy of the audio, not one per board
+        with shared(self.audio) as audio:
+            await asyncio.gather(
+                *[
+                    self._run(video, b, run_once, audio, board_progress(b))
+                    for b in board_names
+                ]
+            )
+        file_names = await asyncio.gather(
+            *[self.write_file(video, b) for b in board_names]
         )
+        return dict(zip(board_names, file_names))
 
 
 def parse_youtube_id(url: str):
@@ -252,10 +1067,19 @@ def parse_youtube_id(url: str):
         return match.group(1)
 
 
-def youtube_download(url: str, *, title_suffix: str = ""):
+def youtube_download(
+    url: str,
+    *,
+    title_suffix: str = "",
+    on_info: Callable[[YoutubeVideo, pathlib.Path], Any] | None = None,
+):
     # returns chunk of progress...
     """
     title suffix added for multi_process support \n
+    downloaded videos are kept in `options.source_cache` (and their metadata
+    in `options.metadata`), those come from there without asking youtube. \n
+    `on_info(video, path)` is called (from the download thread) before the
+    download starts, the file is written to "{path}.part" until it's done. \n
     returns YoutubeVideo
     """
 
@@ -265,10 +1089,40 @@ def youtube_download(url: str, *, title_suffix: str = ""):
         if type(video_id) is not str:
             raise YoutubeDLError("Invalid youtube url")
 
+        key = f"{video_id}{title_suffix}"
+        sources = options.source_cache
+        if (out := sources.get(key)) is None:
+            # one download per video for every worker and cli run on this folder
+            with sources.lock(key):
+                # someone else could have downloaded it while we were waiting
+                if (out := sources.get(key)) is None:
+                    if (out := downloaded(video_id, title_suffix)) is None:
+                        out = download(video_id, title_suffix)
+                        options.metadata.put(out)
+                        sources.put(key, out, Equalizer.source_file(out))
+                        return out
+                    sources.put(key, out, Equalizer.source_file(out))
+
+        log.info(f"{video_id=} found in source cache")
+        if on_info is not None:
+            on_info(out, Equalizer.source_file(out))
+        return out
+
+    def downloaded(video_id: str, title_suffix: str):
+        """metadata of a source that's on disk already, but not in source cache"""
+        out = options.metadata.get(video_id)
+        if out is None or not out.file_name.endswith(f"{video_id}{title_suffix}"):
+            return None
+        return out if Equalizer.source_file(out).exists() else None
+
+    def download(video_id: str, title_suffix: str):
+        # a quarter second to import, only the downloads need it
+        import youtube_dl
+
         url = video_id
         youtube_log = logging.getLogger("ytdl")
         youtube_log.setLevel(logging.DEBUG)
-        ydl_opts = {
+        ydl_opts: Dict[str, Any] = {
             "format": "bestaudio/best",
             "outtmpl": f"{options.FOLDER}/%(title)s-%(id)s{title_suffix}.%(ext)s",
             "keepvideo": True,
@@ -281,14 +1135,20 @@ def youtube_download(url: str, *, title_suffix: str = ""):
                 }
             ],
         }
+        if not options.TRANSCODE:
+            # the stream as is, one file and no encoding
+            ydl_opts.update(keepvideo=False, postprocessors=[])
         log.info(f"downloading {url=}")
         with youtube_dl.YoutubeDL(ydl_opts) as ydl:
             tries = 0
             while tries < 3:
                 tries += 1
                 try:
-                    info = ydl.extract_info(url)
-                    out = YoutubeVideo(**info)  # type: ignore
+                    info = ydl.extract_info(url, download=on_info is None)
+                    if on_info is not None:
+                        on_info(*describe(ydl, info))
+                        info = ydl.process_ie_result(info, download=True)
+                    out, _ = describe(ydl, info)
                 except (youtube_dl.DownloadError, PermissionError) as e:
                     if "unable to rename file" in str(e) or isinstance(
                         e, PermissionError
@@ -308,40 +1168,36 @@ def youtube_download(url: str, *, title_suffix: str = ""):
 
             assert out.id == video_id
 
-            # we need safely-generated filename from ydl for filesystem
-            path = pathlib.Path(str(ydl.prepare_filename(info)))
-            file = path.name
-            file_name, _extension = file.rsplit(".", 1)
-            out.file_name = file_name  # safe filename from ydl
-            out.safe_title = file_name.rsplit(f"-{out.id}", 1)[0]
-            out.ext = ydl_opts["postprocessors"][0]["preferredcodec"]
-            # ydl gives us "webm", "m4a" ext from info for some reason :/
-
         return out
 
+    def describe(ydl: youtube_dl.YoutubeDL, info: Dict[str, Any]):
+        out = YoutubeVideo(**info)  # type: ignore
+        # we need safely-generated filename from ydl for filesystem
+        path = pathlib.Path(str(ydl.prepare_filename(info)))
+        file = path.name
+        file_name, extension = file.rsplit(".", 1)
+        out.file_name = file_name  # safe filename from ydl
+        out.safe_title = file_name.rsplit(f"-{out.id}", 1)[0]
+        # ydl gives us the "webm", "m4a" ext of the stream,
+        # processed files are mp3 and so is the source if it's transcoded
+        out.ext = "mp3"
+        out.source_ext = None if options.TRANSCODE else extension
+        return out, path
+
     loop = asyncio.get_event_loop()
-    return loop.run_in_executor(None, wrapper, url, title_suffix)
+    return loop.run_in_executor(get_executor("io"), wrapper, url, title_suffix)
 
 
 def upload_to_transferfilesh(file: pathlib.Path, /, *, clipboard: bool = False):
-    def wrapper(file: pathlib.Path, clipboard: bool):
-        def get_size(file: pathlib.Path):
-            """
-            get file size, in megabytes
-            :param file:
-            :return: size of file
-            """
-            size_in_bytes = os.path.getsize(file)
-            size_in_megabytes = size_in_bytes / 1_000_000
-            return size_in_megabytes
-
-        size_of_file = get_size(file)
+    """
+    uploads with `options.uploader`, returns a future of the download link
+    """
+
+    async def upload():
+        size_of_file = os.path.getsize(file) / 1_000_000  # in megabytes
         log.info(f"sending file: {os.path.basename(file)} ({size_of_file=} MB)")
 
-        opened_file = open(file, "rb")
-        response = requests.post("https://transfer.sh/", files={file.name: opened_file})
-        opened_file.close()
-        download_link = response.content.decode("utf-8").replace("\n", "")
+        download_link = await options.uploader.upload(file)
         log.info(f"link to download file:\n{download_link}")
 
         if clipboard:
@@ -351,7 +1207,7 @@ def upload_to_transferfilesh(file: pathlib.Path, /, *, clipboard: bool = False):
         return download_link
 
     loop = asyncio.get_event_loop()
-    return loop.run_in_executor(None, wrapper, file, clipboard)
+    return loop.create_task(upload())
 
 
 def upload_local(
@@ -376,112 +1232,27 @@ def upload_local(
         f"{options.PROCESSED_FOLDER}/{title}-{board_name[1]}.{extension}"
     )
 
-    return upload_to_transferfilesh(full_qualified_name, clipboard=copy_to_clipboard)
-
-
-app = typer.Typer()
-
-
-@app.command()
-def resample(
-    youtube_link: Optional[str] = typer.Argument(
-        None, help="youtube link, optional if you have already downloaded"
-    ),
-    video_id: Optional[str] = typer.Option(
-        None, help="local video id if youtube_link is None (video downloaded before)"
-    ),
-    title: Optional[str] = None,
-    mode_level: ResampleProcessMode = ResampleProcessMode.Down,
-    run_once: bool = True,
-    upload: bool = False,
-):
-    import colouredlogs
-
-    colouredlogs.install(logging.DEBUG, reconfigure=False)
-
-    loop = asyncio.get_event_loop()
-    UPLOAD_FILE = upload
-    YOUTUBE_LINK = youtube_link or ""
-    ID, TITLE = (
-        video_id or "bCxtVoZJV2I",
-        title or "Jakuzi - 'Sana Göre Bir Şey Yok' (Official Audio)",
-    )
-
-    if not YOUTUBE_LINK:
-        if not ID:
-            raise RuntimeError("no youtube link or video id")
-
-    if YOUTUBE_LINK:
-        video = loop.run_until_complete(youtube_download(YOUTUBE_LINK))
-    else:
-        video = PartialYoutubeVideo(id=ID, title=TITLE)
-
-    board_name = EQProcessMode.Resample, mode_level
-
-    eq = Equalizer.read_file(video)
-    loop.run_until_complete(eq.run(board_name=board_name, run_once=run_once))
-    loop.run_until_complete(eq.save_local(video, board_name))
-    if UPLOAD_FILE:
-        loop.run_until_complete(
-            upload_local(video, board_name=board_name, copy_to_clipboard=True)
-        )
-
-
-@app.command()
-def slowed_reverb(
-    youtube_link: Optional[str] = typer.Argument(
-        None, help="youtube link, optional if you have already downloaded"
-    ),
-    video_id: Optional[str] = typer.Option(
-        None, help="local video id if youtube_link is None (video downloaded before)"
-    ),
-    title: Optional[str] = None,
-    mode_level: SlowedReverbProcessMode = SlowedReverbProcessMode.Mid,
-    use_all_levels: bool = False,
-    run_once: bool = True,
-    upload: bool = False,
-):
-    import colouredlogs
+    async def upload():
+        try:
+            download_link = await options.storage.store(full_qualified_name)
+        except FileNotFoundError:
+            # deleted since it was cached, rendered again next time
+            await loop.run_in_executor(
+                get_executor("io"), options.render_cache.forget, full_qualified_name
+            )
+            raise
+        log.info(f"link to download file:\n{download_link}")
+        if copy_to_clipboard:
+            import pyperclip
 
-    colouredlogs.install(logging.DEBUG, reconfigure=False)
+            pyperclip.copy(download_link)
+        return download_link
 
     loop = asyncio.get_event_loop()
-    UPLOAD_FILE = upload
-    YOUTUBE_LINK = youtube_link or ""
-    ID, TITLE = (
-        video_id or "bCxtVoZJV2I",
-        title or "Jakuzi - 'Sana Göre Bir Şey Yok' (Official Audio)",
-    )
-
-    if not YOUTUBE_LINK:
-        if not ID:
-            raise RuntimeError("no youtube link or video id")
-
-    if YOUTUBE_LINK:
-        video = loop.run_until_complete(youtube_download(YOUTUBE_LINK))
-    else:
-        video = PartialYoutubeVideo(id=ID, title=TITLE)
-
-    if use_all_levels:
-        eq_range = {
-            0: (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Low),
-            1: (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Mid),
-            2: (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.High),
-        }
-    else:
-        eq_range = {
-            0: (EQProcessMode.SlowedReverb, mode_level),
-        }
-
-    eq = Equalizer.read_file(video)
-    for idx, board_name in eq_range.items():
-        loop.run_until_complete(eq.run(board_name=board_name, run_once=run_once))
-        loop.run_until_complete(eq.save_local(video, board_name))
-        if UPLOAD_FILE:
-            loop.run_until_complete(
-                upload_local(video, board_name=board_name, copy_to_clipboard=True)
-            )
+    return loop.create_task(upload())
 
 
 if __name__ == "__main__":
+    from pypedal.pedal.cli import app
+
     app()
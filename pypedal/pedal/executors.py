@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import dataclasses
+import functools
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Tuple,
+    TypeVar,
+)
+
+import numpy
+
+log = logging.getLogger(__name__)
+
+ExecutorKind = Literal["io", "dsp"]
+ProgressCallback = Callable[[int, int], Any]
+T = TypeVar("T")
+PROGRESS_INTERVAL = 0.1
+# seconds between progress checks of a running dsp call
+
+_executors: Dict[str, Executor] = {}
+_lock = threading.Lock()
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedArray:
+    """
+    A numpy array living in shared memory,
+    only the name, shape and dtype are pickled when sent to a worker process
+    """
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    @classmethod
+    def copy_of(cls, array: numpy.ndarray):
+        shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+        try:
+            numpy.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        finally:
+            shm.close()
+        return cls(shm.name, array.shape, array.dtype.str)
+
+    def attach(self):
+        """returns the shared memory and an array view of it, close it when done"""
+        shm = SharedMemory(self.name)
+        return shm, numpy.ndarray(self.shape, numpy.dtype(self.dtype), buffer=shm.buf)
+
+    def unlink(self):
+        shm = SharedMemory(self.name)
+        shm.close()
+        shm.unlink()
+
+    def pop(self):
+        """copies the array out of shared memory and frees it"""
+        shm, view = self.attach()
+        try:
+            array = numpy.array(view)
+        finally:
+            del view
+            shm.close()
+            shm.unlink()
+        return array
+
+
+def _attach(arg: Any, shms: List[SharedMemory]):
+    if not isinstance(arg, SharedArray):
+        return arg
+    shm, view = arg.attach()
+    shms.append(shm)
+    return view
+
+
+def _share(array: numpy.ndarray, created: List[SharedArray]):
+    shared_array = SharedArray.copy_of(array)
+    created.append(shared_array)
+    return shared_array
+
+
+def shares_arrays(func: Callable[..., T]) -> Callable[..., T]:
+    """
+    Lets a dsp function work on plain arrays when it's called with
+    `SharedArray`s from `run_dsp`, the returned array is shared back
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        if not any(isinstance(arg, SharedArray) for arg in args):
+            return func(*args)
+
+        shms: List[SharedMemory] = []
+        arrays = [_attach(arg, shms) for arg in args]
+        try:
+            result = func(*arrays)
+        finally:
+            # views must be gone before the memory can be closed
+            arrays.clear()
+            for shm in shms:
+                shm.close()
+
+        if isinstance(result, numpy.ndarray):
+            return SharedArray.copy_of(result)
+        return result
+
+    return wrapper
+
+
+def _create_executor(kind: ExecutorKind) -> Executor:
+    from pypedal.pedal.equalizer import options
+
+    if kind == "io":
+        return ThreadPoolExecutor(options.IO_WORKERS, thread_name_prefix="pypedal-io")
+
+    if options.EXECUTOR == "process":
+        log.info(f"starting dsp process pool with {options.WORKERS} workers")
+        # forking a process with a running event loop and threads isn't safe
+        return ProcessPoolExecutor(
+            options.WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    if options.EXECUTOR != "thread":
+        raise ValueError(f"Unknown executor {options.EXECUTOR}")
+    return ThreadPoolExecutor(options.WORKERS, thread_name_prefix="pypedal-dsp")
+
+
+def get_executor(kind: ExecutorKind) -> Executor:
+    """
+    "io" is a thread pool for downloads and file writes (not uploads),
+    "dsp" runs the boards, a process pool if `options.EXECUTOR == "process"`
+    """
+    with _lock:
+        executor = _executors.get(kind)
+        if executor is None:
+            executor = _executors[kind] = _create_executor(kind)
+        return executor
+
+
+def shutdown_executors(wait: bool = True):
+    """the executors are created again on next use (with the current options)"""
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
+
+
+@contextlib.contextmanager
+def shared(array: numpy.ndarray) -> Iterator[numpy.ndarray | SharedArray]:
+    """
+    Copies the array to shared memory once if the dsp executor is a process
+    pool, for passing the same audio to several `run_dsp` calls
+    """
+    if not isinstance(get_executor("dsp"), ProcessPoolExecutor):
+        yield array
+        return
+
+    shared_array = SharedArray.copy_of(array)
+    try:
+        yield shared_array
+    finally:
+        shared_array.unlink()
+
+
+def counted(blocks: Iterable[numpy.ndarray], counter: numpy.ndarray | None):
+    """adds the frames of every block to `counter[0]` once it's processed"""
+    for block in blocks:
+        yield block
+        if counter is not None:
+            counter[0] += block.shape[1]
+
+
+async def _report(
+    counter: numpy.ndarray, progress: ProgressCallback, finished: asyncio.Event
+):
+    reported = None
+    while True:
+        done, total = int(counter[0]), int(counter[1])
+        if total and (done, total) != reported:
+            reported = done, total
+            progress(done, total)
+        if finished.is_set():
+            return
+        try:
+            await asyncio.wait_for(finished.wait(), PROGRESS_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_dsp(
+    func: Callable[..., Any], *args: Any, progress: ProgressCallback | None = None
+) -> Any:
+    """
+    Runs func in the dsp executor, arrays are passed through shared memory
+    instead of being pickled when it's a process pool. see `shares_arrays` \n
+    with `progress`, func gets a counter array as its last argument to keep
+    [frames done, total frames] in, `progress(done, total)` is called
+    from the event loop whenever that changes
+    """
+    executor = get_executor("dsp")
+    loop = asyncio.get_event_loop()
+    counter = None
+    if progress is not None:
+        counter = numpy.zeros(2, dtype=numpy.int64)
+        args = (*args, counter)
+
+    shms: List[SharedMemory] = []
+    created: List[SharedArray] = []
+    # only these are freed here, the caller's `shared` arrays are its own
+    if isinstance(executor, ProcessPoolExecutor):
+        args = tuple(
+            _share(arg, created) if isinstance(arg, numpy.ndarray) else arg
+            for arg in args
+        )
+        if counter is not None:
+            # the worker writes to shared memory, read it from there
+            counter = _attach(args[-1], shms)
+
+    finished = asyncio.Event()
+    reporting = None
+    if counter is not None and progress is not None:
+        reporting = asyncio.ensure_future(_report(counter, progress, finished))
+    try:
+        result = await loop.run_in_executor(executor, func, *args)
+    finally:
+        if reporting:
+            # reports the last state, the counter view must be gone before close
+            finished.set()
+            await asyncio.wait([reporting])
+        del counter
+        for shm in shms:
+            shm.close()
+        for shared_array in created:
+            shared_array.unlink()
+
+    if isinstance(result, SharedArray):
+        return result.pop()
+    return result
@@ -10,6 +10,8 @@ class PartialYoutubeVideo(BaseModel):
     file_name: str = None  # type: ignore
     safe_title: str = None  # type: ignore
     ext: str = "mp3"
+    source_ext: Optional[str] = None
+    # extension of the downloaded file if it isn't `ext` (kept as webm, m4a...)
 
     def __str__(self):
         return self.title
@@ -1,12 +1,33 @@
 from __future__ import annotations
 
 import enum
-from typing import Literal, Mapping, Type, TypeVar, overload
+import functools
+import hashlib
+import inspect
+import json
+import sys
+import threading
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Literal,
+    Mapping,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    overload,
+)
+
+if TYPE_CHECKING:
+    from pedalboard import Pedalboard, Plugin  # type: ignore
+    from pysndfx import AudioEffectsChain
 
-from pysndfx import AudioEffectsChain
+    from pypedal.pedal.plugins import SlowedReverb
 
-from pedalboard import Delay, LowpassFilter, PitchShift, Reverb, Resample  # type: ignore
-from pedalboard.pedalboard import Pedalboard
+    Board = Union[Pedalboard, SlowedReverb]
 
 
 class SlowedReverbProcessMode(str, enum.Enum):
@@ -61,56 +82,156 @@ def get_mode(mode: EQProcessMode):
         raise ValueError(f"Unknown mode {mode}")
 
 
+BoardFactories = Mapping[EQProcessMode, Mapping[Any, Callable[[], "Board"]]]
+
+
+def resample_board(target_sample_rate: float) -> Pedalboard:
+    # pedalboard is imported by the first board, not with the modes
+    from pedalboard import Pedalboard, Resample  # type: ignore
+
+    return Pedalboard([Resample(target_sample_rate=target_sample_rate)])
+
+
+def pitch_shift_board(semitones: float) -> Pedalboard:
+    from pedalboard import Delay, Pedalboard, PitchShift, Reverb  # type: ignore
+
+    return Pedalboard(
+        [
+            Delay(delay_seconds=0.25, mix=1.0),
+            PitchShift(semitones=semitones),
+            Reverb(width=0.8),
+        ]
+    )
+
+
+def slowed_reverb_board(speed: float) -> SlowedReverb:
+    from pypedal.pedal.plugins import SlowedReverb
+
+    return SlowedReverb(speed=speed)
+
+
+BOARDS: BoardFactories = {
+    EQProcessMode.Resample: {
+        ResampleProcessMode.Down: lambda: resample_board(41.100),
+        ResampleProcessMode.Up: lambda: resample_board(16000),
+    },
+    EQProcessMode.PitchShift: {
+        PitchShiftProcessMode.Low: lambda: pitch_shift_board(-3.5),
+        PitchShiftProcessMode.Mid: lambda: pitch_shift_board(-4.5),
+        PitchShiftProcessMode.High: lambda: pitch_shift_board(-5.5),
+    },
+    EQProcessMode.SlowedReverb: {
+        SlowedReverbProcessMode.Low: lambda: slowed_reverb_board(0.85),
+        SlowedReverbProcessMode.Mid: lambda: slowed_reverb_board(0.8),
+        SlowedReverbProcessMode.High: lambda: slowed_reverb_board(0.7),
+    },
+}
+
+
+class BoardRegistry:
+    """
+    Builds each board lazily, once per thread. \n
+    Plugins like Reverb and Delay keep state between calls, so a board is only
+    ever used by the thread that built it. use `create` for a fresh instance
+    that can be handed to another thread or kept for a single job.
+    """
+
+    def __init__(self, factories: BoardFactories):
+        self.factories = factories
+        self._local = threading.local()
+
+    def factory(self, mode: EQProcessMode, type: EQTYPES) -> Callable[[], Board]:
+        boards = self.factories.get(mode)
+        if boards is None:
+            raise Exception("Board not found")
+        factory = boards.get(type)
+        if not factory:
+            raise ValueError(f"Invalid {mode=} + {type=}")
+        return factory
+
+    def get(self, mode: EQProcessMode, type: EQTYPES) -> Board:
+        boards: Dict[Tuple[EQProcessMode, Any], Board]
+        boards = self._local.__dict__.setdefault("boards", {})
+        board = boards.get((mode, type))
+        if board is None:
+            board = boards[(mode, type)] = self.create(mode, type)
+        return board
+
+    def create(self, mode: EQProcessMode, type: EQTYPES) -> Board:
+        return self.factory(mode, type)()
+
+    def clear(self):
+        """drops the boards of the calling thread"""
+        self._local.__dict__.pop("boards", None)
+
+
+board_registry = BoardRegistry(BOARDS)
+
+
 # fmt: off
 @overload
-def get_board(mode: EQProcessMode, type: SlowedReverbProcessMode) -> AudioEffectsChain:...
+def get_board(mode: EQProcessMode, type: SlowedReverbProcessMode) -> SlowedReverb:...
 @overload
 def get_board(mode: EQProcessMode, type: PEDALEQTYPES) -> Pedalboard:...
 @overload
-def get_board(mode: EQProcessMode, type: EQTYPES) -> Pedalboard | AudioEffectsChain:...
+def get_board(mode: EQProcessMode, type: EQTYPES) -> Board:...
 # fmt: on
-def get_board(mode: EQProcessMode, type: EQTYPES) -> Pedalboard | AudioEffectsChain:
+def get_board(mode: EQProcessMode, type: EQTYPES) -> Board:
+    """
+    Returns the calling thread's pedalboard for the given mode and type,
+    see `BoardRegistry`
+    """
+    return board_registry.get(mode, type)
+
+
+def get_sox_board(type: SlowedReverbProcessMode) -> AudioEffectsChain:
+    """
+    Returns the sox (pysndfx) version of the SlowedReverb board,
+    needs the `sox` binary and runs it as a subprocess on every call
+    """
+    from pysndfx import AudioEffectsChain
+
+    board = board_registry.create(EQProcessMode.SlowedReverb, type)
+    return AudioEffectsChain().speed(board.speed).reverb()
+
+
+def is_sox_board(board: Any) -> bool:
+    """whether board is from `get_sox_board`, without importing pysndfx for it"""
+    pysndfx = sys.modules.get("pysndfx")
+    return pysndfx is not None and isinstance(board, pysndfx.AudioEffectsChain)
+
+
+def describe_board(board: Board | AudioEffectsChain | Plugin) -> Any:
+    """
+    Returns the definition of a board, its plugins and their parameters,
+    can be dumped as json
+    """
+    from pedalboard import Pedalboard  # type: ignore
+
+    from pypedal.pedal.plugins import SlowedReverb
+
+    if isinstance(board, SlowedReverb):
+        plugins = [describe_board(plugin) for plugin in board]
+        return {"SlowedReverb": {"speed": board.speed, "plugins": plugins}}
+    if is_sox_board(board):
+        return {"AudioEffectsChain": [str(arg) for arg in board.command]}
+    if isinstance(board, Pedalboard):
+        return {"Pedalboard": [describe_board(plugin) for plugin in board]}
+
+    parameters = {}
+    for name, attr in inspect.getmembers(type(board)):
+        if isinstance(attr, property) and not name.startswith("_"):
+            value = getattr(board, name)
+            if not isinstance(value, (bool, int, float, str)):
+                value = str(value)
+            parameters[name] = value
+    return {type(board).__name__: parameters}
+
+
+@functools.lru_cache(maxsize=None)
+def board_digest(mode: EQProcessMode, type: EQTYPES) -> str:
     """
-    Returns a pedalboard for the given mode and type
+    Hash of the board definition, changes when a parameter of the board changes
     """
-    boards: Mapping = {
-        EQProcessMode.Resample: {
-            ResampleProcessMode.Down: Pedalboard([Resample(target_sample_rate=41.100)]),
-            ResampleProcessMode.Up: Pedalboard([Resample(target_sample_rate=16000)]),
-        },
-        EQProcessMode.PitchShift: {
-            PitchShiftProcessMode.Low: Pedalboard(
-                [
-                    Delay(delay_seconds=0.25, mix=1.0),
-                    PitchShift(semitones=-3.5),
-                    Reverb(width=0.8),
-                ]
-            ),
-            PitchShiftProcessMode.Mid: Pedalboard(
-                [
-                    Delay(delay_seconds=0.25, mix=1.0),
-                    PitchShift(semitones=-4.5),
-                    Reverb(width=0.8),
-                ]
-            ),
-            PitchShiftProcessMode.High: Pedalboard(
-                [
-                    Delay(delay_seconds=0.25, mix=1.0),
-                    PitchShift(semitones=-5.5),
-                    Reverb(width=0.8),
-                ]
-            ),
-        },
-        EQProcessMode.SlowedReverb: {
-            SlowedReverbProcessMode.Low: AudioEffectsChain().speed(0.85).reverb(),
-            SlowedReverbProcessMode.Mid: AudioEffectsChain().speed(0.8).reverb(),
-            SlowedReverbProcessMode.High: AudioEffectsChain().speed(0.7).reverb(),
-        },
-    }
-    board = boards.get(mode)
-    if board is None:
-        raise Exception("Board not found")
-    board = board.get(type)  # type: ignore
-    if not board:
-        raise ValueError(f"Invalid {mode=} + {type=}")
-    return board
+    definition = describe_board(board_registry.create(mode, type))
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()
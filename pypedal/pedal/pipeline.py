@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import logging
+import pathlib
+import re
+import subprocess
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Tuple
+
+import numpy
+
+from pypedal.pedal.equalizer import (
+    BoardType,
+    Equalizer,
+    counted,
+    options,
+    write_blocks,
+)
+from pypedal.pedal.executors import ProgressCallback, run_dsp, shares_arrays
+from pypedal.pedal.models import PartialYoutubeVideo
+from pypedal.pedal.modes import EQTYPES
+
+if TYPE_CHECKING:
+    from numpy import ndarray
+    from pypedal.pedal.equalizer import AudioType
+
+log = logging.getLogger(__name__)
+
+SAMPLERATE = 44100
+CHANNELS = 2
+# the download is decoded (and the boards run) at this rate
+DurationRegex = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+def follow_file(
+    part: pathlib.Path,
+    final: pathlib.Path,
+    *,
+    chunk_size: int = 1 << 16,
+    poll: float = 0.05,
+    timeout: float = 30,
+) -> Iterator[bytes]:
+    """
+    Yields the bytes of a file while it's being downloaded to `part`,
+    until it's renamed to `final` and read to the end. \n
+    raises TimeoutError if it doesn't grow for `timeout` seconds
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            f = open(part, "rb")
+            break
+        except FileNotFoundError:
+            if final.exists():
+                # done before we got here
+                f = open(final, "rb")
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{part} never showed up")
+            time.sleep(poll)
+
+    with f:
+        grown = time.monotonic()
+        while True:
+            if chunk := f.read(chunk_size):
+                grown = time.monotonic()
+                yield chunk
+                continue
+            if not part.exists():
+                # renamed, what's written before is still readable from f
+                while chunk := f.read(chunk_size):
+                    yield chunk
+                return
+            if time.monotonic() - grown > timeout:
+                raise TimeoutError(f"{part} stopped growing")
+            time.sleep(poll)
+
+
+def decode(
+    chunks: Iterable[bytes] | str | pathlib.Path, block_size: int
+) -> Iterator["AudioType"]:
+    """
+    Decodes an encoded stream (webm, m4a, mp3...) with ffmpeg as it comes,
+    or a whole file if given its path. yields blocks of float32 audio
+    at `SAMPLERATE`
+    """
+    piped = not isinstance(chunks, (str, pathlib.Path))
+    process = subprocess.Popen(
+        [
+            options.FFMPEG,
+            "-v",
+            "error",
+            "-i",
+            "pipe:0" if piped else str(chunks),
+            "-f",
+            "f32le",
+            "-ac",
+            str(CHANNELS),
+            "-ar",
+            str(SAMPLERATE),
+            "pipe:1",
+        ],
+        stdin=subprocess.PIPE if piped else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+    )
+    assert process.stdout
+    errors: List[BaseException] = []
+
+    def feed(chunks: Iterable[bytes]):
+        assert process.stdin
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass  # ffmpeg quit, its exit code tells why
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            process.stdin.close()
+
+    feeder = None
+    if piped:
+        feeder = threading.Thread(
+            target=feed, args=(chunks,), name="pypedal-ffmpeg-feed", daemon=True
+        )
+        feeder.start()
+    frame_bytes = 4 * CHANNELS
+    try:
+        while data := process.stdout.read(block_size * frame_bytes):
+            frames = len(data) // frame_bytes
+            audio = numpy.frombuffer(data, numpy.float32, frames * CHANNELS)
+            yield audio.reshape(frames, CHANNELS).T.copy()
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        if feeder:
+            feeder.join()
+
+    if errors:
+        raise errors[0]
+    if process.returncode:
+        raise Exception(f"ffmpeg failed with {process.returncode=}")
+
+
+def decode_file(file: pathlib.Path) -> Tuple["AudioType", float]:
+    """the whole file in memory, for formats pedalboard can't read"""
+    blocks = list(decode(file, options.BLOCK_SIZE))
+    if not blocks:
+        return numpy.zeros((CHANNELS, 0), dtype=numpy.float32), float(SAMPLERATE)
+    return numpy.concatenate(blocks, axis=1), float(SAMPLERATE)
+
+
+def probe_duration(file: pathlib.Path | str) -> float | None:
+    """
+    length of the file in seconds from the header ffmpeg prints,
+    None if it doesn't know (a stream without a duration)
+    """
+    result = subprocess.run(
+        [options.FFMPEG, "-hide_banner", "-i", str(file)],
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+    )
+    # exits with 1 without an output file, the header is printed anyway
+    match = DurationRegex.search(result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+@shares_arrays
+def render_download(
+    part: str,
+    final: str,
+    targets: List[Tuple[str, BoardType[EQTYPES]]],
+    block_size: int,
+    frames: int,
+    counter: "ndarray | None" = None,
+):
+    """
+    `render_files` for a file that's still downloading, runs in the dsp
+    executor. frames is the expected length for progress
+    """
+    if counter is not None:
+        counter[1] = frames
+    chunks = follow_file(pathlib.Path(part), pathlib.Path(final))
+    blocks = counted(decode(chunks, block_size), counter)
+    write_blocks(blocks, SAMPLERATE, CHANNELS, targets)
+
+
+async def render_downloading(
+    video: PartialYoutubeVideo,
+    path: pathlib.Path,
+    board_names: List[BoardType[EQTYPES]],
+    *,
+    progress: ProgressCallback | None = None,
+) -> Dict[BoardType, str]:
+    """
+    Renders the boards while youtube_dl is still downloading to
+    "{path}.part" (see `youtube_download`'s on_info), so it takes about as long
+    as the slower of the two instead of both. \n
+    returns {board_name: file_name} like `Equalizer.run_many`,
+    `register_renders` once the source file is there
+    """
+    file_names: Dict[BoardType, str] = {}
+    targets: List[Tuple[str, BoardType[EQTYPES]]] = []
+    for board_name in board_names:
+        file_name = file_names[board_name] = f"{video.safe_title}-{board_name[1]}"
+        file = options.PROCESSED_FOLDER / f"{file_name}.{video.ext}"
+        targets.append((str(file), board_name))
+
+    duration = getattr(video, "duration", None) or 0
+    log.info(f"rendering {video.id=} while downloading to {path}")
+    await run_dsp(
+        render_download,
+        str(path.with_name(f"{path.name}.part")),
+        str(path),
+        targets,
+        options.BLOCK_SIZE,
+        int(duration * SAMPLERATE),
+        progress=progress,
+    )
+    return file_names
+
+
+def register_renders(video: PartialYoutubeVideo, board_names: List[BoardType[EQTYPES]]):
+    """
+    adds renders of `render_downloading` to `options.render_cache`,
+    the source file must be downloaded (and transcoded) by now
+    """
+    eq = Equalizer(file=Equalizer.source_file(video), video=video)
+    for board_name in board_names:
+        file = (
+            options.PROCESSED_FOLDER / f"{video.safe_title}-{board_name[1]}.{video.ext}"
+        )
+        if key := eq.cache_key(video, board_name):
+            options.render_cache.put(key, file)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Iterator, List
+
+import numpy
+
+from pedalboard import Plugin, Reverb  # type: ignore
+from pedalboard.io import StreamResampler
+
+if TYPE_CHECKING:
+    from numpy import ndarray, dtype, float32
+
+    AudioType = ndarray[Any, dtype[float32]]
+
+
+def sox_reverb(
+    reverberance: float = 50,
+    hf_damping: float = 50,
+    stereo_depth: float = 100,
+    wet_gain: float = 0,
+):
+    """
+    `Reverb` that sounds like sox's `reverb` effect with the same arguments,
+    both are freeverb so only the parameter scaling differs.
+    (sox's pre_delay and room_scale have no equivalent and are left out)
+    """
+    # sox: feedback = 1 - exp((reverberance - b) / (a * b)), juce: 0.7 + 0.28 * room_size
+    a = -1 / numpy.log(1 - 0.3)
+    b = 100 / (numpy.log(1 - 0.98) * a + 1)
+    feedback = 1 - numpy.exp((reverberance - b) / (a * b))
+    # sox: hf_damping * .3 + .2, juce: damping * .4
+    damping = (hf_damping / 100 * 0.3 + 0.2) / 0.4
+    # sox keeps the dry signal as is, juce scales dry by 2 and wet by 3
+    return Reverb(
+        room_size=float(min(max((feedback - 0.7) / 0.28, 0.0), 1.0)),
+        damping=float(min(damping, 1.0)),
+        wet_level=float(10 ** (wet_gain / 20) / 3),
+        dry_level=0.5,
+        width=stereo_depth / 100,
+    )
+
+
+class SlowedReverb:
+    """
+    In-process replacement for `AudioEffectsChain().speed(x).reverb()`.
+    Slows the audio down (pitch goes down with it, like sox's `speed`) by
+    resampling it to `samplerate / speed` and then runs it through the reverb.
+
+    Behaves like a `Pedalboard`, can be called with `reset=False` to stream
+    the audio block by block, `flush` returns what is left afterwards.
+    """
+
+    def __init__(self, speed: float, plugins: List[Plugin] | None = None):
+        self.speed = speed
+        self.plugins = plugins if plugins is not None else [sox_reverb()]
+        self._resampler: StreamResampler | None = None
+        self._channels = 2
+        # of the audio streamed last, for what `flush` returns without a resampler
+
+    def __repr__(self):
+        return f"<{type(self).__name__} speed={self.speed} plugins={self.plugins}>"
+
+    def __iter__(self) -> Iterator[Plugin]:
+        return iter(self.plugins)
+
+    def reset(self):
+        self._resampler = None
+        for plugin in self.plugins:
+            plugin.reset()
+
+    def _resample(self, audio: "AudioType", samplerate: float):
+        resampler = self._resampler
+        self._channels = audio.shape[0]
+        if (
+            resampler is None
+            or resampler.source_sample_rate != samplerate
+            or resampler.num_channels != audio.shape[0]
+        ):
+            self._resampler = resampler = StreamResampler(
+                samplerate, samplerate / self.speed, audio.shape[0]
+            )
+        return resampler.process(audio.astype(numpy.float32, copy=False))
+
+    def _effects(self, audio: "AudioType", samplerate: float, reset: bool):
+        for plugin in self.plugins:
+            audio = plugin(audio, samplerate, reset=reset)
+        return audio
+
+    def __call__(
+        self,
+        audio: "AudioType",
+        sample_rate: float,
+        buffer_size: int = 8192,
+        reset: bool = True,
+    ) -> "AudioType":
+        if not reset:
+            return self._effects(self._resample(audio, sample_rate), sample_rate, False)
+
+        self.reset()
+        slowed = self._resample(audio, sample_rate)
+        assert self._resampler is not None
+        slowed = numpy.concatenate([slowed, self._resampler.process()], axis=1)
+        self._resampler = None
+        return self._effects(slowed, sample_rate, True)
+
+    process = __call__
+
+    def flush(self, sample_rate: float) -> "AudioType":
+        """
+        Returns the audio still buffered in the resampler after streaming
+        """
+        if self._resampler is None:
+            return numpy.zeros((self._channels, 0), dtype=numpy.float32)
+        tail = self._resampler.process()
+        self._resampler = None
+        return self._effects(tail, sample_rate, False)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import asyncio
+import datetime
+import hashlib
+import hmac
+import logging
+import pathlib
+import threading
+import urllib.parse
+from typing import Dict, Tuple
+
+from pypedal.pedal.executors import get_executor
+from pypedal.pedal.upload import Uploader, UploadError
+
+log = logging.getLogger(__name__)
+
+
+def _stat_key(file: pathlib.Path):
+    stat = file.stat()
+    return file.name, stat.st_size, stat.st_mtime_ns
+
+
+class Storage:
+    """
+    Where processed files go once they're rendered, `store` returns the
+    link clients download them from. see `options.storage`
+    """
+
+    async def store(self, file: pathlib.Path) -> str:
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    """
+    Files stay in the processed folder and the app serves them
+    (GET /renders/{name}), nothing is uploaded
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    async def store(self, file: pathlib.Path) -> str:
+        if not file.exists():
+            raise FileNotFoundError(file)
+        return f"{self.base_url}/renders/{urllib.parse.quote(file.name)}"
+
+
+class TransferStorage(Storage):
+    """
+    transfer.sh through `Uploader`,
+    a file that didn't change since its upload gets the same link again
+    """
+
+    def __init__(self, uploader: Uploader):
+        self.uploader = uploader
+        self._links: Dict[Tuple[str, int, int], str] = {}
+
+    async def store(self, file: pathlib.Path) -> str:
+        key = _stat_key(file)
+        if link := self._links.get(key):
+            return link
+        link = self._links[key] = await self.uploader.upload(file)
+        return link
+
+
+class S3Storage(Storage):
+    """
+    Any S3 compatible bucket (aws, minio, r2...), requests are signed with
+    SigV4. objects are named after the contents of the file, a render that's
+    in the bucket already (HEAD) isn't uploaded again. \n
+    the returned link is the object url, the bucket must be readable by clients
+    """
+
+    SERVICE = "s3"
+
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        *,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        timeout: float = 60,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.timeout = timeout
+
+        import requests
+
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+
+    def close(self):
+        self.session.close()
+
+    def object_key(self, file: pathlib.Path) -> str:
+        key = _stat_key(file)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(file, "rb") as f:
+                while chunk := f.read(1 << 20):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            with self._lock:
+                self._digests[key] = digest
+        return f"{digest[:16]}/{file.name}"
+
+    def url(self, key: str):
+        return f"{self.endpoint}/{self.bucket}/{urllib.parse.quote(key)}"
+
+    def sign(self, method: str, url: str, headers: Dict[str, str]):
+        """adds the SigV4 Authorization header (and the ones it covers)"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{now:%Y%m%d}/{self.region}/{self.SERVICE}/aws4_request"
+        parsed = urllib.parse.urlsplit(url)
+        headers.update(
+            {
+                "host": parsed.netloc,
+                "x-amz-date": amz_date,
+                # the body is streamed, it isn't hashed
+                "x-amz-content-sha256": "UNSIGNED-PAYLOAD",
+            }
+        )
+        names = sorted(name.lower() for name in headers)
+        lowered = {name.lower(): value.strip() for name, value in headers.items()}
+        canonical = "\n".join(
+            [
+                method,
+                parsed.path or "/",
+                parsed.query,
+                "".join(f"{name}:{lowered[name]}\n" for name in names),
+                ";".join(names),
+                "UNSIGNED-PAYLOAD",
+            ]
+        )
+        to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                amz_date,
+                scope,
+                hashlib.sha256(canonical.encode()).hexdigest(),
+            ]
+        )
+        key = f"AWS4{self.secret_key}".encode()
+        for part in (f"{now:%Y%m%d}", self.region, self.SERVICE, "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(names)}, Signature={signature}"
+        )
+        return headers
+
+    def _store(self, file: pathlib.Path) -> str:
+        url = self.url(self.object_key(file))
+        response = self.session.head(
+            url, headers=self.sign("HEAD", url, {}), timeout=self.timeout
+        )
+        if response.ok:
+            log.debug(f"{file.name} is in the bucket already")
+            return url
+
+        size = file.stat().st_size
+        headers = self.sign("PUT", url, {"content-length": str(size)})
+        with open(file, "rb") as f:
+            # a file body is streamed with its content-length (s3 wants one)
+            response = self.session.put(
+                url, data=f, headers=headers, timeout=self.timeout
+            )
+        if not response.ok:
+            raise UploadError(f"couldn't upload {file.name}: {response.text}")
+        return url
+
+    async def store(self, file: pathlib.Path) -> str:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(get_executor("io"), self._store, file)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+import pathlib
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator
+
+log = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    """the server didn't take the file, after retrying"""
+
+
+@dataclasses.dataclass
+class UploadMetrics:
+    uploads: int = 0
+    failures: int = 0
+    retries: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    # time spent sending the successful uploads
+
+    def dict(self) -> Dict[str, Any]:
+        return {
+            **dataclasses.asdict(self),
+            "throughput": self.bytes / self.seconds if self.seconds else 0.0,
+        }
+
+
+class Uploader:
+    """
+    Uploads files to a transfer.sh like server (PUT /{name}, the link is
+    the response body) over one pooled session. \n
+    The file is streamed in chunks instead of being read into memory,
+    at most `concurrency` uploads run at once, on threads of the uploader
+    (not the shared io executor), and failed ones (connection errors, 5xx)
+    are retried with exponential backoff awaited on the event loop.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        concurrency: int = 4,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 60,
+    ):
+        self.url = url if url.endswith("/") else f"{url}/"
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.metrics = UploadMetrics()
+
+        # imported with the first uploader, the cli and workers mostly don't upload
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        # its own threads, a slow upload doesn't hold up the downloads on "io"
+        self._executor = ThreadPoolExecutor(
+            concurrency, thread_name_prefix="pypedal-upload"
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def _chunks(self, file: pathlib.Path, sent: list) -> Iterator[bytes]:
+        with open(file, "rb") as f:
+            while chunk := f.read(self.CHUNK_SIZE):
+                sent[0] += len(chunk)
+                yield chunk
+
+    def _put(self, file: pathlib.Path) -> str | None:
+        """one attempt, None if it's worth trying again"""
+        import requests
+
+        url = self.url + urllib.parse.quote(file.name)
+        sent = [0]
+        start = time.monotonic()
+        try:
+            # a generator body is sent chunked, the file is closed with it
+            response = self.session.put(
+                url, data=self._chunks(file, sent), timeout=self.timeout
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            log.warning(f"uploading {file.name} failed: {e!r}")
+            return None
+        if response.status_code >= 500:
+            log.warning(f"uploading {file.name} failed: {response}")
+            return None
+        if not response.ok:
+            raise UploadError(f"couldn't upload {file.name}: {response}")
+
+        with self._lock:
+            self.metrics.uploads += 1
+            self.metrics.bytes += sent[0]
+            self.metrics.seconds += time.monotonic() - start
+        return response.text.strip()
+
+    async def upload(self, file: pathlib.Path) -> str:
+        """returns the download link"""
+        loop = asyncio.get_running_loop()
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    with self._lock:
+                        self.metrics.retries += 1
+                    # waits on the loop, not in a thread of the executor
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                link = await loop.run_in_executor(self._executor, self._put, file)
+                if link is not None:
+                    return link
+            raise UploadError(f"couldn't upload {file.name}")
+        except UploadError:
+            with self._lock:
+                self.metrics.failures += 1
+            raise
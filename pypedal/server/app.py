@@ -1,10 +1,23 @@
 from __future__ import annotations
+import asyncio
 import json
 
 import logging
+import mimetypes
+import pathlib
+import re
+import secrets
 from typing import Optional
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Header
+from fastapi import (
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.responses import HTMLResponse, Response
 from pydantic import ValidationError
 
@@ -14,14 +27,22 @@ from pypedal.pedal import (
     SlowedReverbProcessMode,
     youtube_download,
     upload_local,
+    options,
 )
+from pypedal.pedal.equalizer import part_file
+from pypedal.pedal.executors import get_executor
 
+from . import files
 from . import models
 from . import managers
 
 log = logging.getLogger(__name__)
 app = FastAPI()
 
+RENDER_POLL = 0.1
+# seconds between looking for the file of a render that didn't start yet
+TenantRegex = re.compile(r"[\w.-]{1,64}")
+
 html = """
 <!DOCTYPE html>
 <html>
@@ -66,6 +87,18 @@ html = """
 manager = managers.ConnectionManager()
 
 
+def authorized(config: models.ProductionConfig | None, authorization: str | None):
+    """the production key is needed if there is one"""
+    if not config or not config.PRODUCTION_KEY:
+        return True
+    return secrets.compare_digest(config.PRODUCTION_KEY, authorization or "")
+
+
+async def require_key(request: Request, authorization: Optional[str] = Header(None)):
+    if not authorized(request.app.extra.get("config"), authorization):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
 @app.get("/")
 async def get():
     return HTMLResponse(html)
@@ -73,15 +106,16 @@ async def get():
 
 @app.websocket("/ws")
 async def websocket_endpoint(
-    websocket: WebSocket, authorization: Optional[str] = Header(None)
+    websocket: WebSocket,
+    authorization: Optional[str] = Header(None),
+    x_tenant: Optional[str] = Header(None),
 ):
-    config: models.ProductionConfig = websocket.app.extra["config"]
-    if config.PRODUCTION_KEY:
-        # check for authorization header
-        if config.PRODUCTION_KEY != authorization:
-            return await websocket.close(reason="Unauthorized", code=401)
+    if not authorized(websocket.app.extra.get("config"), authorization):
+        return await websocket.close(reason="Unauthorized", code=401)
+    if x_tenant is not None and not TenantRegex.fullmatch(x_tenant):
+        return await websocket.close(reason="Invalid tenant", code=400)
 
-    id = await manager.connect(websocket)
+    id = await manager.connect(websocket, tenant=x_tenant)
     while True:
         try:
             payload = await websocket.receive_json()
@@ -93,6 +127,18 @@ async def websocket_endpoint(
             return await manager.cleanup(websocket)
 
 
+@app.get("/metrics/scheduler", dependencies=[Depends(require_key)])
+async def scheduler_metrics():
+    """queue lengths and wait times of the job scheduler"""
+    return manager.pm.scheduler.metrics()
+
+
+@app.get("/metrics/uploads", dependencies=[Depends(require_key)])
+async def upload_metrics():
+    """uploads, retries and throughput (bytes per second) of the upload client"""
+    return options.uploader.metrics.dict()
+
+
 @app.post("/youtube/download", response_model=models.STATUSSendPayload)
 async def download(data: models.INITRecievePayload):
     return Response(content="HTTP NOT IMPLEMENTED", status_code=501)
@@ -105,4 +151,53 @@ async def test_run_save(mode: SlowedReverbProcessMode, title: str, file_name: st
 
 @app.post("/youtube/upload")
 async def upload(mode: SlowedReverbProcessMode, title: str):
-    return Response(content="HTTP NOT IMPLEMENTED", status_code=501)
+    """link of a rendered file from `options.storage`, title is the safe title"""
+    if pathlib.Path(title).name != title:
+        return Response(content="Invalid title", status_code=400)
+    try:
+        url = await upload_local(
+            title=title, board_name=(EQProcessMode.SlowedReverb, mode)
+        )
+    except FileNotFoundError:
+        return Response(content="Not rendered", status_code=404)
+    return {"url": url}
+
+
+@app.api_route("/renders/{name}", methods=["GET", "HEAD"])
+async def renders(name: str, request: Request):
+    """processed files, for `options.STORAGE == "local"`"""
+    file = options.PROCESSED_FOLDER / name
+    audio = (mimetypes.guess_type(name)[0] or "").startswith("audio/")
+    if pathlib.Path(name).name != name or not audio or not file.is_file():
+        return Response(content="Not found", status_code=404)
+    if file.stem.endswith(".part"):
+        # still rendering, see /renders/{id}/{mode}
+        return Response(content="Not found", status_code=404)
+    return files.file_response(request, file)
+
+
+@app.get("/renders/{id}/{mode}")
+async def render_stream(id: str, mode: SlowedReverbProcessMode, request: Request):
+    """
+    slowed reverb render of a youtube id, sent while it's still being rendered
+    (chunked transfer, it can be played right away), ranges once it's done
+    """
+    board_name = (EQProcessMode.SlowedReverb, mode)
+    pm = manager.pm
+    video = pm.find_video(id)
+    if video is None:
+        loop = asyncio.get_event_loop()
+        video = await loop.run_in_executor(get_executor("io"), options.metadata.get, id)
+
+    while True:
+        if video is not None:
+            file = options.PROCESSED_FOLDER / f"{video.safe_title}-{mode}.{video.ext}"
+            if file.exists():
+                return files.file_response(request, file)
+            if part_file(file).exists():
+                return files.follow_response(part_file(file), file)
+        if not pm.is_running(id, board_name):
+            return Response(content="Not found", status_code=404)
+        # downloading or waiting for a slot, rendering starts soon
+        await asyncio.sleep(RENDER_POLL)
+        video = video or pm.find_video(id)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import email.utils
+import mimetypes
+import os
+import pathlib
+import re
+from typing import Dict, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from pypedal.pedal.executors import get_executor
+from pypedal.pedal.pipeline import follow_file
+
+RangeRegex = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileRangeResponse(Response):
+    """
+    Sends `length` bytes of file from `offset` in chunks read on the io
+    executor, uvicorn doesn't give apps its socket to sendfile to
+    """
+
+    chunk_size = 1 << 16
+
+    def __init__(
+        self,
+        file: pathlib.Path,
+        *,
+        offset: int,
+        length: int,
+        status_code: int = 200,
+        headers: Dict[str, str] | None = None,
+        head: bool = False,
+    ):
+        super().__init__(status_code=status_code, headers=headers)
+        self.file = file
+        self.offset = offset
+        self.length = length
+        self.head = head
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if self.head or not self.length:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        loop = asyncio.get_event_loop()
+        with open(self.file, "rb") as f:
+            f.seek(self.offset)
+            left = self.length
+            while left:
+                chunk = await loop.run_in_executor(
+                    get_executor("io"), f.read, min(self.chunk_size, left)
+                )
+                if not chunk:
+                    break  # truncated while sending
+                left -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": bool(left),
+                    }
+                )
+            if left:
+                await send({"type": "http.response.body", "body": b""})
+
+
+def parse_range(header: str, size: int) -> Tuple[int, int] | None:
+    """
+    (start, end) of a single "bytes=" range, end inclusive.
+    None if it can't be satisfied, raises ValueError if it isn't one range
+    """
+    match = RangeRegex.match(header.strip())
+    if not match:
+        raise ValueError(f"unsupported range {header!r}")
+    start, end = match.groups()
+    if not start:
+        if not end:
+            raise ValueError(f"unsupported range {header!r}")
+        # the last `end` bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+def etag(stat: os.stat_result):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def file_response(request: Request, file: pathlib.Path) -> Response:
+    """
+    `FileRangeResponse` for a GET or HEAD request of file,
+    with range requests (a single range) and ETag revalidation
+    """
+    stat = file.stat()
+    size, tag = stat.st_size, etag(stat)
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": tag,
+        "last-modified": email.utils.formatdate(stat.st_mtime, usegmt=True),
+        "content-type": mimetypes.guess_type(file.name)[0]
+        or "application/octet-stream",
+    }
+
+    if none_match := request.headers.get("if-none-match"):
+        if none_match.strip() == "*" or tag in map(str.strip, none_match.split(",")):
+            return Response(status_code=304, headers={"etag": tag})
+
+    start, end, status = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == tag):
+        try:
+            satisfiable = parse_range(range_header, size)
+        except ValueError:
+            satisfiable = (0, size - 1)  # multiple ranges, send all of it
+        if satisfiable is None:
+            return Response(
+                status_code=416, headers={"content-range": f"bytes */{size}"}
+            )
+        if satisfiable != (0, size - 1):
+            start, end = satisfiable
+            status = 206
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+    headers["content-length"] = str(end - start + 1)
+    return FileRangeResponse(
+        file,
+        offset=start,
+        length=end - start + 1,
+        status_code=status,
+        headers=headers,
+        head=request.method == "HEAD",
+    )
+
+
+def follow_response(part: pathlib.Path, file: pathlib.Path) -> Response:
+    """
+    Streams (chunked) a file that's still being written to part,
+    until it's renamed to file and sent completely
+    """
+    chunks = follow_file(part, file)
+
+    async def body():
+        loop = asyncio.get_event_loop()
+        try:
+            while chunk := await loop.run_in_executor(
+                get_executor("io"), next, chunks, b""
+            ):
+                yield chunk
+        finally:
+            # "already executing" if the client left while a read was running
+            with contextlib.suppress(ValueError):
+                chunks.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=mimetypes.guess_type(file.name)[0] or "application/octet-stream",
+        # it isn't the whole file, the etag of the finished one comes later
+        headers={"cache-control": "no-store"},
+    )
@@ -1,17 +1,31 @@
 from __future__ import annotations
 
 import asyncio
+import itertools
 import logging
+import pathlib
+import time
 from typing import Any, Dict, List, Tuple
 
 from pydantic import BaseModel
 from fastapi import WebSocket
 
 from pypedal import pedal
-from pypedal.pedal.equalizer import BoardType, upload_local, youtube_download
+from pypedal.jobs import Job, job_key
+from pypedal.pedal import pipeline
+from pypedal.pedal.equalizer import (
+    BoardType,
+    options,
+    upload_local,
+    youtube_download,
+)
+from pypedal.pedal.executors import get_executor
+
+from .scheduler import QueueFull, QueuedCallback, Scheduler
 
 from .models import (
     CANCELRecievePayload,
+    EQStage,
     EQStatus,
     FutureLinkedEvent,
     INITRecievePayload,
@@ -34,6 +48,28 @@ class ProcessManager:
     processes: Dict[str, ProcessModel] = {}
 
     _status: Dict[Tuple[str, BoardType], STATUSSendPayload | None] = {}
+    _done_at: Dict[Tuple[str, BoardType], float] = {}
+    # when the sweeper first saw a status DONE, results expire from then on
+    _sweeper: asyncio.Task | None = None
+    _watchers: Dict[Tuple[str, BoardType], List[WebSocket]] = {}
+    # clients of the jobs in `options.jobs`, statuses reach them through `relay`
+    _relay: asyncio.Task | None = None
+
+    STATUS_INTERVAL = 0.25
+    # seconds between progress broadcasts to the clients of a sub-process
+    SWEEP_INTERVAL = 30
+    # seconds between looking for finished processes and expired results
+
+    @property
+    def scheduler(self) -> Scheduler:
+        """`options.scheduler`, built after `setup` loaded the options"""
+        return options.scheduler
+
+    @staticmethod
+    def admissions(proc: ProcessModel, board_names: List[BoardType]):
+        """of the subs of board_names, the slot they queue for starts them"""
+        subs = [proc.sub[name] for name in board_names if name in proc.sub]
+        return [sub.admission for sub in subs if sub.admission]
 
     def get(self, id: str, /):
         return self.processes.get(id)
@@ -49,6 +85,24 @@ class ProcessManager:
     def get_status(self, id: str, board_name: BoardType, /):
         return self._status.get((id, board_name))
 
+    def find_video(self, id: str, /) -> pedal.PartialYoutubeVideo | None:
+        """the video of a process, as soon as it's known (before it's downloaded)"""
+        proc = self.get(id)
+        if proc is None:
+            return None
+        if proc.video is not None:
+            return proc.video
+        if proc.source and proc.source.done() and not proc.source.cancelled():
+            return proc.source.result()[0]
+        fut = proc.downloading and proc.downloading.future
+        if fut and fut.done() and not fut.cancelled() and not fut.exception():
+            return fut.result()
+        return None
+
+    def is_running(self, id: str, board_name: BoardType, /):
+        payload = self.get_status(id, board_name)
+        return payload is not None and payload.state != "DONE"
+
     def get_eq_progress(self, id: str, board_name: BoardType, /):
         """
         if pedal status is "IN_PROGRESS"
@@ -67,11 +121,24 @@ class ProcessManager:
         """
         id = recieve.data.url
         board_name = recieve.data.board_name
+        self.start_sweeper()
+        if options.jobs:
+            return await self.submit(ws, recieve)
+
+        if id not in self.processes and (result := self.get_status(id, board_name)):
+            if result.state == "DONE" and not (result.failed or result.cancelled):
+                # finished and swept before, the result is all that's left
+                return False
+            self.forget(id, board_name)
 
         if id not in self.processes:
             # create new process
-            sub = SubProcessModel(ws=[ws])
-            self.processes[id] = proc = ProcessModel(url=id, sub={board_name: sub})
+            admission = self.scheduler.admit()
+            tenant = ConnectionManager.tenant(ws)
+            sub = SubProcessModel(ws=[ws], tenant=tenant, admission=admission)
+            self.processes[id] = proc = ProcessModel(
+                url=id, sub={board_name: sub}, tenant=tenant
+            )
             # download video
             proc.background_task = asyncio.create_task(
                 self.background_process(proc, board_name)
@@ -92,6 +159,7 @@ class ProcessManager:
             proc = self.get(id)
             s = self.get_status(id, board_name)
             if proc and s and s.state == "CANCELLED":
+                sub.admission = self.scheduler.admit()
                 sub.background_task = asyncio.create_task(
                     self.background_subprocess(proc, board_name)
                 )
@@ -100,26 +168,186 @@ class ProcessManager:
 
         # process already exists, but not sub_process
         proc = self.processes[id]
-        proc.sub[board_name] = sub = SubProcessModel(ws=[ws])
-        asyncio.create_task(self.background_process(proc, board_name))
-        # this will fire STARTED event
         fut = proc.downloading and proc.downloading.future
-        if fut and fut.done():
-            if fut.cancelled() or fut.exception():
-                # download failed or canceled
-                return False
-                # sending status afterwards
+        if fut and fut.done() and (fut.cancelled() or fut.exception()):
+            # download failed or canceled, nothing to admit or run
+            proc.sub[board_name] = SubProcessModel(
+                ws=[ws], tenant=ConnectionManager.tenant(ws)
+            )
+            self._status[(id, board_name)] = payload = STATUSSendPayload(
+                url=id,
+                board_name=board_name,
+                state="DONE",
+                failed=not fut.cancelled(),
+                cancelled=fut.cancelled(),
+            )
+            await ConnectionManager.send_model(ws, payload)
+            return False
+
+        admission = self.scheduler.admit()
+        proc.sub[board_name] = sub = SubProcessModel(
+            ws=[ws], tenant=ConnectionManager.tenant(ws), admission=admission
+        )
+        # this will fire STARTED event
+        asyncio.create_task(self.background_process(proc, board_name))
         # process video and upload
         sub.background_task = asyncio.create_task(
             self.background_subprocess(proc, board_name)
         )
         return True
 
+    async def submit(
+        self, ws: WebSocket, recieve: WebsocketRecievePayload[INITRecievePayload]
+    ):
+        """
+        init with `options.jobs`, the job is queued in the store for any render
+        worker and its statuses come back through `relay`. \n
+        a job someone asked for before (on any node) isn't queued again
+        """
+        id, board_name = recieve.data.url, recieve.data.board_name
+        store = options.jobs
+        assert store is not None
+        await self.start_relay()
+
+        def submit():
+            known = store.get(job_key(id, board_name))
+            if (not known or known.failed) and store.queued() >= options.MAX_QUEUED:
+                raise QueueFull(f"{options.MAX_QUEUED} jobs are waiting already")
+            job = Job(id, board_name, tenant=ConnectionManager.tenant(ws))
+            return store.submit(job)
+
+        loop = asyncio.get_event_loop()
+        job, _ = await loop.run_in_executor(get_executor("io"), submit)
+        watchers = self._watchers.setdefault((id, board_name), [])
+        if ws not in watchers:
+            watchers.append(ws)
+        if job.status:
+            self._status[(id, board_name)] = STATUSSendPayload(**job.status)
+            return False
+        self._status[(id, board_name)] = payload = STATUSSendPayload(
+            url=id, board_name=board_name, state="STARTED"
+        )
+        await ConnectionManager.send_model(ws, payload)
+        return True
+
+    async def start_relay(self):
+        if self._relay and not self._relay.done():
+            return
+        # subscribed before the job is submitted, none of its statuses are missed
+        loop = asyncio.get_event_loop()
+        cursor, _ = await loop.run_in_executor(
+            get_executor("io"), options.jobs.events, None, 0
+        )
+        if not self._relay or self._relay.done():
+            ProcessManager._relay = asyncio.create_task(self.relay(cursor))
+
+    async def relay(self, cursor: Any = None):
+        """sends the statuses published by the workers to the clients of this node"""
+        store = options.jobs
+        assert store is not None
+        while True:
+            try:
+                async for _, status in store.subscribe(cursor):
+                    payload = STATUSSendPayload(**status)
+                    key = (payload.url, payload.board_name)
+                    self._status[key] = payload
+                    ws = self._watchers.get(key, [])
+                    if payload.state == "DONE":
+                        self._watchers.pop(key, None)
+                    await ConnectionManager.broadcast_model(ws, payload)
+            except Exception as e:
+                log.exception(f"relay {e=}")
+                await asyncio.sleep(self.SWEEP_INTERVAL)
+                cursor = None
+
+    async def fetch_status(self, id: str, board_name: BoardType, /):
+        """`get_status`, or the last one in `options.jobs` if it's another node's"""
+        if (status := self.get_status(id, board_name)) or not options.jobs:
+            return status
+        loop = asyncio.get_event_loop()
+        job = await loop.run_in_executor(
+            get_executor("io"), options.jobs.get, job_key(id, board_name)
+        )
+        return job and job.status and STATUSSendPayload(**job.status)
+
+    def start_sweeper(self):
+        if not self._sweeper or self._sweeper.done():
+            ProcessManager._sweeper = asyncio.create_task(self.sweep_forever())
+
+    async def sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+            try:
+                self.sweep()
+                if options.jobs:
+                    loop = asyncio.get_event_loop()
+                    await loop.run_in_executor(
+                        get_executor("io"), options.jobs.purge, options.RESULT_TTL
+                    )
+            except Exception as e:
+                log.exception(f"sweep {e=}")
+
+    def is_finished(self, proc: ProcessModel):
+        tasks = [proc.background_task]
+        tasks.extend(sub.background_task for sub in proc.sub.values())
+        if any(task and not task.done() for task in tasks):
+            return False
+        statuses = [self.get_status(proc.url, board_name) for board_name in proc.sub]
+        return all(status and status.state == "DONE" for status in statuses)
+
+    def forget(self, id: str, board_name: BoardType):
+        self._status.pop((id, board_name), None)
+        self._done_at.pop((id, board_name), None)
+
+    def sweep(self, now: float | None = None):
+        """
+        Drops finished processes (websockets, futures, video...), only their
+        DONE statuses are kept. those expire after `options.RESULT_TTL` and
+        at most `options.MAX_RESULTS` are kept
+        """
+        now = time.monotonic() if now is None else now
+        for id, proc in list(self.processes.items()):
+            if self.is_finished(proc):
+                log.debug(f"releasing finished process {id}")
+                del self.processes[id]
+
+        for key, watchers in list(self._watchers.items()):
+            active = ConnectionManager.active_connections
+            watchers[:] = [ws for ws in watchers if ws in active]
+            if not watchers:
+                del self._watchers[key]
+
+        for key, status in list(self._status.items()):
+            if status and status.state == "DONE":
+                self._done_at.setdefault(key, now)
+            else:
+                self._done_at.pop(key, None)
+
+        # only results of released processes can go
+        results = sorted(
+            (done_at, key)
+            for key, done_at in self._done_at.items()
+            if key[0] not in self.processes
+        )
+        overflow = len(results) - options.MAX_RESULTS
+        for done_at, key in results:
+            if overflow > 0 or now - done_at > options.RESULT_TTL:
+                overflow -= 1
+                self.forget(*key)
+
     async def cancel(
         self, ws: WebSocket, payload: WebsocketRecievePayload[CANCELRecievePayload]
     ):
         id = payload.data.url
         board_name = payload.data.board_name
+        if options.jobs:
+            # only if nobody else here waits for it, other nodes' clients aren't known
+            if self._watchers.get((id, board_name)) == [ws]:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(
+                    get_executor("io"), options.jobs.cancel, job_key(id, board_name)
+                )
+            return
         proc = self.get(id)
         sub = self.get_subprocess(id, board_name)
         if not proc or not sub:
@@ -151,19 +379,27 @@ class ProcessManager:
                     raise Exception(f"{proc.background_task=} took so long")
                 await asyncio.sleep(0.1)
                 tries += 1
-            if not proc.downloading.event.is_set():
-                # download in progress or failed or canceled
-                fut = proc.downloading.future
-                if fut.done():
-                    # download failed or canceled
-                    # parent process will send status update
-                    return
-            await proc.downloading.event.wait()
+            path = None
+            if proc.source is not None:
+                # pipelined, rendering can start as soon as the download did
+                await asyncio.wait([proc.source])
+                if not proc.source.cancelled():
+                    video, path = proc.source.result()
+            if path is None or proc.downloading.future.done():
+                path = None
+                if not proc.downloading.event.is_set():
+                    # download in progress or failed or canceled
+                    fut = proc.downloading.future
+                    if fut.done():
+                        # download failed or canceled
+                        # parent process will send status update
+                        return
+                await proc.downloading.event.wait()
+                await asyncio.sleep(0)  # yield
+                video = proc.downloading.future.result()
+                log.debug(f"got downloaded event for {video=}")
             payload = self.get_status(proc.url, board_name)
             assert payload
-            await asyncio.sleep(0)  # yield
-            video = proc.downloading.future.result()
-            log.debug(f"got downloaded event for {video=}")
 
             async with sub.lock:
                 payload.state = "IN_PROGRESS"  #
@@ -172,10 +408,15 @@ class ProcessManager:
                 # so setting it to IN_PROGRESS
                 payload.status = EQStatus(stage="processing")
                 await cm.broadcast_model(sub.ws, payload)
-            eq = pedal.Equalizer.read_file(video)
-            sub.processing = FutureLinkedEvent(eq.run(board_name=board_name))
-            await sub.processing.future
-            await eq.write_file(video, board_name=board_name)
+            # boards waiting for the same download are rendered in one batch,
+            # the first subprocess to get here starts it for all of them
+            if not sub.processing or sub.processing.future.done():
+                self.start_processing(proc, video, board_name, path=path)
+            assert sub.processing
+            # shielded, cancelling one sub must not cancel the others' boards
+            await asyncio.shield(sub.processing.future)
+            if path is not None:
+                video = await proc.downloading.future
             async with sub.lock:
                 payload.status.percentage = 100
                 await cm.broadcast_model(sub.ws, payload)
@@ -184,7 +425,7 @@ class ProcessManager:
                 await cm.broadcast_model(sub.ws, payload)
 
             sub.uploading = FutureLinkedEvent(
-                upload_local(video, board_name=board_name)
+                asyncio.ensure_future(self.upload(proc, video, board_name))
             )
             result = await sub.uploading.future
             async with sub.lock:
@@ -215,9 +456,235 @@ class ProcessManager:
                 await cm.broadcast_model(sub.ws, payload)
         except asyncio.CancelledError as e:
             pass
+        finally:
+            if sub.admission:
+                # ended before it got to a stage (failed, cancelled, cached)
+                sub.admission.start()
 
         # kill background notify process
 
+    def start_processing(
+        self,
+        proc: ProcessModel,
+        video: pedal.PartialYoutubeVideo,
+        board_name: BoardType,
+        *,
+        path: pathlib.Path | None = None,
+    ):
+        """
+        Renders board_name and every other sub of proc that hasn't started yet
+        with `Equalizer.run_many`, they share the same processing future. \n
+        with path, renders from the file while it's still downloading there
+        """
+        board_names = [board_name] + [
+            name
+            for name, sub in proc.sub.items()
+            if sub.processing is None and name != board_name
+        ]
+        processing = FutureLinkedEvent(
+            asyncio.ensure_future(self.render_many(proc, video, board_names, path))
+        )
+        for name in board_names:
+            proc.sub[name].processing = processing
+
+    def progress_reporter(self, proc: ProcessModel, board_names: List[BoardType]):
+        """
+        progress callback for the dsp engine, sets `EQStatus.percentage` and
+        broadcasts it at most once per `STATUS_INTERVAL` for every sub
+        """
+        last_sent: Dict[BoardType, float] = {}
+
+        def report(done: int, total: int):
+            percentage = min(done * 100 // total, 100)
+            now = time.monotonic()
+            for board_name in board_names:
+                payload = self.get_status(proc.url, board_name)
+                sub = proc.sub.get(board_name)
+                if not sub or not payload or payload.state != "IN_PROGRESS":
+                    continue
+                if not payload.status or payload.status.stage != "processing":
+                    continue
+                if payload.status.percentage == percentage:
+                    continue
+                if now - last_sent.get(board_name, 0) < self.STATUS_INTERVAL:
+                    continue
+                last_sent[board_name] = now
+                payload.status.percentage = percentage
+                asyncio.ensure_future(self.send_status(sub, payload))
+
+        return report
+
+    def queue_reporter(
+        self, proc: ProcessModel, board_names: List[BoardType], stage: EQStage
+    ) -> QueuedCallback:
+        """
+        sets the subs to QUEUED with their position while waiting
+        for the scheduler, back to IN_PROGRESS once the stage started
+        """
+
+        def report(position: int | None):
+            for board_name in board_names:
+                payload = self.get_status(proc.url, board_name)
+                sub = proc.sub.get(board_name)
+                if not sub or not payload or payload.state == "DONE":
+                    continue
+                if position is None:
+                    payload.state, payload.position = "IN_PROGRESS", None
+                    payload.status = EQStatus(stage=stage)
+                else:
+                    payload.state, payload.position = "QUEUED", position
+                    payload.status = None
+                asyncio.ensure_future(self.send_status(sub, payload))
+
+        return report
+
+    @staticmethod
+    async def send_status(sub: SubProcessModel, payload: STATUSSendPayload):
+        async with sub.lock:
+            await ConnectionManager.broadcast_model(sub.ws, payload)
+
+    def source_reporter(self, proc: ProcessModel):
+        """
+        `youtube_download`'s on_info, resolves `proc.source` from the download
+        thread. path is None if the source is there already, nothing to wait for
+        """
+        loop = asyncio.get_event_loop()
+        source = proc.source
+        assert source is not None
+
+        def resolve(result: Tuple[pedal.YoutubeVideo, pathlib.Path | None]):
+            if not source.done():
+                source.set_result(result)
+
+        def on_info(video: pedal.YoutubeVideo, path: pathlib.Path):
+            if pedal.Equalizer.source_file(video).exists():
+                loop.call_soon_threadsafe(resolve, (video, None))
+            else:
+                loop.call_soon_threadsafe(resolve, (video, path))
+
+        return on_info
+
+    async def download(self, proc: ProcessModel):
+        on_queued = self.queue_reporter(proc, list(proc.sub), "downloading")
+        on_info = proc.source and self.source_reporter(proc)
+        loop = asyncio.get_event_loop()
+        video_id = pedal.parse_youtube_id(proc.url)
+        # the duration is known before the download if we've seen the video before
+        known = video_id and await loop.run_in_executor(
+            get_executor("io"), options.metadata.get, video_id
+        )
+        try:
+            async with self.scheduler.slot(
+                "download",
+                tenant=proc.tenant,
+                cost=known and known.duration or None,
+                on_queued=on_queued,
+                admissions=self.admissions(proc, list(proc.sub)),
+            ):
+                video = await youtube_download(proc.url, on_info=on_info)
+        finally:
+            if proc.source and not proc.source.done():
+                # failed before it started, the subs see it from proc.downloading
+                proc.source.cancel()
+        return video
+
+    async def upload(
+        self,
+        proc: ProcessModel,
+        video: pedal.PartialYoutubeVideo,
+        board_name: BoardType,
+    ):
+        on_queued = self.queue_reporter(proc, [board_name], "uploading")
+        async with self.scheduler.slot(
+            "upload",
+            tenant=proc.sub[board_name].tenant,
+            cost=getattr(video, "duration", None),
+            on_queued=on_queued,
+            admissions=self.admissions(proc, [board_name]),
+        ):
+            return await upload_local(video, board_name=board_name)
+
+    async def render_many(
+        self,
+        proc: ProcessModel,
+        video: pedal.PartialYoutubeVideo,
+        board_names: List[BoardType],
+        path: pathlib.Path | None = None,
+    ):
+        if path is not None:
+            if await self.render_downloading(proc, video, board_names, path):
+                return
+            # the source is complete after the download, render it the usual way
+            video = await proc.downloading.future
+
+        pending = []
+        for board_name in board_names:
+            if await pedal.Equalizer.find_render(video, board_name):
+                # rendered before, no need to decode the source
+                log.debug(f"{video.id=} {board_name=} found in render cache")
+            else:
+                pending.append(board_name)
+        if not pending:
+            return
+
+        on_queued = self.queue_reporter(proc, pending, "processing")
+        duration = getattr(video, "duration", None)
+        async with self.scheduler.slot(
+            "process",
+            # the batch belongs to whoever asked for it first
+            tenant=proc.sub[board_names[0]].tenant,
+            cost=duration and duration * len(pending),
+            on_queued=on_queued,
+            admissions=self.admissions(proc, board_names),
+        ):
+            log.debug(f"rendering {video.id=} with {pending=}")
+            eq = await pedal.Equalizer.aload(video)
+            try:
+                progress = self.progress_reporter(proc, pending)
+                # written block by block whatever the length, the .part files
+                # can be played from /renders/{id}/{mode} while they are written
+                await eq.run_many(pending, video, stream=True, progress=progress)
+            finally:
+                eq.close()
+
+    async def render_downloading(
+        self,
+        proc: ProcessModel,
+        video: pedal.PartialYoutubeVideo,
+        board_names: List[BoardType],
+        path: pathlib.Path,
+    ):
+        """
+        `pipeline.render_downloading` in a process slot,
+        False if it failed (no ffmpeg, broken stream...)
+        """
+        assert proc.downloading
+        on_queued = self.queue_reporter(proc, board_names, "processing")
+        duration = getattr(video, "duration", None)
+        async with self.scheduler.slot(
+            "process",
+            tenant=proc.sub[board_names[0]].tenant,
+            cost=duration and duration * len(board_names),
+            on_queued=on_queued,
+            admissions=self.admissions(proc, board_names),
+        ):
+            log.debug(f"rendering {video.id=} with {board_names=} while downloading")
+            progress = self.progress_reporter(proc, board_names)
+            try:
+                await pipeline.render_downloading(
+                    video, path, board_names, progress=progress
+                )
+            except Exception:
+                log.exception(f"rendering {video.id=} while downloading failed")
+                return False
+
+        video = await proc.downloading.future
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            get_executor("io"), pipeline.register_renders, video, board_names
+        )
+        return True
+
     async def background_process(self, proc: ProcessModel, board_name: BoardType, /):
         """
         Process youtube-id in background, sends status updates to client
@@ -258,7 +725,9 @@ class ProcessManager:
 
         #         await asyncio.sleep(interval)
 
-        proc.downloading = FutureLinkedEvent(youtube_download(proc.url))
+        if options.PIPELINE:
+            proc.source = asyncio.get_event_loop().create_future()
+        proc.downloading = FutureLinkedEvent(asyncio.ensure_future(self.download(proc)))
 
         async with sub.lock:
             payload.state = "IN_PROGRESS"
@@ -309,14 +778,29 @@ class ConnectionManager:
     # queue class ? (for more, check "process" dict variable down below)
 
     active_connections: List[WebSocket] = []
+    tenants: Dict[WebSocket, str] = {}
+    # who the jobs of a connection are scheduled for, see `Scheduler`
+    _ids = itertools.count()
+    # of the connections without a tenant, never reused
     pm = ProcessManager()
 
     def index(self, ws: WebSocket):
         return self.active_connections.index(ws)
 
-    async def connect(self, ws: WebSocket):
+    @classmethod
+    def tenant(cls, ws: WebSocket):
+        return cls.tenants.get(ws) or f"connection-{id(ws)}"
+
+    async def connect(self, ws: WebSocket, *, tenant: str | None = None):
+        """
+        tenant is the name the client gave itself (X-Tenant header) to share
+        its fair share between its connections and get its PYPEDAL_TENANT_WEIGHTS,
+        otherwise every connection gets its fair share on its own.
+        never a secret, it shows up in the metrics and the job store
+        """
         await ws.accept()
         self.active_connections.append(ws)
+        self.tenants[ws] = tenant or f"connection-{next(self._ids)}"
         idx = self.active_connections.index(ws)
         log.info(f"Client#{idx} connected")
         return idx
@@ -328,6 +812,7 @@ class ConnectionManager:
     async def cleanup(self, ws):
         idx = self.active_connections.index(ws)
         self.active_connections.pop(idx)
+        self.tenants.pop(ws, None)
         # TODO: cancell process of ws
         log.info(f"Client#{idx} disconnected")
 
@@ -366,7 +851,11 @@ class ConnectionManager:
         data.url
 
         if op == "INIT" and isinstance(data, INITRecievePayload):
-            if await self.pm.init(ws, payload):  # type: ignore
+            try:
+                initialized = await self.pm.init(ws, payload)  # type: ignore
+            except QueueFull as e:
+                return await self.internal_error(ws, f"server is busy, {e}", code=503)
+            if initialized:
                 # init successful
                 # start a background task that will send status updates to client
                 return
@@ -374,13 +863,16 @@ class ConnectionManager:
             # process initialized before, check background_task
             sub = self.pm.get_subprocess(data.url, data.board_name)
             if not sub:
+                # finished and released, send the result
+                if status := self.pm.get_status(data.url, data.board_name):
+                    await self.send_model(ws, status)
                 return
             async with sub.lock:
                 if status := self.pm.get_status(data.url, data.board_name):
                     await self.send_model(ws, status)
         elif op == "STATUS" and isinstance(data, STATUSRecievePayload):
             # send status to connection every 5 seconds interval
-            if status := self.pm.get_status(data.url, data.board_name):
+            if status := await self.pm.fetch_status(data.url, data.board_name):
                 await self.send_model(ws, status)
         elif op == "CANCEL" and isinstance(data, CANCELRecievePayload):
             return await self.pm.cancel(ws, payload)  # type: ignore
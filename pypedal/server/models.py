@@ -3,13 +3,16 @@ from __future__ import annotations
 import asyncio
 import os
 import dataclasses
+import pathlib
 from typing import (
+    TYPE_CHECKING,
     Generic,
     List,
     Literal,
     Any,
     Dict,
     Optional,
+    Tuple,
     TypeVar,
 )
 
@@ -19,6 +22,9 @@ from pydantic import BaseModel, validator, root_validator
 from pypedal import pedal
 from pypedal.pedal import PartialYoutubeVideo, YoutubeVideo
 
+if TYPE_CHECKING:
+    from .scheduler import Admission
+
 
 class ProductionConfig(BaseModel):
     PRODUCTION_ENV: Literal["production", "closed-beta", "open-beta"] = os.getenv("PRODUCTION_ENV")  # type: ignore
@@ -31,11 +37,14 @@ class ProductionConfig(BaseModel):
         return v
 
 
+EQStage = Literal["downloading", "processing", "uploading"]
+
+
 class EQStatus(BaseModel):
     # TODO: change name to EQProgress
-    stage: Literal["downloading", "processing", "uploading"]
+    stage: EQStage
     percentage: Optional[int] = None
-    # percentage is not supported currently
+    # 0-100, reported while processing. see `ProcessManager.progress_reporter`
 
 
 # client sends this to server
@@ -76,7 +85,10 @@ class SendPayload(BaseModel):
 class STATUSSendPayload(SendPayload):
     url: str
     board_name: pedal.BoardType
-    state: Literal["STARTED", "IN_PROGRESS", "DONE"]
+    state: Literal["STARTED", "QUEUED", "IN_PROGRESS", "DONE"]
+    # QUEUED: waiting for a free slot, see `position`
+    position: Optional[int] = None
+    # place in the queue of the stage, 0 is next
     cancelled: bool = False
     failed: bool = False
     result: Optional[str] = None
@@ -124,6 +136,7 @@ class INTERNAL_ERROR_Payload(SendPayload):
     ## Internal Error
     ### code 1: `Unknown error`
     ### code 2: `Validation error`
+    ### code 503: `Server is busy`, too many jobs are queued. try again later
     """
 
     message: str
@@ -178,6 +191,10 @@ class SubProcessModel:
     uploading: FutureLinkedEvent[str] | None = None
     background_task: asyncio.Task | None = None
     lock: asyncio.Lock = dataclasses.field(default_factory=asyncio.Lock)
+    tenant: str | None = None
+    # client the jobs are scheduled for, see `ConnectionManager.tenant`
+    admission: Admission | None = None
+    # counted by the scheduler until the job is in a stage, see `Scheduler.admit`
 
 
 @dataclasses.dataclass
@@ -188,4 +205,8 @@ class ProcessModel(Generic[pedal.EQTYPES]):
     )
     video: Optional[PartialYoutubeVideo] = None
     downloading: FutureLinkedEvent[YoutubeVideo] | None = None
+    source: asyncio.Future[Tuple[YoutubeVideo, pathlib.Path | None]] | None = None
+    # with `options.PIPELINE`, (video, path) as soon as the download starts,
+    # path is None if there is nothing to render from while it's downloading
     background_task: asyncio.Task | None = None
+    tenant: str | None = None
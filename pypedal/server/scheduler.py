@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import collections
+import contextlib
+import dataclasses
+import itertools
+import logging
+import os
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Counter,
+    DefaultDict,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Literal,
+)
+
+from pypedal.pedal.equalizer import options
+
+log = logging.getLogger(__name__)
+
+Stage = Literal["download", "process", "upload"]
+QueuedCallback = Callable[["int | None"], Any]
+# called with the position in the queue (0 is next), None once the job started
+
+DEFAULT_COST = 180.0
+# seconds, cost of a job when the duration of the track isn't known yet
+
+
+class QueueFull(Exception):
+    """the scheduler doesn't take more jobs, try again later"""
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """ "paid=3,batch=0.5" to {"paid": 3.0, "batch": 0.5}"""
+    weights = {}
+    for pair in filter(None, (pair.strip() for pair in value.split(","))):
+        name, _, weight = pair.partition("=")
+        if not name or not weight:
+            raise ValueError(f"{pair!r} isn't tenant=weight")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+@dataclasses.dataclass(order=True)
+class _Waiting:
+    finish: float
+    seq: int
+    start: float = dataclasses.field(compare=False)
+    tenant: Hashable = dataclasses.field(compare=False)
+    ticket: asyncio.Future[None] = dataclasses.field(compare=False)
+    on_queued: QueuedCallback | None = dataclasses.field(compare=False)
+    queued_at: float = dataclasses.field(compare=False)
+
+
+@dataclasses.dataclass
+class _Waits:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "avg": self.total / self.count if self.count else 0.0,
+        }
+
+
+class _Stage:
+    def __init__(self, name: Stage, limit: int):
+        self.name = name
+        self.limit = limit
+        self.running = 0
+        self.waiting: List[_Waiting] = []
+        # sorted by finish tag, the next job to run is first
+
+        self.virtual = 0.0
+        # start tag of the last started job
+        self.finish: Dict[Hashable, float] = {}
+        # finish tag of the last job of every tenant
+        self.waits = _Waits()
+        self.tenant_waits: DefaultDict[Hashable, _Waits] = collections.defaultdict(
+            _Waits
+        )
+        self.jobs: Counter[Hashable] = collections.Counter()
+        # queued or running jobs of every tenant, the others are forgotten
+
+    def enter(self, tenant: Hashable):
+        self.jobs[tenant] += 1
+
+    def leave(self, tenant: Hashable):
+        """
+        once a tenant has no jobs left its tags and waits go, tenants are
+        per connection and would pile up. its next job starts at `virtual`
+        """
+        self.jobs[tenant] -= 1
+        if self.jobs[tenant] <= 0:
+            del self.jobs[tenant]
+            self.finish.pop(tenant, None)
+            self.tenant_waits.pop(tenant, None)
+
+    def tag(self, tenant: Hashable, cost: float, weight: float):
+        start = max(self.virtual, self.finish.get(tenant, 0.0))
+        self.finish[tenant] = finish = start + cost / weight
+        return start, finish
+
+    def notify_positions(self, first: int = 0):
+        """tells the jobs from `first` on about their (new) positions"""
+        for position in range(first, len(self.waiting)):
+            waiting = self.waiting[position]
+            if waiting.on_queued:
+                waiting.on_queued(position)
+
+
+class Admission:
+    """
+    a job `Scheduler.admit` let in, it counts as waiting until it's queued
+    for (or running) a stage. `Scheduler.slot` starts it then, the job has
+    to `start` it itself if it ends before it got to any stage
+    """
+
+    def __init__(self, scheduler: Scheduler):
+        self._scheduler = scheduler
+        self.started = False
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            self._scheduler.admitted -= 1
+
+
+class Scheduler:
+    """
+    Limits how many downloads, renders and uploads run at once,
+    the rest wait in line for their stage. \n
+    The line is weighted fair between tenants (see `ConnectionManager.tenant`):
+    every tenant gets `weight` share of the slots and cheaper jobs (shorter
+    tracks) go first, so a tenant with 50 jobs doesn't starve the others. \n
+    `admit` rejects new jobs once `max_queued` jobs are waiting, so a burst
+    of requests can't pile up unbounded work.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[Stage, int] | None = None,
+        max_queued: int | None = None,
+        weights: Dict[Hashable, float] | None = None,
+    ):
+        if limits is None:
+            limits = {
+                "download": options.DOWNLOAD_WORKERS,
+                "process": options.PROCESS_WORKERS,
+                "upload": options.UPLOAD_WORKERS,
+            }
+        self.stages = {name: _Stage(name, limit) for name, limit in limits.items()}
+        self.max_queued = options.MAX_QUEUED if max_queued is None else max_queued
+        if weights is None:
+            weights = parse_weights(os.getenv("PYPEDAL_TENANT_WEIGHTS") or "")
+        self.weights: Dict[Hashable, float] = weights
+        # tenant -> weight, 1 if not set. "paid=3,batch=0.5" in the env
+        self.admitted = 0
+        # jobs let in by `admit` that aren't in any stage yet
+        self._seq = itertools.count()
+
+    @property
+    def queued(self):
+        return sum(len(stage.waiting) for stage in self.stages.values())
+
+    @property
+    def running(self):
+        return sum(stage.running for stage in self.stages.values())
+
+    def admit(self) -> Admission:
+        """
+        raises `QueueFull` if a new job would only make the queue longer,
+        the ones admitted before that didn't get to a stage yet count too
+        """
+        waiting = self.queued + self.admitted
+        if waiting >= self.max_queued:
+            raise QueueFull(f"{waiting} jobs are waiting already")
+        self.admitted += 1
+        return Admission(self)
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self,
+        name: Stage,
+        *,
+        tenant: Hashable = None,
+        cost: float | None = None,
+        on_queued: QueuedCallback | None = None,
+        admissions: Iterable[Admission] = (),
+    ) -> AsyncIterator[None]:
+        """
+        Waits for a free slot of the stage, cost is the duration of the track
+        in seconds if known. `on_queued` is told about the position while waiting,
+        admissions of the job(s) are started once it's queued or running
+        """
+        stage = self.stages[name]
+        start, finish = stage.tag(
+            tenant, cost or DEFAULT_COST, self.weights.get(tenant, 1.0)
+        )
+        stage.enter(tenant)
+        try:
+            if stage.running < stage.limit and not stage.waiting:
+                stage.running += 1
+                stage.virtual = start
+                stage.waits.add(0.0)
+                stage.tenant_waits[tenant].add(0.0)
+                for admission in admissions:
+                    admission.start()
+            else:
+                await self._wait(stage, start, finish, tenant, on_queued, admissions)
+
+            try:
+                yield
+            finally:
+                self._release(stage)
+        finally:
+            stage.leave(tenant)
+
+    async def _wait(
+        self,
+        stage: _Stage,
+        start: float,
+        finish: float,
+        tenant: Hashable,
+        on_queued: QueuedCallback | None,
+        admissions: Iterable[Admission],
+    ):
+        """queues the job for the stage until `_release` hands a slot over"""
+        ticket: asyncio.Future[None] = asyncio.get_event_loop().create_future()
+        waiting = _Waiting(
+            finish,
+            next(self._seq),
+            start,
+            tenant,
+            ticket,
+            on_queued,
+            time.monotonic(),
+        )
+        position = bisect.bisect(stage.waiting, waiting)
+        stage.waiting.insert(position, waiting)
+        for admission in admissions:
+            admission.start()
+        log.debug(f"queued for {stage.name} at {position=}, {tenant=}")
+        stage.notify_positions(position)
+        try:
+            # the slot is handed over by `_release`, running is counted already
+            await ticket
+        except asyncio.CancelledError:
+            if ticket.done() and not ticket.cancelled():
+                self._release(stage)
+            else:
+                position = stage.waiting.index(waiting)
+                del stage.waiting[position]
+                stage.notify_positions(position)
+            raise
+        if on_queued:
+            on_queued(None)
+
+    def _release(self, stage: _Stage):
+        while stage.waiting:
+            waiting = stage.waiting.pop(0)
+            if waiting.ticket.done():
+                continue
+            stage.virtual = waiting.start
+            waited = time.monotonic() - waiting.queued_at
+            stage.waits.add(waited)
+            stage.tenant_waits[waiting.tenant].add(waited)
+            waiting.ticket.set_result(None)
+            stage.notify_positions()
+            return
+        stage.running -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        queue wait times (seconds) of every stage, and of the tenants
+        with jobs queued or running, for tuning
+        """
+        return {
+            name: {
+                "limit": stage.limit,
+                "running": stage.running,
+                "queued": len(stage.waiting),
+                "wait": stage.waits.dict(),
+                "tenants": {
+                    str(tenant): waits.dict()
+                    for tenant, waits in stage.tenant_waits.items()
+                },
+            }
+            for name, stage in self.stages.items()
+        }
@@ -24,11 +24,12 @@ setup(
     extras_require={
         "dev": dev_requirements,
         "tests": tests_requirements,
+        "redis": ["redis"],
     },
     python_requires=">=3.8.5",
     entry_points={
         "console_scripts": [
-            "pypedal=pypedal.pedal.equalizer:app",
+            "pypedal=pypedal.pedal.cli:app",
         ],
     },
 )
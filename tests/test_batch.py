@@ -0,0 +1,101 @@
+import json
+import pathlib
+
+import numpy
+import pytest
+
+from pedalboard.io import WriteableAudioFile
+
+from pypedal.pedal import batch as batch_module
+from pypedal.pedal.batch import (
+    Batch,
+    completed,
+    open_manifest,
+    parse_board,
+    parse_entries,
+)
+from pypedal.pedal.equalizer import options
+from pypedal.pedal.modes import (
+    EQProcessMode,
+    ResampleProcessMode,
+    SlowedReverbProcessMode,
+)
+from pypedal.pedal.models import PartialYoutubeVideo
+
+LOW = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Low)
+HIGH = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.High)
+DOWN = (EQProcessMode.Resample, ResampleProcessMode.Down)
+
+
+def test_parse_entries():
+    lines = [
+        "# backfill",
+        "https://youtu.be/noise000000 slowed-reverb:high resample:down",
+        "",
+        "noise000001",
+        "https://www.youtube.com/watch?v=noise000002 slowed_reverb:085",
+    ]
+    assert list(parse_entries(lines, [LOW])) == [
+        ("https://youtu.be/noise000000", [HIGH, DOWN]),
+        ("noise000001", [LOW]),
+        ("https://www.youtube.com/watch?v=noise000002", [LOW]),
+    ]
+    assert parse_board("PITCH_SHIFT:55_08")[1].name == "High"
+
+    with pytest.raises(ValueError, match="line 2"):
+        list(parse_entries(["noise000000", "noise000001 slowed_reverb:max"], [LOW]))
+    with pytest.raises(ValueError, match="no level"):
+        parse_board("slowed_reverb")
+
+
+@pytest.fixture
+def videos(tmp_path, monkeypatch):
+    """youtube_download of noise, downloads of "broken" links fail"""
+    options.__init__(tmp_path)
+    downloads = []
+
+    async def download(link):
+        if "broken" in link:
+            raise Exception("video unavailable")
+        downloads.append(link)
+        video = PartialYoutubeVideo(id=link, title=f"noise {link}", ext="wav")
+        audio = numpy.random.default_rng(0).standard_normal((2, 4410)) * 0.1
+        file = options.FOLDER / f"{video.file_name}.{video.ext}"
+        with WriteableAudioFile(str(file), 44100, 2) as f:
+            f.write(audio.astype(numpy.float32))
+        return video
+
+    monkeypatch.setattr(batch_module, "youtube_download", download)
+    yield downloads
+    options.__init__()
+
+
+async def test_batch_resumes(videos, tmp_path):
+    manifest = tmp_path / "batch.jsonl"
+    entries = [
+        ("noise000000", [LOW, HIGH]),
+        ("broken00000", [LOW]),
+        ("noise000000", [HIGH]),
+    ]
+    with open_manifest(manifest) as f:
+        counts = await Batch(f, downloads=2, workers=1).run(entries)
+    assert counts == {"done": 2, "failed": 1, "skipped": 0}
+    assert videos == ["noise000000"]  # once for both lines
+
+    records = [json.loads(line) for line in manifest.read_text().splitlines()]
+    done = [record for record in records if record["state"] == "done"]
+    assert {record["level"] for record in done} == {"085", "07"}
+    assert all(pathlib.Path(record["result"]).exists() for record in done)
+    (failed,) = [record for record in records if record["state"] == "failed"]
+    assert failed["id"] == "broken00000" and "unavailable" in failed["error"]
+
+    # a crash cut the last line off, the rest is resumed
+    with open(manifest, "a") as f:
+        f.write('{"id": "noise0')
+    entries.append(("noise000001", [LOW]))
+    with open_manifest(manifest) as f:
+        batch = Batch(f, done=completed(manifest))
+        counts = await batch.run(entries)
+    assert counts == {"done": 1, "failed": 1, "skipped": 3}
+    assert videos == ["noise000000", "noise000001"]
+    assert json.loads(manifest.read_text().splitlines()[-1])["state"]
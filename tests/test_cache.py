@@ -0,0 +1,353 @@
+import threading
+import time
+
+import numpy
+import pytest
+import youtube_dl
+
+from pedalboard.io import WriteableAudioFile
+
+from pypedal.pedal.cache import AudioCache, MetadataStore, RenderCache, SourceCache
+from pypedal.pedal.equalizer import Equalizer, options, upload_local, youtube_download
+from pypedal.pedal.modes import (
+    EQProcessMode,
+    ResampleProcessMode,
+    SlowedReverbProcessMode,
+)
+from pypedal.pedal.models import PartialYoutubeVideo, YoutubeVideo
+
+RESAMPLE_BOARD = (EQProcessMode.Resample, ResampleProcessMode.Up)
+SLOWED_BOARD = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Low)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RenderCache(tmp_path / "processed", budget=100)
+
+
+def rendered(cache: RenderCache, name: str, size: int):
+    cache.folder.mkdir(exist_ok=True)
+    file = cache.folder / name
+    file.write_bytes(b"0" * size)
+    return file
+
+
+def test_key(cache, tmp_path):
+    source = tmp_path / "source.mp3"
+    source.write_bytes(b"first")
+    key = cache.key("id", source, RESAMPLE_BOARD)
+    assert key == cache.key("id", source, RESAMPLE_BOARD)
+    assert key != cache.key("other", source, RESAMPLE_BOARD)
+    assert key != cache.key("id", source, SLOWED_BOARD)
+
+    source.write_bytes(b"second")
+    assert key != cache.key("id", source, RESAMPLE_BOARD)
+
+
+def test_hits_and_misses(cache):
+    assert cache.get("a") is None
+    file = rendered(cache, "a.mp3", 10)
+    cache.put("a", file)
+    assert cache.get("a") == file
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_eviction(cache):
+    for name in "abc":
+        cache.put(name, rendered(cache, f"{name}.mp3", 30))
+    # "b" is the least recently used after this, "a" was used just now
+    cache.get("a")
+    cache.put("d", rendered(cache, "d.mp3", 30))
+
+    assert cache.get("b") is None
+    assert not (cache.folder / "b.mp3").exists()
+    assert cache.size <= cache.budget
+    assert len(cache) == 3
+
+    reloaded = RenderCache(cache.folder, cache.budget)
+    assert reloaded.get("a") and reloaded.get("c") and reloaded.get("d")
+
+
+def test_shared_index(cache):
+    # a server and a worker rendering into the same folder
+    other = RenderCache(cache.folder, cache.budget)
+    cache.put("a", rendered(cache, "a.mp3", 30))
+    other.put("b", rendered(cache, "b.mp3", 30))
+    cache.put("c", rendered(cache, "c.mp3", 30))
+    assert len(cache) == len(other) == 3
+
+    # a hit in one process is recent for the others and after a restart,
+    # once its last use is written
+    assert other.get("a")
+    other.flush()
+    cache.put("d", rendered(cache, "d.mp3", 30))
+    assert other.get("b") is None
+    assert RenderCache(cache.folder, cache.budget).get("a")
+
+
+def test_overwritten_file(cache):
+    cache.put("old", rendered(cache, "a.mp3", 10))
+    cache.put("new", rendered(cache, "a.mp3", 10))
+    assert cache.get("old") is None
+    assert len(cache) == 1
+
+
+def test_hits_are_written_in_batches(cache, monkeypatch):
+    monkeypatch.setattr(RenderCache, "FLUSH_SIZE", 2)
+    for name in "ab":
+        cache.put(name, rendered(cache, f"{name}.mp3", 10))
+    other = RenderCache(cache.folder, cache.budget)
+
+    def used():
+        return dict(other._connect().execute("SELECT key, used FROM entries"))
+
+    before = used()
+    cache.get("b")
+    assert used() == before
+    cache.get("a")
+    after = used()
+    assert after["a"] > after["b"] > before["b"]
+
+
+async def test_deleted_file(tmp_path):
+    options.__init__(tmp_path)
+    options.STORAGE = "local"
+    board_name = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Low)
+    file = options.PROCESSED_FOLDER / f"song-{board_name[1]}.mp3"
+    try:
+        options.render_cache.put("a", rendered(options.render_cache, file.name, 10))
+        file.unlink()
+        # lookups don't stat the file, whoever opens it finds it gone
+        assert options.render_cache.get("a") == file
+        with pytest.raises(FileNotFoundError):
+            await upload_local(title="song", board_name=board_name)
+        assert options.render_cache.get("a") is None
+    finally:
+        options.__init__()
+
+
+async def test_equalizer_cache(tmp_path):
+    options.__init__(tmp_path)
+    video = PartialYoutubeVideo(id="noise000000", title="noise", ext="wav")
+    audio = numpy.random.default_rng(0).standard_normal((2, 4410)) * 0.1
+    file = options.FOLDER / f"{video.file_name}.{video.ext}"
+    with WriteableAudioFile(str(file), 44100, 2) as f:
+        f.write(audio.astype(numpy.float32))
+
+    try:
+        await Equalizer.open_file(video).stream(video, RESAMPLE_BOARD)
+        await Equalizer.open_file(video).stream(video, RESAMPLE_BOARD)
+        assert (options.cache_hits, options.cache_misses) == (1, 1)
+
+        # hits are returned as a path, nothing is decoded or written again
+        eq = Equalizer.read_file(video)
+        rendered = await eq.run(board_name=RESAMPLE_BOARD)
+        assert options.cache_hits == 2
+        file_name = f"noise-{RESAMPLE_BOARD[1]}"
+        assert rendered == options.PROCESSED_FOLDER / f"{file_name}.wav"
+        assert RESAMPLE_BOARD not in eq.done
+        mtime = rendered.stat().st_mtime_ns
+        assert await eq.save_local(video, RESAMPLE_BOARD) == file_name
+        assert rendered.stat().st_mtime_ns == mtime
+
+        assert await Equalizer.find_render(video, RESAMPLE_BOARD) == rendered
+        assert not await Equalizer.find_render(video, SLOWED_BOARD)
+    finally:
+        options.__init__()
+
+
+def test_audio_cache_decodes_once():
+    cache = AudioCache(budget=0)
+    calls = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.05)
+        return numpy.zeros((2, 100), numpy.float32), 44100.0
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.acquire("a", load)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert cache.refs("a") == 4
+    audio, samplerate = results[0]
+    assert samplerate == 44100.0
+    assert all(numpy.shares_memory(audio, other) for other, _ in results)
+    with pytest.raises(ValueError):
+        audio[0, 0] = 1
+
+    # kept while used even if over budget
+    for _ in range(3):
+        cache.release("a")
+    assert len(cache) == 1
+    cache.release("a")
+    assert len(cache) == 0
+
+
+def test_audio_cache_load_error():
+    cache = AudioCache(budget=1024)
+
+    def load():
+        raise OSError("broken file")
+
+    with pytest.raises(OSError):
+        cache.acquire("a", load)
+    assert len(cache) == 0
+
+
+def test_read_file_shares_audio(tmp_path):
+    options.__init__(tmp_path)
+    video = PartialYoutubeVideo(id="noise000000", title="noise", ext="wav")
+    file = options.FOLDER / f"{video.file_name}.{video.ext}"
+    with WriteableAudioFile(str(file), 44100, 2) as f:
+        f.write(numpy.zeros((2, 4410), numpy.float32))
+
+    try:
+        first, second = Equalizer.read_file(video), Equalizer.read_file(video)
+        assert numpy.shares_memory(first.audio, second.audio)
+        assert options.audio_cache.misses == 1
+        assert options.audio_cache.refs((video.id,) + key_of(file)) == 2
+
+        first.close()
+        del second
+        assert options.audio_cache.refs((video.id,) + key_of(file)) == 0
+    finally:
+        options.__init__()
+
+
+def key_of(file):
+    stat = file.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def youtube_video(id: str = "dQw4w9WgXcQ"):
+    return YoutubeVideo(
+        id=id,
+        title="song",
+        display_id=id,
+        uploader="uploader",
+        upload_date="20091025",
+        uploader_id="uploader",
+        channel="channel",
+        channel_id="channel",
+        duration=212,
+        view_count=1,
+        like_count=1,
+        age_limit=0,
+        format="251 - audio only",
+        format_id="251",
+        format_note="tiny",
+    )
+
+
+def test_source_cache(tmp_path):
+    sources = SourceCache(tmp_path)
+    video = youtube_video()
+    assert sources.get(video.id) is None
+
+    file = tmp_path / f"{video.file_name}.mp3"
+    file.write_bytes(b"mp3")
+    sources.put(video.id, video, file)
+    cached = sources.get(video.id)
+    assert cached is not None
+    assert (cached.id, cached.file_name, cached.duration) == (
+        video.id,
+        video.file_name,
+        212,
+    )
+
+    file.unlink()
+    assert sources.get(video.id) is None
+    assert (sources.hits, sources.misses) == (1, 2)
+
+
+def test_source_cache_lock(tmp_path):
+    sources = SourceCache(tmp_path)
+    inside, overlapped = [], []
+
+    def download():
+        with sources.lock("id"):
+            if inside:
+                overlapped.append(True)
+            inside.append(True)
+            time.sleep(0.05)
+            inside.pop()
+
+    threads = [threading.Thread(target=download) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not overlapped
+
+
+async def test_download_hit_skips_youtube(tmp_path, monkeypatch):
+    options.__init__(tmp_path)
+    try:
+        video = youtube_video()
+        file = Equalizer.source_file(video)
+        file.write_bytes(b"mp3")
+        options.source_cache.put(video.id, video, file)
+
+        def offline(*args, **kwargs):
+            raise AssertionError("asked youtube for a cached video")
+
+        monkeypatch.setattr(youtube_dl, "YoutubeDL", offline)
+        infos = []
+        result = await youtube_download(
+            video.url, on_info=lambda *info: infos.append(info)
+        )
+        assert result.id == video.id
+        assert infos == [(result, file)]
+    finally:
+        options.__init__()
+
+
+def test_metadata_store(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.sqlite3", ttl=60)
+    videos = [youtube_video(f"video{i:06d}") for i in range(3)]
+    for video in videos:
+        store.put(video)
+    store.close()
+
+    # a restarted worker has them too
+    store = MetadataStore(tmp_path / "metadata.sqlite3", ttl=60)
+    cached = store.get(videos[0].id)
+    assert cached is not None
+    assert (cached.file_name, cached.duration) == (videos[0].file_name, 212)
+
+    found = store.get_many([video.id for video in videos] + ["unknown0000"])
+    assert sorted(found) == sorted(video.id for video in videos)
+    assert (store.hits, store.misses) == (4, 1)
+
+    store.ttl = -1
+    assert store.get(videos[0].id) is None
+    store.close()
+
+
+async def test_download_on_disk_skips_youtube(tmp_path, monkeypatch):
+    options.__init__(tmp_path)
+    try:
+        video = youtube_video()
+        file = Equalizer.source_file(video)
+        file.write_bytes(b"mp3")
+        options.metadata.put(video)
+
+        def offline(*args, **kwargs):
+            raise AssertionError("asked youtube for a known video")
+
+        monkeypatch.setattr(youtube_dl, "YoutubeDL", offline)
+        result = await youtube_download(video.url)
+        assert result.file_name == video.file_name
+        # and it's in the source cache from now on
+        assert options.source_cache.get(video.id) is not None
+    finally:
+        options.metadata.close()
+        options.__init__()
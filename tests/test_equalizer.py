@@ -0,0 +1,207 @@
+import asyncio
+import shutil
+import subprocess
+import time
+
+import numpy
+import pytest
+
+from pedalboard.io import ReadableAudioFile, WriteableAudioFile
+
+from pypedal.pedal.equalizer import Equalizer, options, process_blocks
+from pypedal.pedal.modes import (
+    EQProcessMode,
+    PitchShiftProcessMode,
+    ResampleProcessMode,
+    SlowedReverbProcessMode,
+)
+from pypedal.pedal.models import PartialYoutubeVideo
+from pypedal.pedal.plugins import SlowedReverb
+
+SAMPLERATE = 44100
+RESAMPLE_BOARD = (EQProcessMode.Resample, ResampleProcessMode.Up)
+PITCH_SHIFT_BOARD = (EQProcessMode.PitchShift, PitchShiftProcessMode.Low)
+
+
+@pytest.fixture
+def file_options(tmp_path):
+    options.__init__(tmp_path)
+    yield options
+    options.__init__()
+
+
+@pytest.fixture
+def video(file_options):
+    video = PartialYoutubeVideo(id="sine0000000", title="sine", ext="wav")
+    seconds = numpy.arange(SAMPLERATE * 3) / SAMPLERATE
+    mono = numpy.sin(2 * numpy.pi * 440 * seconds)
+    audio = numpy.stack([mono, mono]).astype(numpy.float32)
+    file = file_options.FOLDER / f"{video.file_name}.{video.ext}"
+    with WriteableAudioFile(str(file), SAMPLERATE, 2) as f:
+        f.write(audio * 0.3)
+    return video
+
+
+def read(video: PartialYoutubeVideo, file_name: str):
+    with ReadableAudioFile(f"{options.PROCESSED_FOLDER}/{file_name}.{video.ext}") as f:
+        return f.read(f.frames)
+
+
+async def test_stream_matches_run(video):
+    eq = Equalizer.read_file(video)
+    expected = await eq.run(board_name=RESAMPLE_BOARD)
+
+    streaming = Equalizer.open_file(video)
+    assert streaming.audio is None
+    assert streaming.frames == eq.frames
+    file_name = await streaming.stream(
+        video, RESAMPLE_BOARD, run_once=False, block_size=10_000
+    )
+    assert file_name == f"{video.safe_title}-{RESAMPLE_BOARD[1]}"
+
+    audio = read(video, file_name)
+    assert audio.shape == expected.shape
+    assert numpy.allclose(audio, expected, atol=1e-3)
+    assert not list(options.PROCESSED_FOLDER.glob("*.part.*"))
+
+
+async def test_stream_flushes_latency(video):
+    eq = Equalizer.open_file(video)
+    file_name = await eq.stream(video, PITCH_SHIFT_BOARD, block_size=4096)
+
+    audio = read(video, file_name)
+    assert audio.shape[1] == eq.frames
+    assert numpy.abs(audio[:, -SAMPLERATE:]).max() > 0.01
+
+
+async def test_load_streams_long_tracks(video, monkeypatch):
+    assert Equalizer.load(video).audio is not None
+
+    monkeypatch.setattr(options, "STREAM_THRESHOLD", 1)
+    eq = Equalizer.load(video)
+    assert eq.audio is None
+    file_name = await eq.render(video, RESAMPLE_BOARD)
+    assert read(video, file_name).shape[1] == eq.frames
+
+
+async def test_slowed_reverb(video):
+    board_name = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Mid)
+    eq = Equalizer.read_file(video)
+    expected = await eq.run(board_name=board_name)
+    assert expected.shape[1] == pytest.approx(eq.frames / 0.8, abs=64)
+
+    file_name = await Equalizer.open_file(video).stream(
+        video, board_name, block_size=10_000
+    )
+    audio = read(video, file_name)
+    assert audio.shape == expected.shape
+    assert numpy.allclose(audio, expected, atol=1e-3)
+
+
+def test_slowed_reverb_mono():
+    board = SlowedReverb(speed=0.8)
+    audio = numpy.random.default_rng(0).standard_normal((1, 20_000)) * 0.1
+    blocks = [
+        audio[:, i : i + 4096].astype(numpy.float32) for i in range(0, 20_000, 4096)
+    ]
+    out = numpy.concatenate(list(process_blocks(board, blocks, SAMPLERATE)), axis=1)
+    assert out.shape[0] == 1
+    # flushed already, nothing left but the stream's channels
+    assert board.flush(SAMPLERATE).shape == (1, 0)
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+async def test_run_many(video, streaming):
+    board_names = [
+        RESAMPLE_BOARD,
+        PITCH_SHIFT_BOARD,
+        (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Low),
+    ]
+    eq = Equalizer.read_file(video)
+    expected = {b: await eq.run(board_name=b, run_once=False) for b in board_names}
+
+    eq = Equalizer.open_file(video) if streaming else Equalizer.read_file(video)
+    file_names = await eq.run_many(board_names, video)
+    assert list(file_names) == board_names
+    for board_name, file_name in file_names.items():
+        audio = read(video, file_name)
+        assert audio.shape == expected[board_name].shape
+        if board_name != PITCH_SHIFT_BOARD:
+            assert numpy.allclose(audio, expected[board_name], atol=1e-3)
+
+    assert options.cache_misses == len(board_names)
+    eq = Equalizer.open_file(video) if streaming else Equalizer.read_file(video)
+    assert await eq.run_many(board_names, video) == file_names
+    assert options.cache_hits == len(board_names)
+
+
+async def test_aread_file_keeps_loop_responsive(file_options):
+    video = PartialYoutubeVideo(id="noise000000", title="noise", ext="mp3")
+    audio = numpy.random.default_rng(0).standard_normal((2, SAMPLERATE * 30))
+    file = file_options.FOLDER / f"{video.file_name}.{video.ext}"
+    with WriteableAudioFile(str(file), SAMPLERATE, 2) as f:
+        f.write(audio.astype(numpy.float32) * 0.1)
+
+    # not kept decoded after close, so it's decoded twice
+    file_options.audio_cache.budget = 0
+    start = time.perf_counter()
+    Equalizer.read_file(video).close()
+    blocking = time.perf_counter() - start
+    assert not len(file_options.audio_cache)
+
+    lag, reading = 0.0, True
+
+    async def heartbeat():
+        nonlocal lag
+        while reading:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - start - 0.005)
+
+    task = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.01)
+    eq = await Equalizer.aread_file(video)
+    reading = False
+    await task
+
+    assert eq.frames == pytest.approx(audio.shape[1], abs=4096)  # mp3 padding
+    assert lag < blocking / 4
+
+
+async def test_source_ext(file_options):
+    # kept as downloaded, rendered to `ext`
+    video = PartialYoutubeVideo(
+        id="flac0000000", title="flac", ext="wav", source_ext="flac"
+    )
+    audio = numpy.zeros((2, SAMPLERATE), dtype=numpy.float32)
+    file = Equalizer.source_file(video)
+    assert file.suffix == ".flac"
+    with WriteableAudioFile(str(file), SAMPLERATE, 2) as f:
+        f.write(audio)
+
+    eq = Equalizer.load(video)
+    file_names = await eq.run_many([RESAMPLE_BOARD], video)
+    assert read(video, file_names[RESAMPLE_BOARD]).shape[0] == 2
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+async def test_load_native_stream(video, monkeypatch):
+    wav = Equalizer.source_file(video)
+    webm = wav.with_suffix(".webm")
+    subprocess.run(["ffmpeg", "-v", "error", "-i", str(wav), str(webm)], check=True)
+
+    native = PartialYoutubeVideo(
+        id=video.id, title=video.title, ext="wav", source_ext="webm"
+    )
+    eq = Equalizer.load(native)
+    assert eq.audio is not None
+    assert eq.samplerate == SAMPLERATE
+    assert eq.frames == pytest.approx(SAMPLERATE * 3, abs=4096)
+
+    # over the threshold it's decoded block by block while rendering
+    monkeypatch.setattr(options, "STREAM_THRESHOLD", 1)
+    eq = Equalizer.load(native)
+    assert eq.audio is None
+    assert eq.frames == pytest.approx(SAMPLERATE * 3, abs=4096)
+    file_name = await eq.render(native, RESAMPLE_BOARD)
+    assert read(native, file_name).shape[1] == pytest.approx(eq.frames, abs=4096)
@@ -0,0 +1,116 @@
+import os
+
+import numpy
+import pytest
+
+from pedalboard.io import ReadableAudioFile, WriteableAudioFile
+
+from pypedal.pedal.equalizer import Equalizer, options, process_audio
+from pypedal.pedal.executors import (
+    SharedArray,
+    get_executor,
+    run_dsp,
+    shutdown_executors,
+)
+from pypedal.pedal.modes import (
+    EQProcessMode,
+    PitchShiftProcessMode,
+    SlowedReverbProcessMode,
+)
+from pypedal.pedal.models import PartialYoutubeVideo
+
+SAMPLERATE = 44100
+BOARD = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.High)
+PITCH_SHIFT_BOARD = (EQProcessMode.PitchShift, PitchShiftProcessMode.Low)
+
+
+def shared_memory():
+    return {f for f in os.listdir("/dev/shm") if f.startswith("psm_")}
+
+
+@pytest.fixture
+def process_pool(tmp_path):
+    options.__init__(tmp_path)
+    options.EXECUTOR, options.WORKERS = "process", 2
+    shutdown_executors()
+    yield options
+    shutdown_executors()
+    options.__init__()
+
+
+@pytest.fixture
+def audio():
+    rng = numpy.random.default_rng(0)
+    return (rng.standard_normal((2, SAMPLERATE * 2)) * 0.1).astype(numpy.float32)
+
+
+def test_shared_array(audio):
+    shared = SharedArray.copy_of(audio)
+    shm, view = shared.attach()
+    assert numpy.array_equal(view, audio)
+    del view
+    shm.close()
+    assert numpy.array_equal(shared.pop(), audio)
+    with pytest.raises(FileNotFoundError):
+        shared.attach()
+
+
+async def test_process_audio(process_pool, audio):
+    before = shared_memory()
+    assert type(get_executor("dsp")).__name__ == "ProcessPoolExecutor"
+
+    out = await run_dsp(process_audio, BOARD, audio, SAMPLERATE)
+    assert numpy.allclose(out, process_audio(BOARD, audio, SAMPLERATE), atol=1e-5)
+    assert shared_memory() == before
+
+
+async def test_stream_in_process(process_pool, audio):
+    video = PartialYoutubeVideo(id="noise000000", title="noise", ext="wav")
+    file = options.FOLDER / f"{video.file_name}.{video.ext}"
+    with WriteableAudioFile(str(file), SAMPLERATE, 2) as f:
+        f.write(audio)
+
+    file_name = await Equalizer.open_file(video).stream(video, BOARD)
+    with ReadableAudioFile(f"{options.PROCESSED_FOLDER}/{file_name}.wav") as f:
+        assert f.frames == pytest.approx(audio.shape[1] / 0.7, abs=64)
+
+
+async def test_run_many_in_process(process_pool, audio):
+    # one shared copy of the audio for every board, freed once they are done
+    before = shared_memory()
+    boards = [(EQProcessMode.SlowedReverb, level) for level in SlowedReverbProcessMode]
+    video = PartialYoutubeVideo(id="noise000000", title="noise", ext="wav")
+    eq = Equalizer(audio=audio, samplerate=float(SAMPLERATE), frames=audio.shape[1])
+    file_names = await eq.run_many(boards, video, run_once=False)
+
+    assert set(file_names) == set(boards)
+    for file_name in file_names.values():
+        assert (options.PROCESSED_FOLDER / f"{file_name}.wav").exists()
+    assert shared_memory() == before
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+@pytest.mark.parametrize("board_name", [BOARD, PITCH_SHIFT_BOARD])
+async def test_progress(tmp_path, audio, executor, board_name):
+    options.__init__(tmp_path)
+    options.EXECUTOR, options.WORKERS, options.BLOCK_SIZE = executor, 1, 8192
+    shutdown_executors()
+    before = shared_memory()
+    reports = []
+    try:
+        out = await run_dsp(
+            process_audio,
+            board_name,
+            audio,
+            SAMPLERATE,
+            progress=lambda *r: reports.append(r),
+        )
+    finally:
+        shutdown_executors()
+        options.__init__()
+
+    # the same samples as without progress
+    assert numpy.array_equal(out, process_audio(board_name, audio, SAMPLERATE))
+    assert reports[-1] == (audio.shape[1], audio.shape[1])
+    assert [done for done, _ in reports] == sorted(done for done, _ in reports)
+    assert shared_memory() == before
@@ -0,0 +1,79 @@
+import json
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+BASELINES = pathlib.Path(__file__).with_name("importtime.json")
+# microseconds, `python -m tests.test_importtime` measures them again
+TOLERANCE = 2.0
+# slower machines, allowed is baseline * (1 + TOLERANCE)
+
+
+def importtime(module: str):
+    """{module: cumulative microseconds} `python -X importtime` sees for module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:"):
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def imported(module: str):
+    """modules `python -X importtime` sees for importing module"""
+    return set(importtime(module))
+
+
+def best_of(module: str, runs: int = 3):
+    return min(importtime(module)[module] for _ in range(runs))
+
+
+@pytest.mark.parametrize(
+    "module, lazy",
+    [
+        ("pypedal", {"pypedal.pedal", "pypedal.server", "numpy"}),
+        ("pypedal.pedal", {"pypedal.pedal.equalizer", "pedalboard", "pydantic"}),
+        ("pypedal.pedal.executors", {"pedalboard", "youtube_dl", "fastapi"}),
+        ("pypedal.pedal.modes", {"pedalboard", "numpy"}),
+        ("pypedal.pedal.cli", {"pypedal.pedal.equalizer", "pedalboard", "numpy"}),
+        ("pypedal.pedal.equalizer", {"youtube_dl", "pysndfx", "requests", "fastapi"}),
+        ("pypedal.server.app", {"youtube_dl", "pysndfx", "requests"}),
+    ],
+)
+def test_lazy_imports(module, lazy):
+    # the cli, the server and every process worker import these
+    assert not imported(module) & lazy
+
+
+@pytest.mark.parametrize("module", json.loads(BASELINES.read_text()))
+def test_import_time(module):
+    # `pypedal --help`, a worker fork and a pod coming up wait for these
+    baseline = json.loads(BASELINES.read_text())[module]
+    assert best_of(module) <= baseline * (1 + TOLERANCE)
+
+
+def test_package_exports():
+    import pypedal
+    from pypedal import pedal
+
+    assert pypedal.Equalizer is pedal.Equalizer
+    assert pedal.EQProcessMode.SlowedReverb.value == "slowed_reverb"
+    with pytest.raises(AttributeError):
+        pedal.NotAThing
+
+
+if __name__ == "__main__":
+    baselines = {
+        module: best_of(module, 5) for module in json.loads(BASELINES.read_text())
+    }
+    BASELINES.write_text(json.dumps(baselines, indent=2) + "\n")
+    print(f"saved {baselines} to {BASELINES}")
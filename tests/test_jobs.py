@@ -0,0 +1,254 @@
+import asyncio
+import os
+import types
+
+import pytest
+
+from pypedal.jobs import Job, RedisJobStore, SQLiteJobStore, open_store, status_dict
+from pypedal.jobs import worker as worker_module
+from pypedal.jobs.worker import Worker
+from pypedal.pedal.equalizer import Equalizer, options
+from pypedal.pedal.models import PartialYoutubeVideo
+from pypedal.pedal.modes import EQProcessMode, SlowedReverbProcessMode
+from pypedal.server.managers import ConnectionManager, ProcessManager
+from pypedal.server.models import INITRecievePayload, WebsocketRecievePayload
+
+LOW = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Low)
+HIGH = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.High)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteJobStore(tmp_path / "jobs.sqlite3")
+    yield store
+    store.close()
+
+
+def test_submit_once(store):
+    job, queued = store.submit(Job("noise000000", LOW))
+    assert queued and job.key == "noise000000/slowed_reverb/085"
+    assert job.board == LOW
+    # asked again, from anywhere
+    assert store.submit(Job("noise000000", LOW)) == (job, False)
+    assert store.submit(Job("noise000000", HIGH))[1]
+    assert store.queued() == 2
+
+    # failed jobs are queued again
+    store.claim("worker")
+    store.publish(job.key, status_dict(job, "DONE", failed=True))
+    assert store.get(job.key).failed
+    assert store.submit(Job("noise000000", LOW))[1]
+
+
+def test_claim(store):
+    first, _ = store.submit(Job("noise000000", LOW))
+    second, _ = store.submit(Job("noise000001", LOW))
+    assert store.claim("a").key == first.key
+    assert store.claim("b").key == second.key
+    assert store.claim("c") is None
+    assert store.heartbeat(first.key, "a")
+    assert not store.heartbeat(first.key, "b")
+
+    # "a" died, its job goes to whoever asks next
+    claimed = store.claim("c", stale=-1)
+    assert (claimed.key, claimed.worker) == (first.key, "c")
+    assert not store.heartbeat(first.key, "a")
+
+
+def test_cancel(store):
+    running, _ = store.submit(Job("noise000000", LOW))
+    queued, _ = store.submit(Job("noise000001", LOW))
+    store.claim("a")
+    cursor, _ = store.events(None, 0)
+    store.cancel(running.key)
+    store.cancel(queued.key)
+    assert not store.heartbeat(running.key, "a")
+    assert store.queued() == 0
+
+    # only the queued one is published, the worker tells about the other
+    _, events = store.events(cursor, 0)
+    assert [(key, status["cancelled"]) for key, status in events] == [
+        (queued.key, True)
+    ]
+
+
+def test_events(store):
+    job, _ = store.submit(Job("noise000000", LOW))
+    cursor, events = store.events(None, 0)
+    assert events == []
+    store.publish(job.key, status_dict(job, "STARTED"))
+    store.publish(job.key, status_dict(job, "DONE", result="link"))
+    cursor, events = store.events(cursor, 0)
+    assert [status["state"] for _, status in events] == ["STARTED", "DONE"]
+    assert store.events(cursor, 0)[1] == []
+    assert store.get(job.key).state == "DONE"
+
+    store.purge(older_than=-1)
+    assert store.get(job.key) is None
+    assert store.events(0, 0)[1] == []
+
+
+def test_open_store(tmp_path):
+    store = open_store("sqlite", tmp_path)
+    assert store.file == tmp_path / "jobs.sqlite3"
+    store.close()
+    store = open_store(f"sqlite://{tmp_path}/other.sqlite3", tmp_path)
+    assert store.file == tmp_path / "other.sqlite3"
+    store.close()
+    with pytest.raises(ValueError):
+        open_store("postgres://", tmp_path)
+
+
+class FakeWorker(Worker):
+    HEARTBEAT_INTERVAL = 0.05
+
+    async def process(self, job, publish):
+        await publish("IN_PROGRESS", status={"stage": "processing"})
+        if job.url == "sleep000000":
+            await asyncio.sleep(10)
+        return f"https://pypedal/{job.key}"
+
+
+async def test_worker(store):
+    job, _ = store.submit(Job("noise000000", LOW))
+    sleeping, _ = store.submit(Job("sleep000000", LOW))
+    worker = FakeWorker(store, concurrency=2)
+    running = asyncio.create_task(worker.run())
+
+    cursor = 0
+    states = []
+    while len(states) < 3:
+        cursor, events = await asyncio.to_thread(store.events, cursor, 1)
+        states += [s["state"] for key, s in events if key == job.key]
+    assert states == ["STARTED", "IN_PROGRESS", "DONE"]
+    assert (
+        store.get(job.key).status["result"]
+        == "https://pypedal/noise000000/slowed_reverb/085"
+    )
+
+    store.cancel(sleeping.key)
+    for _ in range(100):
+        if store.get(sleeping.key).state == "DONE":
+            break
+        await asyncio.sleep(0.02)
+    assert store.get(sleeping.key).status["cancelled"]
+    worker.stop()
+    await running
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """worker stages without youtube, renders take 0.2 seconds"""
+    calls = types.SimpleNamespace(downloads=[], renders=[])
+
+    async def download(url):
+        calls.downloads.append(url)
+        return PartialYoutubeVideo(id=url, title=url)
+
+    async def find_render(video, board_name):
+        return None
+
+    async def render(self, video, board_name, publish):
+        calls.renders.append(video.id)
+        await asyncio.sleep(0.2)
+
+    async def upload(video, *, board_name):
+        return f"https://pypedal/{video.id}"
+
+    monkeypatch.setattr(worker_module, "youtube_download", download)
+    monkeypatch.setattr(worker_module, "upload_local", upload)
+    monkeypatch.setattr(Equalizer, "find_render", staticmethod(find_render))
+    monkeypatch.setattr(Worker, "render", render)
+    return calls
+
+
+async def test_prefetch_and_drain(store, offline):
+    keys = [store.submit(Job(f"noise00000{i}", LOW))[0].key for i in range(3)]
+    worker = Worker(store, concurrency=1, prefetch=1)
+    running = asyncio.create_task(worker.run())
+    while not offline.renders or len(offline.downloads) < 2:
+        await asyncio.sleep(0.01)
+    # the next source is downloaded while the first one renders
+    assert offline.downloads == ["noise000000", "noise000001"]
+
+    await worker.drain()
+    await running
+    assert offline.renders == ["noise000000"]
+    assert store.get(keys[0]).status["result"] == "https://pypedal/noise000000"
+    # waiting for a render slot, back to the queue for someone else
+    released = store.get(keys[1])
+    assert (released.state, released.worker) == ("QUEUED", None)
+    assert released.status["state"] == "QUEUED"
+    assert store.queued() == 2
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYPEDAL_JOBS", "sqlite")
+    options.__init__(tmp_path)
+    manager = ProcessManager()
+    yield manager
+    for task in (manager._relay, manager._sweeper):
+        if task:
+            task.cancel()
+    manager._status.clear()
+    manager._watchers.clear()
+    options.jobs.close()
+    options.__init__()
+
+
+async def test_statuses_are_relayed(jobs):
+    ws = FakeWebSocket()
+    ConnectionManager.active_connections.append(ws)
+    recieve = WebsocketRecievePayload(
+        op="INIT", data=INITRecievePayload(url="noise000000", board_name=LOW)
+    )
+    try:
+        assert await jobs.init(ws, recieve) is True
+        assert jobs.processes == {}  # queued for a worker, not run here
+        worker = FakeWorker(options.jobs)
+        running = asyncio.create_task(worker.run())
+        while not ws.sent or ws.sent[-1]["data"]["state"] != "DONE":
+            await asyncio.sleep(0.02)
+        worker.stop()
+        await running
+
+        assert [sent["data"]["state"] for sent in ws.sent] == [
+            "STARTED",
+            "STARTED",
+            "IN_PROGRESS",
+            "DONE",
+        ]
+        # done on any node, the result is sent without running it again
+        assert await jobs.init(FakeWebSocket(), recieve) is False
+        assert jobs.get_status("noise000000", LOW).result
+        assert options.jobs.queued() == 0
+    finally:
+        ConnectionManager.active_connections.remove(ws)
+
+
+@pytest.mark.skipif(
+    not os.getenv("PYPEDAL_TEST_REDIS"),
+    reason="set PYPEDAL_TEST_REDIS to a redis url to test on redis",
+)
+def test_redis_store():
+    pytest.importorskip("redis")
+    store = RedisJobStore(os.environ["PYPEDAL_TEST_REDIS"], prefix="pypedal-test")
+    try:
+        job, queued = store.submit(Job("noise000000", LOW))
+        assert queued and store.claim("a").key == job.key
+        cursor, _ = store.events(None, 0)
+        store.publish(job.key, status_dict(job, "DONE", result="link"))
+        _, events = store.events(cursor, 0.1)
+        assert [status["result"] for _, status in events] == ["link"]
+    finally:
+        store.purge(older_than=-1)
+        store.close()
@@ -0,0 +1,184 @@
+import asyncio
+
+import numpy
+import pytest
+
+from pedalboard.io import WriteableAudioFile
+
+from pypedal.pedal import equalizer
+from pypedal.pedal.equalizer import Equalizer, options
+from pypedal.pedal.modes import EQProcessMode, SlowedReverbProcessMode
+from pypedal.pedal.models import PartialYoutubeVideo
+from pypedal.server.managers import ProcessManager
+from pypedal.server.models import (
+    EQStatus,
+    FutureLinkedEvent,
+    INITRecievePayload,
+    ProcessModel,
+    STATUSSendPayload,
+    SubProcessModel,
+    WebsocketRecievePayload,
+)
+
+LOW = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.Low)
+HIGH = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.High)
+
+
+@pytest.fixture
+def video(tmp_path):
+    options.__init__(tmp_path)
+    video = PartialYoutubeVideo(id="noise000000", title="noise", ext="wav")
+    audio = numpy.random.default_rng(0).standard_normal((2, 4410)) * 0.1
+    file = options.FOLDER / f"{video.file_name}.{video.ext}"
+    with WriteableAudioFile(str(file), 44100, 2) as f:
+        f.write(audio.astype(numpy.float32))
+    yield video
+    options.__init__()
+
+
+async def test_pending_boards_are_batched(video):
+    proc = ProcessModel(
+        url=video.id, sub={LOW: SubProcessModel(ws=[]), HIGH: SubProcessModel(ws=[])}
+    )
+    ProcessManager().start_processing(proc, video, HIGH)
+    assert proc.sub[LOW].processing is proc.sub[HIGH].processing
+
+    await proc.sub[LOW].processing.future
+    # decoded once for both boards
+    assert options.audio_cache.misses == 1
+    assert await Equalizer.find_render(video, LOW)
+    assert await Equalizer.find_render(video, HIGH)
+
+
+async def test_short_tracks_are_streamed(video, monkeypatch):
+    # far below STREAM_THRESHOLD, still written to a .part file block by block
+    parts = []
+    process_blocks = equalizer.process_blocks
+
+    def watched(*args):
+        for block in process_blocks(*args):
+            parts.extend(options.PROCESSED_FOLDER.glob("*.part.*"))
+            yield block
+
+    monkeypatch.setattr(equalizer, "process_blocks", watched)
+    proc = ProcessModel(url=video.id, sub={LOW: SubProcessModel(ws=[])})
+    ProcessManager().start_processing(proc, video, LOW)
+    await proc.sub[LOW].processing.future
+    assert parts
+    assert await Equalizer.find_render(video, LOW)
+
+
+async def test_progress_is_throttled(video):
+    manager = ProcessManager()
+    proc = ProcessModel(url=video.id, sub={LOW: SubProcessModel(ws=[])})
+    manager._status[(video.id, LOW)] = payload = STATUSSendPayload(
+        url=video.id,
+        board_name=LOW,
+        state="IN_PROGRESS",
+        status=EQStatus(stage="processing"),
+    )
+    try:
+        report = manager.progress_reporter(proc, [LOW])
+        report(10, 100)
+        report(50, 100)
+        assert payload.status.percentage == 10
+
+        await asyncio.sleep(manager.STATUS_INTERVAL)
+        report(50, 100)
+        assert payload.status.percentage == 50
+    finally:
+        del manager._status[(video.id, LOW)]
+
+
+@pytest.fixture
+def manager():
+    manager = ProcessManager()
+    yield manager
+    manager.processes.clear()
+    manager._status.clear()
+    manager._done_at.clear()
+    if manager._sweeper:
+        manager._sweeper.cancel()
+
+
+def done(url, board_name):
+    return STATUSSendPayload(url=url, board_name=board_name, state="DONE", result="x")
+
+
+async def test_sweep_keeps_results(manager, monkeypatch):
+    proc = ProcessModel(url="noise000000", sub={LOW: SubProcessModel(ws=[object()])})
+    manager.processes[proc.url] = proc
+    manager._status[(proc.url, LOW)] = done(proc.url, LOW)
+    manager._status[("other000000", LOW)] = STATUSSendPayload(
+        url="other000000", board_name=LOW, state="STARTED"
+    )
+
+    manager.sweep(now=0)
+    assert proc.url not in manager.processes
+    assert manager.get_status(proc.url, LOW).result == "x"
+
+    # finished before, nothing is started again
+    recieve = WebsocketRecievePayload(
+        op="INIT", data=INITRecievePayload(url=proc.url, board_name=LOW)
+    )
+    assert await manager.init(object(), recieve) is False
+    assert proc.url not in manager.processes
+
+    monkeypatch.setattr(options, "RESULT_TTL", 10)
+    manager.sweep(now=5)
+    assert manager.get_status(proc.url, LOW)
+    manager.sweep(now=11)
+    assert not manager.get_status(proc.url, LOW)
+    assert manager.get_status("other000000", LOW)
+
+
+async def test_sweep_limits_results(manager, monkeypatch):
+    monkeypatch.setattr(options, "MAX_RESULTS", 2)
+    for i in range(4):
+        url = f"noise00000{i}"
+        manager._status[(url, LOW)] = done(url, LOW)
+        manager.sweep(now=i)
+    assert [url for url, _ in manager._status] == ["noise000002", "noise000003"]
+
+
+async def test_running_process_is_kept(manager):
+    proc = ProcessModel(url="noise000000", sub={LOW: SubProcessModel(ws=[])})
+    proc.background_task = asyncio.create_task(asyncio.sleep(1))
+    manager.processes[proc.url] = proc
+    manager._status[(proc.url, LOW)] = done(proc.url, LOW)
+    manager.sweep()
+    assert proc.url in manager.processes
+    proc.background_task.cancel()
+
+
+async def test_failed_download_isnt_admitted(manager):
+    failed = asyncio.get_event_loop().create_future()
+    failed.set_exception(Exception("download failed"))
+    proc = ProcessModel(url="noise000000", sub={LOW: SubProcessModel(ws=[])})
+    proc.downloading = FutureLinkedEvent(failed)
+    manager.processes[proc.url] = proc
+    manager._status[(proc.url, LOW)] = STATUSSendPayload(
+        url=proc.url, board_name=LOW, state="DONE", failed=True
+    )
+
+    recieve = WebsocketRecievePayload(
+        op="INIT", data=INITRecievePayload(url=proc.url, board_name=HIGH)
+    )
+    assert await manager.init(object(), recieve) is False
+    assert manager.scheduler.admitted == 0
+    assert manager.get_status(proc.url, HIGH).failed
+    # nothing left running, the sweeper can drop it
+    assert manager.is_finished(proc)
+
+
+def test_scheduler_limits_from_options(tmp_path, monkeypatch):
+    # .env is loaded and `setup` sets the options after this module is imported
+    monkeypatch.setenv("PYPEDAL_PROCESS_WORKERS", "7")
+    monkeypatch.setenv("PYPEDAL_MAX_QUEUED", "3")
+    options.__init__(tmp_path)
+    try:
+        scheduler = ProcessManager().scheduler
+        assert scheduler.stages["process"].limit == 7
+        assert scheduler.max_queued == 3
+    finally:
+        options.__init__()
@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pypedal.pedal.modes import (
+    EQProcessMode,
+    PitchShiftProcessMode,
+    ResampleProcessMode,
+    board_registry,
+    get_board,
+)
+
+
+def test_get_board_cached():
+    board = get_board(EQProcessMode.PitchShift, PitchShiftProcessMode.Low)
+    assert board is get_board(EQProcessMode.PitchShift, PitchShiftProcessMode.Low)
+    assert board is not get_board(EQProcessMode.PitchShift, PitchShiftProcessMode.Mid)
+    assert board is not board_registry.create(
+        EQProcessMode.PitchShift, PitchShiftProcessMode.Low
+    )
+
+
+def test_get_board_per_thread():
+    def board():
+        return get_board(EQProcessMode.PitchShift, PitchShiftProcessMode.Low)
+
+    # kept alive, a freed board's id could be reused by the next one
+    with ThreadPoolExecutor(1) as executor:
+        other_thread = executor.submit(board).result()
+        assert executor.submit(board).result() is other_thread
+
+    assert board() is not other_thread
+
+
+def test_get_board_invalid():
+    with pytest.raises(ValueError):
+        get_board(EQProcessMode.PitchShift, ResampleProcessMode.Up)
+    with pytest.raises(Exception):
+        get_board("unknown", ResampleProcessMode.Up)  # type: ignore
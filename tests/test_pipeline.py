@@ -0,0 +1,100 @@
+import os
+import shutil
+import threading
+import time
+
+import numpy
+import pytest
+
+from pedalboard.io import ReadableAudioFile, WriteableAudioFile
+
+from pypedal.pedal.equalizer import options
+from pypedal.pedal.modes import EQProcessMode, SlowedReverbProcessMode
+from pypedal.pedal.pipeline import (
+    SAMPLERATE,
+    decode,
+    follow_file,
+    probe_duration,
+    render_download,
+)
+
+BOARD = (EQProcessMode.SlowedReverb, SlowedReverbProcessMode.High)
+
+
+@pytest.fixture
+def folder(tmp_path):
+    options.__init__(tmp_path)
+    yield tmp_path
+    options.__init__()
+
+
+def test_follow_file(folder):
+    part, final = folder / "song.webm.part", folder / "song.webm"
+    data = os.urandom(1 << 18)
+
+    def download():
+        with open(part, "wb") as f:
+            for i in range(0, len(data), 1 << 14):
+                f.write(data[i : i + (1 << 14)])
+                f.flush()
+                time.sleep(0.005)
+        os.replace(part, final)
+
+    writer = threading.Thread(target=download)
+    writer.start()
+    try:
+        chunks = list(follow_file(part, final, chunk_size=1 << 12, poll=0.01))
+    finally:
+        writer.join()
+    assert b"".join(chunks) == data
+
+
+def test_follow_file_done_already(folder):
+    part, final = folder / "song.webm.part", folder / "song.webm"
+    final.write_bytes(b"done")
+    assert b"".join(follow_file(part, final)) == b"done"
+
+
+def test_follow_file_timeout(folder):
+    part, final = folder / "song.webm.part", folder / "song.webm"
+    part.write_bytes(b"stuck")
+    with pytest.raises(TimeoutError):
+        list(follow_file(part, final, poll=0.01, timeout=0.1))
+
+
+def test_probe_duration(folder, monkeypatch):
+    ffmpeg = folder / "ffmpeg"
+    ffmpeg.write_text(
+        "#!/bin/sh\n"
+        'echo "  Duration: 01:02:03.50, start: 0.000000, bitrate: 128 kb/s" >&2\n'
+        "exit 1\n"
+    )
+    ffmpeg.chmod(0o755)
+    monkeypatch.setattr(options, "FFMPEG", str(ffmpeg))
+    assert probe_duration(folder / "song.webm") == 3723.5
+
+    ffmpeg.write_text("#!/bin/sh\nexit 1\n")
+    assert probe_duration(folder / "song.webm") is None
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_render_download(folder):
+    source = folder / "song.mp3"
+    rng = numpy.random.default_rng(0)
+    audio = (rng.standard_normal((2, SAMPLERATE * 2)) * 0.1).astype(numpy.float32)
+    with WriteableAudioFile(str(source), SAMPLERATE, 2) as f:
+        f.write(audio)
+
+    blocks = list(decode([source.read_bytes()], 4096))
+    assert all(block.shape[0] == 2 for block in blocks)
+    assert sum(block.shape[1] for block in blocks) == pytest.approx(
+        audio.shape[1], abs=4096
+    )
+
+    target = folder / "processed" / "song-high.mp3"
+    counter = numpy.zeros(2, dtype=numpy.int64)
+    part = folder / "song.mp3.part"
+    render_download(str(part), str(source), [(str(target), BOARD)], 4096, 0, counter)
+    with ReadableAudioFile(str(target)) as f:
+        assert f.frames > audio.shape[1]
+    assert counter[0] == pytest.approx(audio.shape[1], abs=4096)
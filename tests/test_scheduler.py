@@ -0,0 +1,215 @@
+import asyncio
+
+import pytest
+
+from pypedal.server.app import app
+from pypedal.server.managers import ConnectionManager
+from pypedal.server.models import ProductionConfig
+from pypedal.server.scheduler import QueueFull, Scheduler, parse_weights
+from tests.test_storage import request
+
+
+async def test_limits_and_positions():
+    scheduler = Scheduler({"download": 1, "process": 2, "upload": 1}, max_queued=2)
+    release = asyncio.Event()
+    positions = {}
+
+    async def job(name):
+        def on_queued(position):
+            positions.setdefault(name, []).append(position)
+
+        async with scheduler.slot("download", on_queued=on_queued):
+            await release.wait()
+
+    jobs = [asyncio.create_task(job(name)) for name in "abc"]
+    await asyncio.sleep(0)
+    assert (scheduler.running, scheduler.queued) == (1, 2)
+    assert positions == {"b": [0], "c": [1]}
+    with pytest.raises(QueueFull):
+        scheduler.admit()
+
+    # the process stage has its own slots
+    async with scheduler.slot("process"):
+        assert scheduler.running == 2
+
+    release.set()
+    await asyncio.gather(*jobs)
+    assert positions == {"b": [0, None], "c": [1, 0, None]}
+    assert (scheduler.running, scheduler.queued) == (0, 0)
+    scheduler.admit()
+
+
+async def test_admitted_jobs_wait_too():
+    scheduler = Scheduler({"download": 1}, max_queued=2)
+    first, second = scheduler.admit(), scheduler.admit()
+    # a burst, none of them got to a stage yet
+    with pytest.raises(QueueFull):
+        scheduler.admit()
+
+    async with scheduler.slot("download", admissions=[first]):
+        # running, it doesn't wait anymore
+        third = scheduler.admit()
+        with pytest.raises(QueueFull):
+            scheduler.admit()
+    second.start()  # ended before it got to a stage
+    third.start()
+    assert scheduler.admitted == 0
+
+
+async def test_cancel_while_queued():
+    scheduler = Scheduler({"download": 1}, max_queued=8)
+    release = asyncio.Event()
+
+    async def job():
+        async with scheduler.slot("download"):
+            await release.wait()
+
+    running, waiting, last = [asyncio.create_task(job()) for _ in range(3)]
+    await asyncio.sleep(0)
+    waiting.cancel()
+    await asyncio.sleep(0)
+    assert scheduler.queued == 1
+
+    release.set()
+    await asyncio.gather(running, last)
+    assert waiting.cancelled()
+    assert (scheduler.running, scheduler.queued) == (0, 0)
+
+
+async def run_in_order(scheduler, jobs):
+    """jobs are (tenant, cost), returns the tenants in the order they ran"""
+    order = []
+    release = asyncio.Event()
+
+    async def job(tenant, cost):
+        async with scheduler.slot("process", tenant=tenant, cost=cost):
+            order.append(tenant)
+            await release.wait()
+
+    tasks = [asyncio.create_task(job(*job_)) for job_ in jobs]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*tasks)
+    return order
+
+
+async def test_fair_share():
+    scheduler = Scheduler({"process": 1}, max_queued=64)
+    jobs = [("greedy", 60)] * 5 + [("polite", 60)]
+    order = await run_in_order(scheduler, jobs)
+    # polite waits for one greedy job in line, not all of them
+    assert order.index("polite") <= 2
+
+
+async def test_short_tracks_first():
+    scheduler = Scheduler({"process": 1}, max_queued=64)
+    order = await run_in_order(scheduler, [("a", 60), ("long", 600), ("short", 30)])
+    assert order == ["a", "short", "long"]
+
+
+async def test_weights():
+    scheduler = Scheduler({"process": 1}, max_queued=64, weights={"paid": 3})
+    jobs = [("free", 60)] * 4 + [("paid", 60)] * 4
+    order = await run_in_order(scheduler, jobs)
+    assert order[:5].count("paid") >= 3
+
+
+def test_weights_from_env(monkeypatch):
+    assert parse_weights(" paid=3, batch=0.5,") == {"paid": 3, "batch": 0.5}
+    with pytest.raises(ValueError):
+        parse_weights("paid")
+
+    monkeypatch.setenv("PYPEDAL_TENANT_WEIGHTS", "paid=3")
+    assert Scheduler({"process": 1}).weights == {"paid": 3}
+
+
+async def test_metrics():
+    scheduler = Scheduler({"process": 1}, max_queued=64)
+    release = asyncio.Event()
+
+    async def job(tenant):
+        async with scheduler.slot("process", tenant=tenant):
+            await release.wait()
+
+    jobs = [asyncio.create_task(job(tenant)) for tenant in "ab"]
+    await asyncio.sleep(0)
+    metrics = scheduler.metrics()["process"]
+    assert (metrics["running"], metrics["queued"]) == (1, 1)
+    assert metrics["tenants"] == {"a": metrics["wait"]}
+
+    release.set()
+    await asyncio.gather(*jobs)
+    metrics = scheduler.metrics()["process"]
+    assert metrics["wait"]["count"] == 2 and metrics["wait"]["max"] > 0
+    # both are done, only the totals are kept
+    assert metrics["tenants"] == {}
+
+
+async def test_idle_tenants_are_forgotten():
+    scheduler = Scheduler({"process": 1}, max_queued=64)
+    tenants = [f"connection-{i}" for i in range(10)]
+    await run_in_order(scheduler, [(tenant, 60) for tenant in tenants])
+    stage = scheduler.stages["process"]
+    assert not stage.finish and not stage.tenant_waits and not stage.jobs
+    assert scheduler.metrics()["process"]["wait"]["count"] == 10
+
+
+@pytest.fixture
+def production():
+    app.extra["config"] = ProductionConfig(PRODUCTION_KEY="secret-key")
+    yield
+    del app.extra["config"]
+
+
+async def test_metrics_need_the_key(production):
+    for path in ("/metrics/scheduler", "/metrics/uploads"):
+        status, _, _ = await request("GET", path)
+        assert status == 401
+        status, _, body = await request("GET", path, {"authorization": "secret-key"})
+        assert status == 200 and b"secret-key" not in body
+
+
+async def connect(headers):
+    """the tenant the app connected a websocket with, None if it was closed"""
+    scope = {
+        "type": "websocket",
+        "asgi": {"version": "3.0"},
+        "scheme": "ws",
+        "path": "/ws",
+        "raw_path": b"/ws",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(k.encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 1234),
+        "server": ("127.0.0.1", 8000),
+        "subprotocols": [],
+    }
+    messages = [
+        {"type": "websocket.connect"},
+        {"type": "websocket.disconnect", "code": 1000},
+    ]
+    tenants = []
+
+    async def receive():
+        if len(messages) == 1:
+            # connected, waiting for the first message
+            tenants.append(
+                ConnectionManager.tenant(ConnectionManager.active_connections[-1])
+            )
+        return messages.pop(0)
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+    return tenants[0] if tenants else None
+
+
+async def test_tenants_arent_the_key(production):
+    key = {"authorization": "secret-key"}
+    assert await connect({}) is None
+    first, second = await connect(key), await connect(key)
+    # one tenant per connection, not everyone with the key in one
+    assert first.startswith("connection-") and first != second
+    assert await connect({**key, "x-tenant": "paid"}) == "paid"
+    assert await connect({**key, "x-tenant": "no spaces"}) is None
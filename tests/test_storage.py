@@ -0,0 +1,217 @@
+import asyncio
+import http.server
+import os
+import threading
+import time
+
+import pytest
+
+from pypedal.pedal.equalizer import options, part_file
+from pypedal.pedal.models import PartialYoutubeVideo
+from pypedal.pedal.modes import SlowedReverbProcessMode
+from pypedal.pedal.storage import LocalStorage, S3Storage, TransferStorage
+from pypedal.server.app import app
+
+
+async def request(method: str, path: str, headers=None):
+    """calls the app like an ASGI server would, returns status, headers, body"""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (k.lower().encode(), v.encode()) for k, v in (headers or {}).items()
+        ],
+        "client": ("127.0.0.1", 1234),
+        "server": ("127.0.0.1", 8000),
+    }
+    messages = []
+    requested = asyncio.Event()
+
+    async def receive():
+        if requested.is_set():
+            await asyncio.Event().wait()  # no disconnect
+        requested.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = messages[0]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return (
+        start["status"],
+        {k.decode(): v.decode() for k, v in start["headers"]},
+        body,
+    )
+
+
+@pytest.fixture
+def rendered(tmp_path):
+    options.__init__(tmp_path)
+    options.PROCESSED_FOLDER.mkdir()
+    file = options.PROCESSED_FOLDER / "song-high.mp3"
+    file.write_bytes(bytes(range(256)) * 40)
+    yield file
+    options.__init__()
+
+
+async def test_local_storage(rendered):
+    storage = LocalStorage("http://pypedal/")
+    assert await storage.store(rendered) == "http://pypedal/renders/song-high.mp3"
+    with pytest.raises(FileNotFoundError):
+        await storage.store(rendered.with_name("missing.mp3"))
+
+
+async def test_serve_render(rendered):
+    status, headers, body = await request("GET", "/renders/song-high.mp3")
+    assert status == 200
+    assert body == rendered.read_bytes()
+    assert headers["content-type"] == "audio/mpeg"
+    assert headers["accept-ranges"] == "bytes"
+
+    status, _, body = await request(
+        "GET", "/renders/song-high.mp3", {"if-none-match": headers["etag"]}
+    )
+    assert (status, body) == (304, b"")
+
+    status, _, body = await request("HEAD", "/renders/song-high.mp3")
+    assert (status, body) == (200, b"")
+
+    for name in ("index.json", "index.sqlite3", "missing.mp3", "..%2Fsecret.mp3"):
+        status, _, _ = await request("GET", f"/renders/{name}")
+        assert status == 404
+
+
+async def test_serve_range(rendered):
+    data = rendered.read_bytes()
+    path = "/renders/song-high.mp3"
+    status, headers, body = await request("GET", path, {"range": "bytes=100-199"})
+    assert (status, body) == (206, data[100:200])
+    assert headers["content-range"] == f"bytes 100-199/{len(data)}"
+
+    status, _, body = await request("GET", path, {"range": "bytes=-10"})
+    assert (status, body) == (206, data[-10:])
+
+    status, headers, _ = await request("GET", path, {"range": f"bytes={len(data)}-"})
+    assert (status, headers["content-range"]) == (416, f"bytes */{len(data)}")
+
+    # changed since, the whole file
+    status, _, body = await request(
+        "GET", path, {"range": "bytes=0-9", "if-range": '"stale"'}
+    )
+    assert (status, body) == (200, data)
+
+
+async def test_transfer_storage_uploads_once(rendered):
+    uploads = []
+
+    class Uploader:
+        async def upload(self, file):
+            uploads.append(file)
+            return f"https://transfer.sh/{len(uploads)}/{file.name}"
+
+    storage = TransferStorage(Uploader())
+    first = await storage.store(rendered)
+    assert await storage.store(rendered) == first
+    assert len(uploads) == 1
+
+
+class S3Handler(http.server.BaseHTTPRequestHandler):
+    """a bucket that keeps objects in `server.objects`"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.server.requests.append(("HEAD", self.path, dict(self.headers)))
+        self.reply(200 if self.path in self.server.objects else 404)
+
+    def do_PUT(self):
+        self.server.requests.append(("PUT", self.path, dict(self.headers)))
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.objects[self.path] = body
+        self.reply(200)
+
+
+@pytest.fixture
+def bucket():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), S3Handler)
+    server.objects, server.requests = {}, []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+async def test_s3_storage(rendered, bucket):
+    endpoint = f"http://127.0.0.1:{bucket.server_address[1]}"
+    storage = S3Storage(endpoint, "renders", access_key="key", secret_key="secret")
+    url = await storage.store(rendered)
+    assert url.startswith(f"{endpoint}/renders/")
+    assert url.endswith("/song-high.mp3")
+    ((path, body),) = bucket.objects.items()
+    assert body == rendered.read_bytes()
+
+    method, _, headers = bucket.requests[-1]
+    assert method == "PUT"
+    assert headers["Authorization"].startswith("AWS4-HMAC-SHA256 Credential=key/")
+    assert "SignedHeaders=content-length;host;x-amz-content-sha256;x-amz-date" in (
+        headers["Authorization"]
+    )
+
+    # popular render, asked again: only a HEAD
+    assert await storage.store(rendered) == url
+    assert [method for method, _, _ in bucket.requests] == ["HEAD", "PUT", "HEAD"]
+    storage.close()
+
+
+async def test_stream_while_rendering(rendered):
+    video = PartialYoutubeVideo(id="dQw4w9WgXcQ", title="song")
+    options.metadata.put(video)
+    mode = SlowedReverbProcessMode.High
+    file = options.PROCESSED_FOLDER / f"{video.safe_title}-{mode}.{video.ext}"
+    part = part_file(file)
+    part.write_bytes(b"")
+    data = bytes(range(256)) * 64
+
+    def render():
+        with open(part, "ab") as f:
+            for i in range(0, len(data), 1024):
+                f.write(data[i : i + 1024])
+                f.flush()
+                time.sleep(0.005)
+        os.replace(part, file)
+
+    writer = threading.Thread(target=render)
+    writer.start()
+    try:
+        status, headers, body = await request(
+            "GET", f"/renders/{video.id}/{mode.value}"
+        )
+    finally:
+        writer.join()
+        options.metadata.close()
+    assert (status, body) == (200, data)
+    assert "content-length" not in headers  # chunked
+
+    # done, a plain file with ranges from now on
+    status, headers, _ = await request("GET", f"/renders/{video.id}/{mode.value}")
+    assert (status, headers["accept-ranges"]) == (200, "bytes")
+    status, _, _ = await request("GET", f"/renders/unknown0000/{mode.value}")
+    assert status == 404
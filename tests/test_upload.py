@@ -0,0 +1,140 @@
+import asyncio
+import http.server
+import threading
+import time
+
+import pytest
+
+from pypedal.pedal.equalizer import options, upload_to_transferfilesh
+from pypedal.pedal.executors import get_executor
+from pypedal.pedal.upload import Uploader, UploadError
+
+
+class TransferHandler(http.server.BaseHTTPRequestHandler):
+    """stands in for transfer.sh, keeps what it got in `server.files`"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def read_chunked(self):
+        body = b""
+        while size := int(self.rfile.readline().strip(), 16):
+            body += self.rfile.read(size)
+            self.rfile.readline()
+        self.rfile.readline()
+        return body
+
+    def do_PUT(self):
+        server = self.server
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = self.read_chunked()
+        else:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+            failing = server.failures > 0
+            server.failures -= 1
+
+        if failing:
+            link, status = b"busy", 503
+        else:
+            server.files[self.path] = body
+            link, status = f"http://localhost{self.path}\n".encode(), 200
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(link)))
+        self.end_headers()
+        self.wfile.write(link)
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), TransferHandler)
+    server.files, server.failures, server.delay = {}, 0, 0
+    server.lock, server.active, server.max_active = threading.Lock(), 0, 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def file(tmp_path, name: str, size: int):
+    path = tmp_path / name
+    path.write_bytes(bytes(range(256)) * (size // 256))
+    return path
+
+
+async def test_upload(tmp_path, server, url):
+    uploader = Uploader(url)
+    source = file(tmp_path, "song high.mp3", 1 << 20)
+    link = await uploader.upload(source)
+    assert link == "http://localhost/song%20high.mp3"
+    assert server.files["/song%20high.mp3"] == source.read_bytes()
+
+    metrics = uploader.metrics.dict()
+    assert (metrics["uploads"], metrics["bytes"]) == (1, 1 << 20)
+    assert metrics["throughput"] > 0
+    uploader.close()
+
+
+async def test_upload_retries(tmp_path, server, url):
+    server.failures = 2
+    uploader = Uploader(url, retries=2, backoff=0.01)
+    assert await uploader.upload(file(tmp_path, "a.mp3", 1024))
+    assert uploader.metrics.retries == 2
+
+    server.failures = 3
+    with pytest.raises(UploadError):
+        await uploader.upload(file(tmp_path, "b.mp3", 1024))
+    assert uploader.metrics.failures == 1
+    uploader.close()
+
+
+async def test_upload_concurrency(tmp_path, server, url):
+    server.delay = 0.05
+    uploader = Uploader(url, concurrency=2)
+    files = [file(tmp_path, f"{i}.mp3", 1024) for i in range(6)]
+    links = await asyncio.gather(*(uploader.upload(f) for f in files))
+    assert len(set(links)) == 6
+    assert server.max_active == 2
+    uploader.close()
+
+
+async def test_upload_leaves_io_executor_free(tmp_path, server, url):
+    # every io thread is busy until the upload, retries included, is done
+    server.failures = 1
+    uploader = Uploader(url, retries=1, backoff=0.01)
+    done = threading.Event()
+    loop = asyncio.get_running_loop()
+    io = get_executor("io")
+    blocked = [loop.run_in_executor(io, done.wait) for _ in range(options.IO_WORKERS)]
+    try:
+        link = await asyncio.wait_for(uploader.upload(file(tmp_path, "d.mp3", 1024)), 5)
+        assert link == "http://localhost/d.mp3"
+        assert uploader.metrics.retries == 1
+    finally:
+        done.set()
+        await asyncio.gather(*blocked)
+        uploader.close()
+
+
+async def test_upload_to_transferfilesh(tmp_path, server, url):
+    options.__init__(tmp_path)
+    options.UPLOAD_URL = url
+    try:
+        link = await upload_to_transferfilesh(file(tmp_path, "c.mp3", 1024))
+        assert link == "http://localhost/c.mp3"
+    finally:
+        options.uploader.close()
+        options.__init__()